@@ -0,0 +1,94 @@
+"""
+Compare the sequential query path with the parallel query path of the aggregation Lambda.
+Items of other requests share the table, as they would in production; neither path reads them.
+moto evaluates queries in-process, so the simulated latency is the only part the concurrent
+ranges can overlap; locally, extra segments mostly add query overhead.
+
+Usage:
+    python -m benchmarks.aggregation_read --items 100000 --noise-items 100000 --segments 8 --latency-ms 20
+"""
+import argparse
+import os
+import time
+
+import boto3
+from moto import mock_aws
+
+TABLE_NAME = "EnrichedDataBenchmark"
+REQUEST_ID = "benchmark-request"
+
+
+def seed_table(items, noise_items):
+    """
+    Create a table holding one large request plus items of other requests.
+    """
+    dynamodb = boto3.resource("dynamodb")
+    table = dynamodb.create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[
+            {"AttributeName": "request_id", "KeyType": "HASH"},
+            {"AttributeName": "record_key", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "request_id", "AttributeType": "S"},
+            {"AttributeName": "record_key", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    with table.batch_writer() as writer:
+        for i in range(items):
+            writer.put_item(
+                Item={
+                    "request_id": REQUEST_ID,
+                    "record_key": f"{i // 100:06d}#{i % 100:05d}",
+                    "first_name": "John",
+                    "last_name": "Doe",
+                    "company_domain": "example.com",
+                    "professional_email": "john.doe@example.com",
+                }
+            )
+        for i in range(noise_items):
+            writer.put_item(Item={"request_id": f"other-{i % 10}", "record_key": f"{i:08d}"})
+
+
+def run(mode, app, batches):
+    started = time.perf_counter()
+    keys = [item["record_key"] for item in app.fetch_data_from_dynamodb(REQUEST_ID, mode=mode, batches=batches)]
+    elapsed = time.perf_counter() - started
+    print(f"{mode:>14}: {len(keys)} items in {elapsed:.2f}s ({len(keys) / elapsed:,.0f} items/s)")
+    return keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100_000, help="Items in the benchmarked request")
+    parser.add_argument("--noise-items", type=int, default=100_000, help="Items belonging to other requests")
+    parser.add_argument("--segments", type=int, default=8, help="Batch ranges queried concurrently")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Simulated round-trip latency per call")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ["DYNAMO_TABLE_NAME"] = TABLE_NAME
+    os.environ["AGGREGATION_READ_SEGMENTS"] = str(args.segments)
+
+    with mock_aws():
+        print(f"Seeding {args.items} items...")
+        seed_table(args.items, args.noise_items)
+
+        from lambdas.aggregate_results import app
+
+        # moto answers in-process, so add the network round trip a real table would have
+        def add_latency(**kwargs):
+            time.sleep(args.latency_ms / 1000)
+
+        app.dynamodb.meta.client.meta.events.register("before-call.dynamodb", add_latency)
+
+        batches = (args.items + 99) // 100
+        sequential = run("sequential", app, batches)
+        parallel = run("parallel_query", app, batches)
+        assert len(sequential) == args.items
+        assert parallel == sequential
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Simulation of the total wall-clock time of a request under different batch
+sizing policies. No AWS calls are made: batches are produced by the real
+BatchSplitter and their processing is simulated on a pool of workers with a
+fixed per-batch overhead, a per-record latency, the worker timeout and the SQS
+visibility timeout. A batch that runs past the worker timeout is redelivered
+after the visibility timeout and lands in the DLQ after --max-receives attempts.
+
+Usage:
+    python -m benchmarks.batch_sizing --records 20000 --latency-ms 120 --workers 50
+"""
+import argparse
+import heapq
+import json
+import random
+
+from lambdas.split_batches.batch_sizing_policy import BatchSizingPolicy
+from lambdas.split_batches.batch_splitter import BatchSplitter
+from lambdas.split_batches.sqs_queue.sqs_queue import CLAIM_CHECK_THRESHOLD
+
+
+def make_contacts(count, rng):
+    contacts = []
+    for i in range(count):
+        contact = {"first_name": f"First{i}", "last_name": "Doe", "company_domain": f"company{i % 50}.com"}
+        # A minority of contacts carry large free-text fields
+        if rng.random() < 0.2:
+            contact["notes"] = "x" * rng.randint(5000, 20000)
+        contacts.append(contact)
+    return contacts
+
+
+def simulate(batches, args, rng):
+    """
+    Returns:
+        dict: Wall-clock seconds, records sent to the DLQ, redeliveries and claim checks.
+    """
+    latency = args.latency_ms / 1000
+    overhead = args.overhead_ms / 1000
+    # (time the batch becomes visible, sequence, records, attempt)
+    queue = [(0.0, position, len(batch), 1) for position, batch in enumerate(batches)]
+    heapq.heapify(queue)
+    workers = [0.0] * args.workers
+    finished, lost, redeliveries = 0.0, 0, 0
+    sequence = len(batches)
+    while queue:
+        visible_at, _, records, attempt = heapq.heappop(queue)
+        start = max(heapq.heappop(workers), visible_at)
+        duration = overhead + sum(latency * rng.uniform(0.5, 1.5) for _ in range(records))
+        if duration <= args.worker_timeout:
+            heapq.heappush(workers, start + duration)
+            finished = max(finished, start + duration)
+            continue
+        heapq.heappush(workers, start + args.worker_timeout)
+        if attempt >= args.max_receives:
+            lost += records
+            finished = max(finished, start + args.worker_timeout)
+        else:
+            redeliveries += 1
+            heapq.heappush(queue, (start + args.visibility_timeout, sequence, records, attempt + 1))
+            sequence += 1
+    claim_checks = sum(len(json.dumps(batch)) > CLAIM_CHECK_THRESHOLD for batch in batches)
+    return {"seconds": finished, "lost": lost, "redeliveries": redeliveries, "claim_checks": claim_checks}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=20000, help="Contacts in the request")
+    parser.add_argument("--latency-ms", type=float, default=120, help="Mean enrichment latency per contact")
+    parser.add_argument("--overhead-ms", type=float, default=150, help="Fixed cost per batch (receive, writes, progress)")
+    parser.add_argument("--workers", type=int, default=50, help="Concurrent worker invocations")
+    parser.add_argument("--worker-timeout", type=float, default=10, help="Worker Lambda timeout in seconds")
+    parser.add_argument("--visibility-timeout", type=float, default=30, help="SQS visibility timeout in seconds")
+    parser.add_argument("--max-receives", type=int, default=3, help="Deliveries before a batch goes to the DLQ")
+    parser.add_argument("--time-budget", type=float, default=5, help="BATCH_TIME_BUDGET_SECONDS of the adaptive policy")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    contacts = make_contacts(args.records, random.Random(args.seed))
+    splitters = {
+        "fixed 100": BatchSplitter(batch_size=100),
+        "fixed 25": BatchSplitter(batch_size=25),
+        "bytes only": BatchSplitter(policy=BatchSizingPolicy(max_records=100)),
+        "bytes+latency": BatchSplitter(
+            policy=BatchSizingPolicy(
+                max_records=100, time_budget_seconds=args.time_budget, seconds_per_record=args.latency_ms / 1000
+            )
+        ),
+    }
+
+    print(f"{'policy':<14} {'batches':>8} {'wall clock':>11} {'redelivered':>12} {'lost':>7} {'claim checks':>13}")
+    for name, splitter in splitters.items():
+        batches = list(splitter.split(contacts))
+        result = simulate(batches, args, random.Random(args.seed))
+        print(
+            f"{name:<14} {len(batches):>8} {result['seconds']:>10.1f}s {result['redeliveries']:>12}"
+            f" {result['lost']:>7} {result['claim_checks']:>13}"
+        )
+
+
+if __name__ == "__main__":
+    main()
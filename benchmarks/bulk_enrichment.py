@@ -0,0 +1,43 @@
+"""
+Micro-benchmark of the default provider: per-record enrich_record against the
+enrich_records bulk path, on the bare provider and on the provider the worker
+uses, behind its guard and latency timer. Exits with an error if the bulk path
+is slower, since BatchProcessor prefers it.
+
+Usage:
+    python -m benchmarks.bulk_enrichment --records 100 --repeat 2000
+"""
+import argparse
+import sys
+import timeit
+
+from lambdas.worker.data_provider import DataProvider
+from lambdas.worker.provider_factory import ProviderFactory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=100, help="Records per batch")
+    parser.add_argument("--repeat", type=int, default=2000, help="Batches enriched per measurement")
+    args = parser.parse_args()
+
+    batch = [
+        {"first_name": f"First{i}", "last_name": f"Last{i}", "company_domain": "example.com"}
+        for i in range(args.records)
+    ]
+    per_record = 1e9 / (args.records * args.repeat)
+    slower = []
+    for name, provider in (("provider", DataProvider()), ("worker", ProviderFactory().get_provider("default"))):
+        assert provider.enrich_records(batch) == [provider.enrich_record(record) for record in batch]
+        single = min(timeit.repeat(lambda: [provider.enrich_record(record) for record in batch], number=args.repeat, repeat=5))
+        bulk = min(timeit.repeat(lambda: provider.enrich_records(batch), number=args.repeat, repeat=5))
+        print(f"{name:>8} enrich_record : {single * per_record:,.0f} ns/record")
+        print(f"{name:>8} enrich_records: {bulk * per_record:,.0f} ns/record ({single / bulk:.2f}x)")
+        if bulk > single:
+            slower.append(name)
+    if slower:
+        sys.exit(f"The bulk path is slower than the per-record path for: {', '.join(slower)}")
+
+
+if __name__ == "__main__":
+    main()
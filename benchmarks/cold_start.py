@@ -0,0 +1,139 @@
+"""
+Cold start of every Lambda: the time to import its handler module in a fresh
+interpreter, and the latency of its first and of its next (warm) invocations against moto.
+Each measurement runs in its own subprocess so nothing is cached between runs.
+
+Import times are taken in an interpreter that has not imported boto3 yet, as
+on Lambda. Invocations run after moto is imported, so they show the cost of
+building clients and loading service models on first use, not of importing
+botocore.
+
+Usage:
+    python -m benchmarks.cold_start --runs 5
+"""
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+LAMBDAS = ("split_batches", "worker", "check_completion", "aggregate_results")
+REQUEST_ID = "benchmark-request"
+# Warm invocations after the first one, reported as their median
+WARM_CALLS = 5
+CONTACTS = [
+    {"first_name": f"First{i}", "last_name": "Doe", "company_domain": "example.com"} for i in range(20)
+]
+
+
+def measure_import(name):
+    started = time.perf_counter()
+    importlib.import_module(f"lambdas.{name}.app")
+    return {"import": time.perf_counter() - started}
+
+
+def create_table(dynamodb, table_name, sort_key=None):
+    key_schema = [{"AttributeName": "request_id", "KeyType": "HASH"}]
+    attributes = [{"AttributeName": "request_id", "AttributeType": "S"}]
+    if sort_key:
+        key_schema.append({"AttributeName": sort_key, "KeyType": "RANGE"})
+        attributes.append({"AttributeName": sort_key, "AttributeType": "S"})
+    return dynamodb.create_table(
+        TableName=table_name, KeySchema=key_schema, AttributeDefinitions=attributes, BillingMode="PAY_PER_REQUEST"
+    )
+
+
+def setup(name):
+    """
+    Create the resources a Lambda reads and return the event it is invoked with.
+    """
+    import boto3
+
+    dynamodb = boto3.resource("dynamodb")
+    control_table = create_table(dynamodb, "ControlTable")
+    control_table.put_item(Item={"request_id": REQUEST_ID, "expected_batches": 1000, "processed_batches": 0})
+    records_table = create_table(dynamodb, "EnrichedData", sort_key="record_key")
+    records_table.put_item(Item={"request_id": REQUEST_ID, "record_key": "000000#00000", **CONTACTS[0]})
+    boto3.client("s3").create_bucket(Bucket="benchmark-output")
+    os.environ["S3_BUCKET_NAME"] = "benchmark-output"
+    os.environ["CONTROL_TABLE_NAME"] = "ControlTable"
+
+    if name == "split_batches":
+        os.environ["SQS_QUEUE_URL"] = boto3.client("sqs").create_queue(QueueName="benchmark")["QueueUrl"]
+        os.environ["DYNAMO_TABLE_NAME"] = "ControlTable"
+        return lambda: {"body": json.dumps({"contacts": CONTACTS})}
+    os.environ["DYNAMO_TABLE_NAME"] = "EnrichedData"
+    if name == "worker":
+        messages = iter(range(1_000_000))
+
+        def worker_event():
+            batch_id = next(messages)
+            body = {"request_id": REQUEST_ID, "batch_id": batch_id, "batch": CONTACTS}
+            return {"Records": [{"messageId": str(batch_id), "body": json.dumps(body)}]}
+
+        return worker_event
+    return lambda: {"request_id": REQUEST_ID}
+
+
+def measure_invocations(name):
+    from moto import mock_aws
+
+    with mock_aws():
+        event = setup(name)
+        started = time.perf_counter()
+        app = importlib.import_module(f"lambdas.{name}.app")
+        timings = {"import (warm botocore)": time.perf_counter() - started}
+        calls = []
+        for _ in range(WARM_CALLS + 1):
+            started = time.perf_counter()
+            app.lambda_handler(event(), None)
+            calls.append(time.perf_counter() - started)
+    timings["first call"] = calls[0]
+    timings["warm call"] = statistics.median(calls[1:])
+    return timings
+
+
+def run_child(name, mode):
+    env = {**os.environ, "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1")}
+    env.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    env.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    env.setdefault("DYNAMO_TABLE_NAME", "EnrichedData")
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.cold_start", "--child", name, mode],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per Lambda and measurement")
+    parser.add_argument("--lambdas", nargs="+", default=list(LAMBDAS), choices=LAMBDAS, help="Lambdas to measure")
+    parser.add_argument("--child", nargs=2, metavar=("LAMBDA", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        name, mode = args.child
+        timings = measure_import(name) if mode == "import" else measure_invocations(name)
+        print(json.dumps(timings))
+        return
+
+    columns = ("import", "import (warm botocore)", "first call", "warm call")
+    print(f"{'lambda':>18} " + " ".join(f"{column:>22}" for column in columns) + "   (median ms)")
+    for name in args.lambdas:
+        samples = {column: [] for column in columns}
+        for _ in range(args.runs):
+            for mode in ("import", "invoke"):
+                for column, seconds in run_child(name, mode).items():
+                    samples[column].append(seconds * 1000)
+        print(f"{name:>18} " + " ".join(f"{statistics.median(samples[column]):>22.1f}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compare sequential and concurrent enrichment in BatchProcessor with a stub provider
+that sleeps to simulate an external API call.
+
+Usage:
+    python -m benchmarks.enrichment_concurrency --records 100 --latency-ms 50 --concurrency 1 8 32
+"""
+import argparse
+import random
+import time
+
+from lambdas.worker.batch_processor import BatchProcessor
+from lambdas.worker.data_provider import DataProvider
+from lambdas.worker.provider_factory import ProviderFactory
+
+
+class LatencyProvider:
+    """
+    Per-record default provider with injected latency per call.
+    """
+
+    def __init__(self, latency_ms, jitter_ms):
+        self.provider = DataProvider()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+
+    def enrich_record(self, record):
+        time.sleep(max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000)
+        return self.provider.enrich_record(record)
+
+
+class StubFactory(ProviderFactory):
+    def __init__(self, provider):
+        self.providers = {"default": provider}
+
+
+
+class DiscardingClient:
+    def save_records(self, records):
+        return {"succeeded": list(range(len(records))), "failed": []}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=100, help="Records per batch")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mean provider latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Standard deviation of the provider latency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Concurrency levels to run")
+    args = parser.parse_args()
+
+    batch = [
+        {"first_name": f"First{i}", "last_name": f"Last{i}", "company_domain": "example.com"}
+        for i in range(args.records)
+    ]
+    factory = StubFactory(LatencyProvider(args.latency_ms, args.jitter_ms))
+    baseline = None
+    for concurrency in args.concurrency:
+        processor = BatchProcessor(DiscardingClient(), factory, max_concurrency=concurrency)
+        started = time.perf_counter()
+        report = processor.process_batch(batch)
+        elapsed = time.perf_counter() - started
+        assert not report["failed"]
+        baseline = baseline or elapsed
+        print(f"concurrency={concurrency:>3}: {elapsed:.2f}s ({args.records / elapsed:,.0f} records/s, {baseline / elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
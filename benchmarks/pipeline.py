@@ -0,0 +1,393 @@
+"""
+End-to-end run of the pipeline in one process against moto:
+split_batches -> SQS -> worker -> control table -> check_completion -> aggregate_results.
+
+Every Lambda handler is called the way AWS would call it. SQS is drained in
+receives of up to 10 messages per worker invocation, as the event source
+mapping does. For each stage the run reports wall-clock time, throughput, the
+memory high-water mark and the AWS calls made, by service and operation.
+moto stores everything in this process, so memory includes the emulated
+tables and queues.
+
+A run can be saved as a baseline and later runs compared with it. Call counts
+must match exactly; times may be slower by at most the tolerance (or the
+slack, for short stages).
+
+Usage:
+    python -m benchmarks.pipeline --records 10000 --save-baseline benchmarks/baselines/pipeline.json
+    python -m benchmarks.pipeline --records 10000 --compare benchmarks/baselines/pipeline.json
+    python -m benchmarks.pipeline --records 1000000 --input s3 --latency-ms 0
+    python -m benchmarks.pipeline --records 5000 --provider bulk --latency-ms 40 --concurrency 8
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+import boto3
+import botocore.client
+from moto import mock_aws
+from moto.dynamodb.models import DynamoDBBackend
+
+from benchmarks.enrichment_concurrency import LatencyProvider
+from lambdas.worker.data_provider import DataProvider
+
+BUCKET_NAME = "pipeline-benchmark"
+CONTROL_TABLE_NAME = "ControlTable"
+RECORDS_TABLE_NAME = "EnrichedData"
+
+
+class BulkLatencyProvider(DataProvider):
+    """
+    Bulk provider paying a fixed latency per call plus a small one per record.
+    """
+
+    def __init__(self, latency_ms, jitter_ms, per_record_ms=0.5):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.per_record_ms = per_record_ms
+
+    def enrich_records(self, records):
+        latency = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) + self.per_record_ms * len(records)
+        time.sleep(latency / 1000)
+        return super().enrich_records(records)
+
+
+def build_provider(spec, latency_ms, jitter_ms):
+    """
+    Provider the worker enriches with: "latency" (one call per record), "bulk"
+    (one call per batch) or "module:Class", constructed without arguments.
+    """
+    if spec == "latency":
+        return LatencyProvider(latency_ms, jitter_ms)
+    if spec == "bulk":
+        return BulkLatencyProvider(latency_ms, jitter_ms)
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class CallCounter:
+    """
+    Counts the AWS calls of every client, attributed to the running stage.
+    """
+
+    def __init__(self):
+        self.stage = "setup"
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.original = botocore.client.BaseClient._make_api_call
+
+    def __enter__(self):
+        counter = self
+
+        def counting_call(client, operation_name, params):
+            with counter.lock:
+                calls = counter.calls.setdefault(counter.stage, Counter())
+                calls[f"{client.meta.service_model.service_name}.{operation_name}"] += 1
+            return counter.original(client, operation_name, params)
+
+        botocore.client.BaseClient._make_api_call = counting_call
+        return self
+
+    def __exit__(self, *exc_info):
+        botocore.client.BaseClient._make_api_call = self.original
+
+
+@contextlib.contextmanager
+def scoped_transaction_snapshots():
+    """
+    moto copies every table before a TransactWriteItems call to roll it back on
+    failure, which makes each worker commit slower as the records table grows.
+    Only copy the tables the transaction writes to.
+    """
+    original = DynamoDBBackend.transact_write_items
+
+    def transact_write_items(backend, transact_items):
+        names = {operation["TableName"] for item in transact_items for operation in item.values()}
+        all_tables = backend.tables
+        backend.tables = {name: table for name, table in all_tables.items() if name in names}
+        try:
+            return original(backend, transact_items)
+        finally:
+            # A rollback replaces the tables with their copies
+            all_tables.update(backend.tables)
+            backend.tables = all_tables
+
+    DynamoDBBackend.transact_write_items = transact_write_items
+    try:
+        yield
+    finally:
+        DynamoDBBackend.transact_write_items = original
+
+
+class StageRunner:
+    """
+    Runs the stages one after the other and records their measurements.
+    """
+
+    def __init__(self, counter, trace_memory, verbose):
+        self.counter = counter
+        self.trace_memory = trace_memory
+        self.verbose = verbose
+        self.results = {}
+
+    @contextlib.contextmanager
+    def stage(self, name, records):
+        self.counter.stage = name
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        output = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        started = time.perf_counter()
+        with output:
+            yield
+        elapsed = time.perf_counter() - started
+        result = {
+            "seconds": round(elapsed, 3),
+            "records_per_second": round(records / elapsed, 1) if elapsed else None,
+            # Process high-water mark, which only grows from one stage to the next
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "aws_calls": dict(sorted(self.counter.calls.get(name, {}).items())),
+        }
+        if self.trace_memory:
+            result["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        self.results[name] = result
+        self.counter.stage = "harness"
+
+
+def make_contacts(count, seed):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield {
+            "first_name": f"First{i}",
+            "last_name": rng.choice(("Doe", "Smith", "Garcia", "Nguyen", "Khan")),
+            "company_domain": f"company{rng.randrange(1000)}.com",
+        }
+
+
+def create_resources():
+    dynamodb = boto3.client("dynamodb")
+    dynamodb.create_table(
+        TableName=CONTROL_TABLE_NAME,
+        KeySchema=[{"AttributeName": "request_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "request_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    dynamodb.create_table(
+        TableName=RECORDS_TABLE_NAME,
+        KeySchema=[
+            {"AttributeName": "request_id", "KeyType": "HASH"},
+            {"AttributeName": "record_key", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "request_id", "AttributeType": "S"},
+            {"AttributeName": "record_key", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    boto3.client("s3").create_bucket(Bucket=BUCKET_NAME)
+    sqs = boto3.client("sqs")
+    failed_queue_url = sqs.create_queue(QueueName="pipeline-benchmark-failed")["QueueUrl"]
+    queue_url = sqs.create_queue(QueueName="pipeline-benchmark", Attributes={"VisibilityTimeout": "900"})["QueueUrl"]
+    return queue_url, failed_queue_url
+
+
+def request_event(args):
+    """
+    The split_batches event: inline contacts, or an NDJSON file staged in S3.
+    """
+    contacts = make_contacts(args.records, args.seed)
+    if args.input == "inline":
+        return {"body": json.dumps({"contacts": list(contacts)})}
+    body = "".join(json.dumps(contact) + "\n" for contact in contacts).encode("utf-8")
+    boto3.client("s3").put_object(Bucket=BUCKET_NAME, Key="staged/contacts.ndjson", Body=body)
+    return {"body": json.dumps({"source": {"bucket": BUCKET_NAME, "key": "staged/contacts.ndjson", "format": "ndjson"}})}
+
+
+def drain_queue(worker, queue_url):
+    """
+    Deliver the queued batches to the worker, 10 messages per invocation.
+    Returns:
+        int: Messages the worker reported as failed.
+    """
+    sqs = boto3.client("sqs")
+    failed = 0
+    while True:
+        messages = sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10).get("Messages", [])
+        if not messages:
+            return failed
+        event = {
+            "Records": [
+                {"messageId": message["MessageId"], "receiptHandle": message["ReceiptHandle"], "body": message["Body"]}
+                for message in messages
+            ]
+        }
+        failures = {failure["itemIdentifier"] for failure in worker.lambda_handler(event, None)["batchItemFailures"]}
+        failed += len(failures)
+        done = [message for message in messages if message["MessageId"] not in failures]
+        if done:
+            sqs.delete_message_batch(
+                QueueUrl=queue_url,
+                Entries=[{"Id": str(position), "ReceiptHandle": message["ReceiptHandle"]} for position, message in enumerate(done)],
+            )
+
+
+def run(args):
+    queue_url, failed_queue_url = create_resources()
+    os.environ.update(
+        {
+            "SQS_QUEUE_URL": queue_url,
+            "FAILED_RECORDS_QUEUE_URL": failed_queue_url,
+            "CONTROL_TABLE_NAME": CONTROL_TABLE_NAME,
+            "S3_BUCKET_NAME": BUCKET_NAME,
+            "MAX_BATCH_SIZE": str(args.max_batch_size),
+            "ENRICHMENT_CONCURRENCY": str(args.concurrency),
+            "DYNAMO_WRITE_WORKERS": str(args.write_workers),
+            "OUTPUT_FORMAT": args.output_format,
+            "WRITE_RESULT_PARTS": "true" if args.aggregation_mode == "parts" else "false",
+            "AGGREGATION_MODE": args.aggregation_mode,
+            "METRICS_ENABLED": "false",
+            # The worker and aggregation Lambdas read their records table at import
+            "DYNAMO_TABLE_NAME": RECORDS_TABLE_NAME,
+        }
+    )
+    from lambdas.aggregate_results import app as aggregate_results
+    from lambdas.check_completion import app as check_completion
+    from lambdas.split_batches import app as split_batches
+    from lambdas.worker import app as worker
+
+    worker.provider_factory.sources["default"] = build_provider(args.provider, args.latency_ms, args.jitter_ms)
+    worker.provider_factory.providers.clear()
+
+    event = request_event(args)
+    if args.trace_memory:
+        tracemalloc.start()
+    with CallCounter() as counter:
+        runner = StageRunner(counter, args.trace_memory, args.verbose)
+
+        # split_batches reads the control table from DYNAMO_TABLE_NAME at call time
+        os.environ["DYNAMO_TABLE_NAME"] = CONTROL_TABLE_NAME
+        with runner.stage("split_batches", args.records):
+            response = split_batches.lambda_handler(event, None)
+        os.environ["DYNAMO_TABLE_NAME"] = RECORDS_TABLE_NAME
+        if response["statusCode"] != 200:
+            raise RuntimeError(f"split_batches failed: {response['body']}")
+        request_id = json.loads(response["body"])["request_id"]
+
+        with runner.stage("worker", args.records):
+            failed_messages = drain_queue(worker, queue_url)
+        if failed_messages:
+            raise RuntimeError(f"The worker failed {failed_messages} messages")
+
+        with runner.stage("check_completion", args.records):
+            response = check_completion.lambda_handler({"request_id": request_id}, None)
+        if json.loads(response["body"]).get("status") != "completed":
+            raise RuntimeError(f"Request not complete after the worker stage: {response['body']}")
+
+        with runner.stage("aggregate_results", args.records):
+            response = aggregate_results.lambda_handler({"request_id": request_id}, None)
+        if response["statusCode"] != 200:
+            raise RuntimeError(f"aggregate_results failed: {response['body']}")
+
+    total = sum(result["seconds"] for result in runner.results.values())
+    runner.results["total"] = {"seconds": round(total, 3), "records_per_second": round(args.records / total, 1)}
+    return runner.results
+
+
+def report(results):
+    print(f"{'stage':>18} {'seconds':>9} {'records/s':>11} {'max rss MB':>11} {'traced MB':>10}  aws calls")
+    for name, result in results.items():
+        calls = result.get("aws_calls", {})
+        print(
+            f"{name:>18} {result['seconds']:>9.3f} {result['records_per_second'] or 0:>11,.0f} "
+            f"{result.get('max_rss_mb', ''):>11} {result.get('peak_traced_mb', ''):>10}  "
+            + ", ".join(f"{operation}={count}" for operation, count in calls.items())
+        )
+
+
+def compare(results, config, baseline, tolerance, slack_seconds):
+    """
+    Returns:
+        list: Descriptions of the regressions against the baseline.
+    """
+    if baseline["config"] != config:
+        print(f"Warning: the baseline was recorded with a different configuration: {baseline['config']}")
+    regressions = []
+    for name, expected in baseline["results"].items():
+        actual = results.get(name)
+        if actual is None:
+            regressions.append(f"{name}: stage missing")
+            continue
+        # Short stages need an absolute margin too, or scheduling noise flags them
+        if actual["seconds"] > max(expected["seconds"] * (1 + tolerance), expected["seconds"] + slack_seconds):
+            regressions.append(f"{name}: {actual['seconds']:.3f}s against {expected['seconds']:.3f}s")
+        if "aws_calls" in expected and actual["aws_calls"] != expected["aws_calls"]:
+            regressions.append(f"{name}: AWS calls {actual['aws_calls']} against {expected['aws_calls']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=10_000, help="Synthetic contacts in the request (1k to 1M)")
+    parser.add_argument("--input", choices=("inline", "s3"), default="inline", help="Contacts in the request body or staged in S3")
+    parser.add_argument("--provider", default="latency", help='"latency", "bulk" or "module:Class" of a provider')
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mean provider latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Standard deviation of the provider latency")
+    parser.add_argument("--concurrency", type=int, default=1, help="ENRICHMENT_CONCURRENCY of the worker")
+    parser.add_argument("--write-workers", type=int, default=1, help="DYNAMO_WRITE_WORKERS of the worker")
+    parser.add_argument("--max-batch-size", type=int, default=100, help="MAX_BATCH_SIZE of split_batches")
+    parser.add_argument("--output-format", default="json", help="OUTPUT_FORMAT of aggregate_results")
+    parser.add_argument(
+        "--aggregation-mode", choices=("full", "parts"), default="full",
+        help="Read every record back, or have the worker write result parts that are stitched",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic contacts")
+    parser.add_argument("--trace-memory", action="store_true", help="Also report the traced Python heap peak (slower)")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the Lambdas")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write the results as a baseline JSON file")
+    parser.add_argument("--compare", metavar="PATH", help="Compare with a baseline and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown against the baseline")
+    parser.add_argument("--slack-ms", type=float, default=50.0, help="Allowed absolute slowdown of a stage")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    config = {
+        name: getattr(args, name)
+        for name in (
+            "records", "input", "provider", "latency_ms", "jitter_ms", "concurrency",
+            "write_workers", "max_batch_size", "output_format", "aggregation_mode", "seed",
+        )
+    }
+
+    with mock_aws(), scoped_transaction_snapshots():
+        results = run(args)
+    report(results)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.save_baseline) or ".", exist_ok=True)
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump({"config": config, "results": results}, baseline_file, indent=2)
+            baseline_file.write("\n")
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, config, json.load(baseline_file), args.tolerance, args.slack_ms / 1000)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regression against the baseline")
+
+
+if __name__ == "__main__":
+    main()
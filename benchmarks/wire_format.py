@@ -0,0 +1,80 @@
+"""
+Micro-benchmark of the SQS batch message encodings: plain JSON against the
+compact column header plus rows format, uncompressed, zlib and (when the
+zstandard package is installed) zstd.
+
+Usage:
+    python -m benchmarks.wire_format --records 100 --repeat 500
+"""
+import argparse
+import json
+import timeit
+
+from lambdas.common.wire_format import encode_batch, unpack_message
+from lambdas.common.wire_format import wire_format
+
+
+def encode_json(batch):
+    return json.dumps({"request_id": "uuid-12345", "batch_id": 1, "batch": batch})
+
+
+def decode_json(body):
+    return json.loads(body)["batch"]
+
+
+def compact_codec(compression):
+    def encode(batch):
+        return json.dumps(
+            {"request_id": "uuid-12345", "batch_id": 1, "packed": encode_batch(batch, compression)},
+            separators=(",", ":"),
+        )
+
+    def decode(body):
+        return unpack_message(json.loads(body))["batch"]
+
+    return encode, decode
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=100, help="Contacts per batch")
+    parser.add_argument("--repeat", type=int, default=500, help="Batches encoded per measurement")
+    args = parser.parse_args()
+
+    batch = [
+        {
+            "id": f"contact-{i:06d}",
+            "first_name": f"First{i}",
+            "last_name": f"Last{i % 97}",
+            "company_domain": f"company{i % 13}.com",
+            "title": "Head of Engineering" if i % 3 else "Account Executive",
+            "country": "US",
+        }
+        for i in range(args.records)
+    ]
+
+    codecs = {"json": (encode_json, decode_json)}
+    for compression in ("none", "zlib", "zstd"):
+        if compression == "zstd" and wire_format.zstandard is None:
+            print("zstd: skipped, the zstandard package is not installed")
+            continue
+        codecs[f"compact+{compression}"] = compact_codec(compression)
+
+    baseline_bytes = None
+    for name, (encode, decode) in codecs.items():
+        body = encode(batch)
+        assert decode(body) == batch
+        size = len(body.encode("utf-8"))
+        baseline_bytes = baseline_bytes or size
+        encode_time = min(timeit.repeat(lambda: encode(batch), number=args.repeat, repeat=5))
+        decode_time = min(timeit.repeat(lambda: decode(body), number=args.repeat, repeat=5))
+        per_record = 1e9 / (args.records * args.repeat)
+        print(
+            f"{name:<14} {size / args.records:7.1f} bytes/record ({size / baseline_bytes:5.1%})"
+            f"  encode {encode_time * per_record:7,.0f} ns/record"
+            f"  decode {decode_time * per_record:7,.0f} ns/record"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@
 # Define paths
 LAMBDA_SRC="./lambdas"
 DEPLOYMENT_DIR="$LAMBDA_SRC/deployment"
+COMMON_DIR="$LAMBDA_SRC/common"
 
 # Ensure the deployment directory exists
 mkdir -p "$DEPLOYMENT_DIR"
@@ -32,9 +33,9 @@ package_lambda() {
     pip install -r "$source_dir/requirements.txt" -t "$source_dir" > /dev/null
   fi
 
-  # Create the ZIP file and exclude __pycache__
+  # Create the ZIP file with the shared modules and exclude __pycache__
   echo "Creating ZIP file for $lambda_name..."
-  zip -r "$zip_file" "$source_dir" -x "*/__pycache__/*" "*.pyc" "*.pyo" > /dev/null
+  zip -r "$zip_file" "$source_dir" "$COMMON_DIR" "$LAMBDA_SRC/__init__.py" -x "*/__pycache__/*" "*/tests/*" "*.pyc" "*.pyo" > /dev/null
 
   echo "Lambda $lambda_name packaged successfully: $zip_file"
 }
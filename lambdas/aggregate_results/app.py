@@ -1,50 +1,302 @@
 import os
-import boto3
 import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from botocore.exceptions import ClientError
 
-# Initialize AWS resources
-dynamodb = boto3.resource("dynamodb")
-s3_client = boto3.client("s3")
+from ..common.aws_clients import lazy_client, lazy_resource
+from ..common.dedupe_index import index_key, decode_index, expand_records
+from ..common.metrics import StreamTimer, metrics_from_environment
+from ..common.output_formats import (
+    CONCATENABLE_FORMATS,
+    CONTENT_TYPES,
+    DEFAULT_OUTPUT_FORMAT,
+    FILE_EXTENSIONS,
+    STITCHABLE_FORMATS,
+    serialize_records,
+)
+from ..common.record_store import RecordStore
+from ..common.result_parts import part_batch_id, parts_prefix, segment_batches, segments_prefix
+from .parallel_reader import ParallelQueryReader
+from .result_writer import MIN_PART_SIZE, MultipartWriter
+
+# Initialize AWS resources, created on first use and kept for warm invocations
+dynamodb = lazy_resource("dynamodb")
+s3_client = lazy_client("s3")
+metrics = metrics_from_environment("aggregate_results")
 
 # Environment variables
 table_name = os.environ.get("DYNAMO_TABLE_NAME", "EnrichedData")
 bucket_name = os.environ.get("S3_BUCKET_NAME", "data-enrichment-aggregated-output")
+read_mode = os.environ.get("AGGREGATION_READ_MODE", "sequential")
+read_segments = int(os.environ.get("AGGREGATION_READ_SEGMENTS", "4"))
+record_shards = int(os.environ.get("RECORD_SHARDS", "1"))
+output_format = os.environ.get("OUTPUT_FORMAT", DEFAULT_OUTPUT_FORMAT)
+row_group_size = int(os.environ.get("PARQUET_ROW_GROUP_SIZE", "10000"))
+# Holds the output format each request asked for, if any
+control_table_name = os.environ.get("CONTROL_TABLE_NAME")
+part_size = int(os.environ.get("UPLOAD_PART_SIZE_MB", "8")) * 1024 * 1024
+# "parts" assembles the output from the result parts written by the workers
+aggregation_mode = os.environ.get("AGGREGATION_MODE", "full")
+# Result parts downloaded concurrently while stitching
+stitch_read_workers = int(os.environ.get("STITCH_READ_WORKERS", "8"))
+# Presigned URLs of the output stay valid this long
+url_expiry_seconds = 3600
 
 
-def fetch_data_from_dynamodb(request_id):
+def fetch_data_from_dynamodb(request_id, mode=None, batches=None):
     """
     Fetch all processed items for a given request_id from DynamoDB.
+    Pages through the query results so requests larger than 1 MB are not truncated.
+    Args:
+        request_id (str): The request to fetch.
+        mode (str): "sequential" to query the request's partitions one page at a
+            time, or "parallel_query" to query batch ranges of every partition
+            concurrently. Both return the items in batch and position order.
+            Defaults to AGGREGATION_READ_MODE.
+        batches (int): Number of batches of the request, which parallel_query
+            splits into ranges; without it, partitions are queried whole.
+    Yields:
+        dict: One item at a time.
     """
-    table = dynamodb.Table(table_name)
+    store = RecordStore(dynamodb.Table(table_name), shards=record_shards)
+    mode = mode or read_mode
+    if mode == "parallel_query":
+        yield from ParallelQueryReader(store, segments=read_segments).read(request_id, batches)
+        return
+    if mode != "sequential":
+        raise ValueError(f"Unsupported aggregation read mode '{mode}'")
+
     try:
-        # Query DynamoDB for items with the specified request_id
-        response = table.query(
-            KeyConditionExpression=boto3.dynamodb.conditions.Key("request_id").eq(request_id)
-        )
-        return response.get("Items", [])
+        yield from store.read(request_id)
     except ClientError as e:
         print(f"Error fetching data from DynamoDB: {e}")
         raise
 
 
-def upload_to_s3(file_content, file_name):
+def load_dedupe_index(request_id):
     """
-    Upload the aggregated file to S3.
+    Load the dedupe index written by split_batches, if the request had duplicate contacts.
+    Returns:
+        array: Unique id of every original contact, or None if the request was not deduplicated.
     """
     try:
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=file_name,
-            Body=file_content,
-            ContentType="application/json",
-        )
-        # Generate pre-signed URL for the uploaded file
-        return s3_client.generate_presigned_url(
-            "get_object", Params={"Bucket": bucket_name, "Key": file_name}, ExpiresIn=3600
-        )
+        response = s3_client.get_object(Bucket=bucket_name, Key=index_key(request_id))
     except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        print(f"Error loading dedupe index: {e}")
+        raise
+    return decode_index(response["Body"].read())
+
+
+def load_control_item(request_id):
+    """
+    Read the attributes of the request's control item used by the aggregation.
+    Returns:
+        dict: "output_format" and "expected_batches" when set, or an empty dict
+            without a control table.
+    """
+    if not control_table_name:
+        return {}
+    response = dynamodb.Table(control_table_name).get_item(
+        Key={"request_id": request_id},
+        ProjectionExpression="output_format, expected_batches",
+        ConsistentRead=True,
+    )
+    return response.get("Item", {})
+
+
+def get_output_format(event, control_item):
+    """
+    Resolve the output format of a request.
+    The format in the event wins, then the one stored on the control item by
+    split_batches, then OUTPUT_FORMAT.
+    Returns:
+        str: One of the keys of CONTENT_TYPES.
+    """
+    requested = event.get("output_format") or control_item.get("output_format") or output_format
+    if requested not in CONTENT_TYPES:
+        raise ValueError(f"Unsupported output format '{requested}'")
+    return requested
+
+
+def list_parts(request_id, prefix=None):
+    """
+    List the result parts of a request in batch order.
+    Args:
+        request_id (str): The request whose parts are listed.
+        prefix (str): Prefix to list instead, e.g. the request's segments_prefix.
+    Yields:
+        dict: S3 object summaries with "Key" and "Size".
+    """
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix or parts_prefix(request_id)):
+        yield from page.get("Contents", [])
+
+
+def combine_segments(parts, segments):
+    """
+    Use the segment of every range of batches the workers joined instead of its parts.
+    Args:
+        parts (list): Result parts of single batches.
+        segments (list): Result segments, each holding the parts of a range of batches.
+    Returns:
+        tuple: The objects to stitch in batch order, and the number of batches they hold.
+    """
+    sources, covered = [], set()
+    for segment in segments:
+        first_batch, last_batch = segment_batches(segment["Key"])
+        sources.append((first_batch, segment))
+        covered.update(range(first_batch, last_batch + 1))
+    batches = len(covered)
+    for part in parts:
+        batch_id = part_batch_id(part["Key"])
+        if batch_id not in covered:
+            sources.append((batch_id, part))
+            batches += 1
+    sources.sort(key=lambda source: source[0])
+    return [source for _, source in sources], batches
+
+
+def aggregate_parts(request_id, file_format, control_item):
+    """
+    Assemble the output from the result parts written by the workers as their
+    batches completed, without reading the records table.
+    Parts of concatenable formats are stitched into one object as they are,
+    using the segments the workers joined them into where they exist. JSON
+    parts are merged into one array.
+    Returns:
+        dict: "url" of the aggregated file, the number of "parts" (batches) and of
+            "segments" stitched, or None if the format cannot be stitched or some
+            batch has no part, and the records must be read instead.
+    """
+    if file_format not in STITCHABLE_FORMATS:
+        return None
+    extension = FILE_EXTENSIONS[file_format]
+    parts = [part for part in list_parts(request_id) if part["Key"].endswith(f".{extension}")]
+    segments = []
+    if file_format in CONCATENABLE_FORMATS:
+        segments = [
+            segment
+            for segment in list_parts(request_id, prefix=segments_prefix(request_id))
+            if segment["Key"].endswith(f".{extension}")
+        ]
+    sources, batches = combine_segments(parts, segments)
+    if not batches or batches < int(control_item.get("expected_batches", batches + 1)):
+        print(f"Found result parts for {batches} batches of request {request_id}, reading the records table")
+        return None
+
+    url = stitch_parts(sources, f"{request_id}_aggregated.{extension}", file_format)
+    return {"url": url, "parts": batches, "segments": len(segments)}
+
+
+def stitch_parts(parts, file_name, file_format):
+    """
+    Join result parts into one object with a multipart upload.
+    Parts of concatenable formats of at least MIN_PART_SIZE are copied by S3
+    when the data written before them fills whole upload parts or leaves at
+    least MIN_PART_SIZE to upload; the others are downloaded concurrently and
+    combined into parts of UPLOAD_PART_SIZE_MB. JSON parts are all downloaded
+    and their items written as a single array.
+    Returns:
+        str: Pre-signed URL for the stitched file.
+    """
+    writer = MultipartWriter(s3_client, bucket_name, file_name, CONTENT_TYPES[file_format], part_size=part_size)
+    concatenable = file_format in CONCATENABLE_FORMATS
+    # The writer's buffer holds what the bytes written since the last copy leave over whole parts
+    plan, buffered = [], 0
+    for part in parts:
+        remainder = buffered % writer.part_size
+        copy = concatenable and part["Size"] >= MIN_PART_SIZE and (remainder == 0 or remainder >= MIN_PART_SIZE)
+        buffered = 0 if copy else buffered + part["Size"]
+        plan.append((part["Key"], copy))
+    try:
+        downloads = read_parts([key for key, copy in plan if not copy])
+        if not concatenable:
+            for fragment in join_json_arrays(downloads):
+                writer.write(fragment)
+        else:
+            for key, copy in plan:
+                if copy:
+                    writer.copy(key)
+                else:
+                    writer.write(next(downloads))
+        writer.close()
+        return presigned_url(file_name)
+    except Exception as e:
+        print(f"Error stitching result parts: {e}")
+        writer.abort()
+        raise
+
+
+def join_json_arrays(documents):
+    """
+    Merge JSON array documents into one array without decoding their items.
+    Yields:
+        bytes: Fragments of the merged array.
+    """
+    yield b"["
+    separator = b""
+    for document in documents:
+        items = document.strip()[1:-1].strip()
+        if items:
+            yield separator + items
+            separator = b","
+    yield b"]"
+
+
+def read_parts(keys):
+    """
+    Download objects in order, keeping up to twice STITCH_READ_WORKERS requests in flight.
+    Yields:
+        bytes: The body of each object.
+    """
+    def read(key):
+        return s3_client.get_object(Bucket=bucket_name, Key=key)["Body"].read()
+
+    workers = max(1, stitch_read_workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for key in keys:
+            pending.append(executor.submit(read, key))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def presigned_url(key):
+    """
+    Pre-signed GET URL for an object of the output bucket.
+    """
+    return s3_client.generate_presigned_url(
+        "get_object", Params={"Bucket": bucket_name, "Key": key}, ExpiresIn=url_expiry_seconds
+    )
+
+
+def upload_to_s3(chunks, file_name, content_type="application/json"):
+    """
+    Stream the aggregated file to S3.
+    Args:
+        chunks (iterable): Encoded fragments of the file.
+        file_name (str): Destination object key.
+        content_type (str): Content type of the object.
+    Returns:
+        str: Pre-signed URL for the uploaded file.
+    """
+    writer = MultipartWriter(s3_client, bucket_name, file_name, content_type, part_size=part_size)
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+        writer.close()
+        # Generate pre-signed URL for the uploaded file
+        return presigned_url(file_name)
+    except Exception as e:
         print(f"Error uploading to S3: {e}")
+        writer.abort()
         raise
 
 
@@ -58,22 +310,57 @@ def lambda_handler(event, context):
         if not request_id:
             raise KeyError("Missing 'request_id' in event payload.")
 
+        control_item = load_control_item(request_id)
+        file_format = get_output_format(event, control_item)
+        index = load_dedupe_index(request_id)
+
+        # Restoring duplicates needs every record in order, so deduplicated requests are read in full
+        if aggregation_mode == "parts" and index is None:
+            with metrics.timer("Stitch"):
+                result = aggregate_parts(request_id, file_format, control_item)
+            if result is not None:
+                metrics.add("Parts", result["parts"])
+                return {
+                    "statusCode": 200,
+                    "body": json.dumps({"message": "Aggregation successful", **result}),
+                }
+        elif aggregation_mode not in ("full", "parts"):
+            raise ValueError(f"Unsupported aggregation mode '{aggregation_mode}'")
+
+        # Reading, serializing and uploading are streamed into each other and timed apart
+        query_timer, serialize_timer = StreamTimer(), StreamTimer()
+
         # Fetch data from DynamoDB
         print(f"Fetching data for request_id: {request_id}")
-        data = fetch_data_from_dynamodb(request_id)
-        if not data:
+        data = query_timer.wrap(fetch_data_from_dynamodb(request_id, batches=control_item.get("expected_batches")))
+        first_item = next(data, None)
+        if first_item is None:
             return {
                 "statusCode": 404,
                 "body": json.dumps({"error": f"No data found for request_id '{request_id}'"}),
             }
 
-        # Aggregate data into a single file (JSON format for simplicity)
-        aggregated_content = json.dumps(data, indent=4)
-        file_name = f"{request_id}_aggregated.json"
+        records = chain([first_item], data)
+
+        # Restore duplicate contacts removed before fan-out, in their original order
+        if index is not None:
+            records = expand_records(records, index)
+
+        # Serialize the records as they are read, without building the whole file in memory
+        aggregated_content = serialize_timer.wrap(serialize_records(records, file_format, row_group_size))
+        file_name = f"{request_id}_aggregated.{FILE_EXTENSIONS[file_format]}"
 
         # Upload aggregated file to S3
         print(f"Uploading aggregated file to S3 bucket: {bucket_name}")
-        presigned_url = upload_to_s3(aggregated_content, file_name)
+        started = time.perf_counter()
+        presigned_url = upload_to_s3(aggregated_content, file_name, CONTENT_TYPES[file_format])
+        elapsed = time.perf_counter() - started
+
+        metrics.put_time("Query", query_timer.seconds)
+        metrics.put_time("Serialize", serialize_timer.seconds - query_timer.seconds)
+        metrics.put_time("Upload", elapsed - serialize_timer.seconds)
+        metrics.add("Records", query_timer.items)
+        metrics.put_rate("RecordsPerSecond", query_timer.items, elapsed)
 
         # Return the pre-signed URL
         return {
@@ -92,3 +379,5 @@ def lambda_handler(event, context):
             "statusCode": 500,
             "body": json.dumps({"error": str(e)}),  # Include the actual error message
         }
+    finally:
+        metrics.flush()
@@ -0,0 +1,114 @@
+import queue
+import threading
+from itertools import chain
+
+_DONE = object()
+
+
+class ParallelQueryReader:
+    """
+    Reads the items of a request with concurrent range queries.
+    The batches of each partition are split into contiguous segments, each
+    paged on its own thread ahead of the consumer. Segments are read back one
+    after the other and partitions merged on the sort key, so items come out
+    in upload order, as with a sequential read.
+    """
+
+    def __init__(self, store, segments=4, max_pending_pages=8):
+        """
+        Args:
+            store (RecordStore): Key schema and table of the enriched records.
+            segments (int): Batch ranges queried concurrently per partition.
+            max_pending_pages (int): Pages buffered per segment before its thread waits for the consumer.
+        """
+        self.store = store
+        self.table = store.table
+        self.segments = max(1, segments)
+        self.max_pending_pages = max(1, max_pending_pages)
+
+    def read(self, request_id, batches=None):
+        """
+        Read all items for a request.
+        Args:
+            request_id (str): The request to read.
+            batches (int): Number of batches of the request, used to split them into
+                segments. Without it, each partition is read by a single query.
+        Yields:
+            dict: One item at a time, in batch and position order.
+        """
+        stop = threading.Event()
+        streams, threads = [], []
+        for partition in self.store.partitions(request_id):
+            segments = []
+            for first_batch, end_batch in self._ranges(batches):
+                pages = queue.Queue(maxsize=self.max_pending_pages)
+                threads.append(
+                    threading.Thread(
+                        target=self._query_segment,
+                        args=(partition, first_batch, end_batch, pages, stop),
+                        daemon=True,
+                    )
+                )
+                segments.append(self._drain(pages))
+            streams.append(chain.from_iterable(segments))
+        for thread in threads:
+            thread.start()
+
+        try:
+            yield from self.store.merge(streams, request_id)
+        finally:
+            # Segment threads waiting on a full queue give up once stopped
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def _ranges(self, batches):
+        """
+        Split the batch ids into contiguous ranges of about equal size. The first
+        and last ranges are open so records outside 1..batches are still read.
+        """
+        batches = int(batches or 0)
+        count = min(self.segments, batches) if batches else 1
+        bounds = [1 + batches * segment // count for segment in range(1, count)]
+        return list(zip([None] + bounds, bounds + [None]))
+
+    def _drain(self, pages):
+        """
+        Yield the items of a segment's pages until the segment is done.
+        """
+        while True:
+            page = pages.get()
+            if page is _DONE:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield from page
+
+    def _query_segment(self, partition, first_batch, end_batch, pages, stop):
+        """
+        Page through one batch range of a partition and push its pages onto the queue.
+        """
+        try:
+            # The resource client is thread-safe, unlike the Table resource itself
+            client = self.table.meta.client
+            for page in self.store.query_pages(partition, first_batch, end_batch, client=client):
+                if not self._put(pages, page, stop):
+                    return
+            self._put(pages, _DONE, stop)
+        except Exception as e:
+            self._put(pages, e, stop)
+
+    @staticmethod
+    def _put(pages, page, stop):
+        """
+        Queue a page, giving up once the consumer has stopped reading.
+        Returns:
+            bool: True if the page was queued.
+        """
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.01)
+                return True
+            except queue.Full:
+                pass
+        return False
@@ -0,0 +1 @@
+from .result_writer import MultipartWriter, MIN_PART_SIZE
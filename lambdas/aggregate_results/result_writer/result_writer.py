@@ -0,0 +1,110 @@
+# S3 requires every multipart part except the last to be at least 5 MB
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class MultipartWriter:
+    """
+    Streams an S3 object through a multipart upload, holding at most one part in memory.
+    Objects smaller than one part are written with a single put_object call.
+    """
+
+    def __init__(self, s3_client, bucket_name, key, content_type, part_size=8 * 1024 * 1024):
+        """
+        Args:
+            s3_client: boto3 S3 client.
+            bucket_name (str): Destination bucket.
+            key (str): Destination object key.
+            content_type (str): Content type of the object.
+            part_size (int): Size of each uploaded part in bytes (at least 5 MB).
+        """
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.content_type = content_type
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def write(self, data):
+        """
+        Buffer data and upload a part whenever a full part is available.
+        """
+        self.buffer += data
+        while len(self.buffer) >= self.part_size:
+            part = bytes(self.buffer[:self.part_size])
+            del self.buffer[:self.part_size]
+            self._upload_part(part)
+
+    def copy(self, source_key):
+        """
+        Append a whole object of the same bucket as the next part, copied by S3.
+        The object must be at least MIN_PART_SIZE unless it is the last part.
+        Buffered data of at least MIN_PART_SIZE is uploaded as a part of its own first.
+        Raises:
+            ValueError: If less than MIN_PART_SIZE is buffered; it could not be uploaded before the copy.
+        """
+        if self.buffer:
+            if len(self.buffer) < MIN_PART_SIZE:
+                raise ValueError("Buffered data must be uploaded before a part is copied")
+            self._upload_part(bytes(self.buffer))
+            self.buffer = bytearray()
+        self._start_upload()
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part_copy(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            CopySource={"Bucket": self.bucket_name, "Key": source_key},
+        )
+        self.parts.append({"ETag": response["CopyPartResult"]["ETag"], "PartNumber": part_number})
+
+    def close(self):
+        """
+        Upload the remaining data and complete the object.
+        """
+        if self.upload_id is None:
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                Body=bytes(self.buffer),
+                ContentType=self.content_type,
+            )
+        else:
+            if self.buffer:
+                self._upload_part(bytes(self.buffer))
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={"Parts": self.parts},
+            )
+        self.buffer = bytearray()
+
+    def abort(self):
+        """
+        Abort the multipart upload so no orphaned parts are kept.
+        """
+        if self.upload_id is not None:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id)
+            self.upload_id = None
+
+    def _start_upload(self):
+        if self.upload_id is None:
+            response = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, ContentType=self.content_type
+            )
+            self.upload_id = response["UploadId"]
+
+    def _upload_part(self, part):
+        self._start_upload()
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=part,
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
@@ -1,8 +1,18 @@
+import csv
+import gzip
+import io
 import json
 import pytest
+from decimal import Decimal
 import boto3
 from moto import mock_aws
-from lambdas.aggregate_results.app import lambda_handler
+from lambdas.aggregate_results import app
+from lambdas.aggregate_results.app import lambda_handler, fetch_data_from_dynamodb
+from lambdas.common.dedupe_index import index_key, encode_index, expand_records
+from lambdas.aggregate_results.result_writer import MultipartWriter
+from lambdas.common.output_formats import serialize_records
+from lambdas.common.record_store import RecordStore
+from lambdas.common.result_parts import part_key
 
 
 @pytest.fixture
@@ -16,8 +26,14 @@ def aws_setup(monkeypatch):
         table_name = "EnrichedData"
         table = dynamodb.create_table(
             TableName=table_name,
-            KeySchema=[{"AttributeName": "request_id", "KeyType": "HASH"}],
-            AttributeDefinitions=[{"AttributeName": "request_id", "AttributeType": "S"}],
+            KeySchema=[
+                {"AttributeName": "request_id", "KeyType": "HASH"},
+                {"AttributeName": "record_key", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "request_id", "AttributeType": "S"},
+                {"AttributeName": "record_key", "AttributeType": "S"},
+            ],
             BillingMode="PAY_PER_REQUEST",
         )
 
@@ -28,6 +44,7 @@ def aws_setup(monkeypatch):
         table.put_item(
             Item={
                 "request_id": "uuid-12345",
+                "record_key": "000001#00000",
                 "id": "batch-1",
                 "data": {"name": "John Doe", "email": "john.doe@example.com"},
             }
@@ -35,6 +52,7 @@ def aws_setup(monkeypatch):
         table.put_item(
             Item={
                 "request_id": "uuid-12345",
+                "record_key": "000002#00000",
                 "id": "batch-2",
                 "data": {"name": "Jane Smith", "email": "jane.smith@example.com"},
             }
@@ -48,6 +66,8 @@ def aws_setup(monkeypatch):
         # Set environment variables
         monkeypatch.setenv("DYNAMO_TABLE_NAME", table_name)
         monkeypatch.setenv("S3_BUCKET_NAME", bucket_name)
+        # Requests use the default output format unless a test creates a control table
+        monkeypatch.setattr(app, "control_table_name", None)
 
         yield {"table_name": table_name, "bucket_name": bucket_name}
 
@@ -135,3 +155,306 @@ def test_lambda_handler_s3_error(monkeypatch, aws_setup):
     assert "error" in body
     assert "S3 upload failed" in body["error"]
 
+
+def test_fetch_data_follows_pagination(monkeypatch, aws_setup):
+    """
+    Test that every page of the query is read using LastEvaluatedKey.
+    """
+    pages = [
+        {"Items": [{"id": "1"}, {"id": "2"}], "LastEvaluatedKey": {"request_id": "uuid-12345", "id": "2"}},
+        {"Items": [{"id": "3"}]},
+    ]
+    calls = []
+
+    def mock_query(**kwargs):
+        calls.append(kwargs.get("ExclusiveStartKey"))
+        return pages[len(calls) - 1]
+
+    table_mock = boto3.resource("dynamodb").Table(aws_setup["table_name"])
+    monkeypatch.setattr("lambdas.aggregate_results.app.dynamodb.Table", lambda table_name: table_mock)
+    monkeypatch.setattr(table_mock, "query", mock_query)
+
+    items = list(fetch_data_from_dynamodb("uuid-12345"))
+
+    assert items == [{"id": "1"}, {"id": "2"}, {"id": "3"}]
+    assert calls == [None, {"request_id": "uuid-12345", "id": "2"}]
+
+
+def test_serialize_records_formats():
+    """
+    Test compact JSON array and NDJSON serialization.
+    """
+    records = [{"id": "1", "score": Decimal("2")}, {"id": "2", "score": Decimal("2.5")}]
+
+    compact = b"".join(serialize_records(records, "json"))
+    ndjson = b"".join(serialize_records(records, "ndjson"))
+
+    assert json.loads(compact) == [{"id": "1", "score": 2}, {"id": "2", "score": 2.5}]
+    assert [json.loads(line) for line in ndjson.splitlines()] == json.loads(compact)
+
+
+def test_serialize_records_columnar_and_compressed_formats():
+    """
+    Test gzip-compressed NDJSON and CSV serialization, with nested values as JSON.
+    """
+    records = [{"id": "1", "score": Decimal("2"), "tags": {"a"}}, {"id": "2", "score": None, "extra": "x"}]
+
+    ndjson_gz = gzip.decompress(b"".join(serialize_records(records, "ndjson.gz")))
+    rows = list(csv.reader(io.StringIO(b"".join(serialize_records(records, "csv")).decode("utf-8"))))
+
+    assert [json.loads(line)["id"] for line in ndjson_gz.splitlines()] == ["1", "2"]
+    assert rows == [["id", "score", "tags", "extra"], ["1", "2", '["a"]', ""], ["2", "", "", "x"]]
+    with pytest.raises(ValueError):
+        list(serialize_records(records, "xml"))
+
+
+def test_serialize_records_parquet_row_groups():
+    """
+    Test that Parquet output is written in row groups with numbers stored as doubles.
+    """
+    pq = pytest.importorskip("pyarrow.parquet")
+    records = [{"id": str(i), "score": Decimal(i), "data": {"n": i}, "note": None} for i in range(25)]
+
+    parquet = pq.ParquetFile(io.BytesIO(b"".join(serialize_records(records, "parquet", row_group_size=10))))
+
+    assert parquet.metadata.num_row_groups == 3
+    assert [str(field.type) for field in parquet.schema_arrow] == ["string", "double", "string", "string"]
+    rows = parquet.read().to_pylist()
+    assert rows[24] == {"id": "24", "score": 24.0, "data": '{"n":24}', "note": None}
+
+
+def test_serialize_records_parquet_widens_column_types():
+    """
+    Test that later row groups widen the Parquet schema instead of truncating or failing.
+    """
+    pq = pytest.importorskip("pyarrow.parquet")
+    records = [{"id": str(i), "score": Decimal(2), "rank": None} for i in range(10)]
+    records += [{"id": "10", "score": Decimal("2.5"), "rank": Decimal(3)}]
+
+    parquet = pq.ParquetFile(io.BytesIO(b"".join(serialize_records(records, "parquet", row_group_size=5))))
+
+    assert [str(field.type) for field in parquet.schema_arrow] == ["string", "double", "double"]
+    rows = parquet.read().to_pylist()
+    assert rows[0] == {"id": "0", "score": 2.0, "rank": None}
+    assert rows[10] == {"id": "10", "score": 2.5, "rank": 3.0}
+
+
+def test_serialize_records_parquet_rejects_values_of_another_type():
+    """
+    Test that a value that does not fit its Parquet column raises instead of being converted.
+    """
+    pytest.importorskip("pyarrow.parquet")
+    records = [{"id": str(i), "score": Decimal(i)} for i in range(5)] + [{"id": "5", "score": "high"}]
+
+    with pytest.raises(ValueError):
+        list(serialize_records(records, "parquet", row_group_size=2))
+    with pytest.raises(ValueError):
+        list(serialize_records([{"id": "1", "score": 2 ** 60 + 1}], "parquet"))
+
+
+def test_lambda_handler_uses_requested_output_format(monkeypatch, aws_setup):
+    """
+    Test that the format stored on the control item is used unless the event names one.
+    """
+    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+    control_table = dynamodb.create_table(
+        TableName="ControlTable",
+        KeySchema=[{"AttributeName": "request_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "request_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    control_table.put_item(Item={"request_id": "uuid-12345", "output_format": "csv"})
+    monkeypatch.setattr(app, "control_table_name", "ControlTable")
+    s3 = boto3.client("s3", region_name="us-east-1")
+
+    assert lambda_handler({"request_id": "uuid-12345"}, None)["statusCode"] == 200
+    assert lambda_handler({"request_id": "uuid-12345", "output_format": "ndjson.gz"}, None)["statusCode"] == 200
+
+    csv_object = s3.get_object(Bucket=aws_setup["bucket_name"], Key="uuid-12345_aggregated.csv")
+    assert csv_object["ContentType"] == "text/csv"
+    assert csv_object["Body"].read().decode("utf-8").splitlines()[0] == "request_id,record_key,id,data"
+    ndjson_gz = s3.get_object(Bucket=aws_setup["bucket_name"], Key="uuid-12345_aggregated.ndjson.gz")["Body"].read()
+    assert len(gzip.decompress(ndjson_gz).splitlines()) == 2
+
+
+@pytest.fixture
+def parts_setup(monkeypatch, aws_setup):
+    """
+    Control table of a request with three batches, aggregated from result parts.
+    """
+    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+    control_table = dynamodb.create_table(
+        TableName="ControlTable",
+        KeySchema=[{"AttributeName": "request_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "request_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    control_table.put_item(Item={"request_id": "uuid-12345", "expected_batches": 3, "processed_batches": 3})
+    monkeypatch.setattr(app, "control_table_name", "ControlTable")
+    monkeypatch.setattr(app, "aggregation_mode", "parts")
+    yield {"bucket_name": aws_setup["bucket_name"], "s3": boto3.client("s3", region_name="us-east-1")}
+
+
+def test_lambda_handler_stitches_result_parts(parts_setup):
+    """
+    Test that NDJSON parts are stitched in batch order, copying large parts and combining small ones.
+    """
+    s3, bucket_name = parts_setup["s3"], parts_setup["bucket_name"]
+    large_line = json.dumps({"id": "large", "data": "x" * (6 * 1024 * 1024)}) + "\n"
+    bodies = [large_line.encode("utf-8"), b'{"id":"a"}\n', b'{"id":"b"}\n{"id":"c"}\n']
+    for batch_id, body in enumerate(bodies):
+        s3.put_object(Bucket=bucket_name, Key=part_key("uuid-12345", batch_id, "ndjson"), Body=body)
+    copies = []
+    record_copy = lambda **kwargs: copies.append(kwargs)
+    app.s3_client.meta.events.register("before-call.s3.UploadPartCopy", record_copy)
+
+    response = lambda_handler({"request_id": "uuid-12345", "output_format": "ndjson"}, None)
+    app.s3_client.meta.events.unregister("before-call.s3.UploadPartCopy", record_copy)
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["parts"] == 3
+    body = s3.get_object(Bucket=bucket_name, Key="uuid-12345_aggregated.ndjson")["Body"].read()
+    assert [json.loads(line)["id"] for line in body.splitlines()] == ["large", "a", "b", "c"]
+    assert len(copies) == 1
+
+
+def test_lambda_handler_merges_json_result_parts(parts_setup):
+    """
+    Test that JSON parts are merged into the single array the full read would write.
+    """
+    s3, bucket_name = parts_setup["s3"], parts_setup["bucket_name"]
+    bodies = [b'[{"id":"a"},{"id":"b"}]', b"[]", b'[{"id":"c"}]']
+    for batch_id, body in enumerate(bodies):
+        s3.put_object(Bucket=bucket_name, Key=part_key("uuid-12345", batch_id, "json"), Body=body)
+
+    response = lambda_handler({"request_id": "uuid-12345"}, None)
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["parts"] == 3
+    body = s3.get_object(Bucket=bucket_name, Key="uuid-12345_aggregated.json")["Body"].read()
+    assert [item["id"] for item in json.loads(body)] == ["a", "b", "c"]
+
+
+def test_lambda_handler_reads_records_for_formats_that_cannot_be_stitched(parts_setup):
+    """
+    Test that CSV requests are aggregated from the records table even when their parts exist.
+    """
+    s3, bucket_name = parts_setup["s3"], parts_setup["bucket_name"]
+    for batch_id in range(3):
+        s3.put_object(Bucket=bucket_name, Key=part_key("uuid-12345", batch_id, "csv"), Body=f"id\r\n{batch_id}\r\n")
+
+    response = lambda_handler({"request_id": "uuid-12345", "output_format": "csv"}, None)
+
+    assert response["statusCode"] == 200
+    assert "parts" not in json.loads(response["body"])
+    body = s3.get_object(Bucket=bucket_name, Key="uuid-12345_aggregated.csv")["Body"].read().decode("utf-8")
+    assert body.splitlines()[0].startswith("request_id")
+
+
+def test_lambda_handler_reads_records_when_parts_are_missing(parts_setup):
+    """
+    Test that a request with a batch missing its part is aggregated from the records table.
+    """
+    s3, bucket_name = parts_setup["s3"], parts_setup["bucket_name"]
+    for batch_id in range(2):
+        s3.put_object(Bucket=bucket_name, Key=part_key("uuid-12345", batch_id, "json"), Body=b"[]")
+
+    response = lambda_handler({"request_id": "uuid-12345"}, None)
+
+    assert response["statusCode"] == 200
+    assert "parts" not in json.loads(response["body"])
+    body = s3.get_object(Bucket=bucket_name, Key="uuid-12345_aggregated.json")["Body"].read()
+    assert [item["id"] for item in json.loads(body)] == ["batch-1", "batch-2"]
+
+
+def test_multipart_writer_streams_parts(aws_setup):
+    """
+    Test that large output is uploaded in parts and reassembled by S3.
+    """
+    s3 = boto3.client("s3", region_name="us-east-1")
+    calls = []
+    s3.meta.events.register("before-call.s3.UploadPart", lambda **kwargs: calls.append("UploadPart"))
+
+    writer = MultipartWriter(s3, aws_setup["bucket_name"], "large.ndjson", "application/x-ndjson", part_size=0)
+    chunk = b"x" * (1024 * 1024)
+    for _ in range(12):
+        writer.write(chunk)
+    writer.close()
+
+    body = s3.get_object(Bucket=aws_setup["bucket_name"], Key="large.ndjson")["Body"].read()
+    assert len(body) == 12 * 1024 * 1024
+    assert len(calls) == 3
+
+
+def test_fetch_data_parallel_query_keeps_upload_order(monkeypatch, aws_setup):
+    """
+    Test that the parallel query mode reads only the request's partition, in batch and position order.
+    """
+    table = boto3.resource("dynamodb", region_name="us-east-1").Table(aws_setup["table_name"])
+    store = RecordStore(table)
+    with table.batch_writer() as writer:
+        for batch_id in range(1, 11):
+            for position in range(3):
+                writer.put_item(Item=store.keyed({"id": f"{batch_id}-{position}"}, "uuid-7", batch_id, position))
+        for i in range(50):
+            writer.put_item(Item={"request_id": f"uuid-other-{i}", "record_key": "000001#00000", "id": str(i)})
+    monkeypatch.setattr("lambdas.aggregate_results.app.read_segments", 3)
+    operations = []
+    record_call = lambda model, **kwargs: operations.append(model.name)
+    app.dynamodb.meta.client.meta.events.register("before-call.dynamodb", record_call)
+
+    items = list(fetch_data_from_dynamodb("uuid-7", mode="parallel_query", batches=10))
+    unsegmented = list(fetch_data_from_dynamodb("uuid-7", mode="parallel_query"))
+    app.dynamodb.meta.client.meta.events.unregister("before-call.dynamodb", record_call)
+
+    expected = [f"{b}-{p}" for b in range(1, 11) for p in range(3)]
+    assert [item["id"] for item in items] == expected
+    assert [item["id"] for item in unsegmented] == expected
+    assert set(operations) == {"Query"}
+    assert len(operations) == 4
+
+
+def test_expand_records_restores_original_order():
+    """
+    Test that unique records are re-expanded to the original contact order.
+    """
+    records = [{"id": "a"}, {"id": "b"}, {"id": "c"}]
+    index = [0, 1, 0, 2, 1, 0]
+
+    expanded = [record["id"] for record in expand_records(records, index)]
+
+    assert expanded == ["a", "b", "a", "c", "b", "a"]
+
+
+def test_lambda_handler_expands_deduplicated_request(aws_setup):
+    """
+    Test that the aggregated file repeats records for contacts removed as duplicates.
+    """
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.put_object(Bucket=aws_setup["bucket_name"], Key=index_key("uuid-12345"), Body=encode_index([0, 1, 0]))
+
+    response = lambda_handler({"request_id": "uuid-12345"}, None)
+
+    assert response["statusCode"] == 200
+    body = s3.get_object(Bucket=aws_setup["bucket_name"], Key="uuid-12345_aggregated.json")["Body"].read()
+    assert [item["id"] for item in json.loads(body)] == ["batch-1", "batch-2", "batch-1"]
+
+
+def test_fetch_data_merges_sharded_partitions(monkeypatch, aws_setup):
+    """
+    Test that records written across shards are read back in batch and position order.
+    """
+    table = boto3.resource("dynamodb", region_name="us-east-1").Table(aws_setup["table_name"])
+    store = RecordStore(table, shards=3)
+    with table.batch_writer() as writer:
+        for batch_id in range(1, 8):
+            for position in range(4):
+                writer.put_item(Item=store.keyed({"id": f"{batch_id}-{position}"}, "uuid-sharded", batch_id, position))
+    monkeypatch.setattr("lambdas.aggregate_results.app.record_shards", 3)
+
+    items = list(fetch_data_from_dynamodb("uuid-sharded"))
+    queried = list(fetch_data_from_dynamodb("uuid-sharded", mode="parallel_query", batches=7))
+
+    assert [item["id"] for item in items] == [f"{b}-{p}" for b in range(1, 8) for p in range(4)]
+    assert {item["request_id"] for item in items} == {"uuid-sharded"}
+    assert queried == items
@@ -1,37 +1,228 @@
 import os
-import boto3
 import json
+import time
 from botocore.exceptions import ClientError
 
-dynamodb = boto3.resource("dynamodb")
+from ..common.aws_clients import lazy_client, lazy_resource
+from ..common.completion import is_complete, notify_completion
+from ..common.metrics import metrics_from_environment
+from ..common.result_parts import part_batch_id, parts_prefix
+from .status_cache import StatusCache
+
+# Created on first use and kept for warm invocations
+dynamodb = lazy_resource("dynamodb")
+sfn_client = lazy_client("stepfunctions")
+s3_client = lazy_client("s3")
+metrics = metrics_from_environment("check_completion")
 control_table_name = os.environ.get("CONTROL_TABLE_NAME", "DefaultControlTable")
+# Bucket holding the result parts written by the workers, if any
+bucket_name = os.environ.get("S3_BUCKET_NAME")
+# Module-level so polling clients hit it across warm invocations
+status_cache = StatusCache(ttl_seconds=float(os.environ.get("STATUS_CACHE_TTL_SECONDS", "2")))
+# Result part URLs returned per status response
+max_status_parts = int(os.environ.get("STATUS_MAX_PARTS", "100"))
+url_expiry_seconds = 3600
+
+# Control item attributes the status endpoint reports
+STATUS_ATTRIBUTES = (
+    "request_id",
+    "expected_batches",
+    "processed_batches",
+    "processed_records",
+    "failed_records",
+    "total_contacts",
+    "unique_contacts",
+    "created_at",
+    "updated_at",
+    "status",
+    "error",
+)
+
+
+def register_task_token(table, request_id, task_token):
+    """
+    Store the Step Functions task token on the control item.
+    The worker that processes the last batch uses it to resume the execution.
+    If every batch finished before the token was stored, resume it right away.
+    Returns:
+        dict: The updated control item, or None if the request does not exist.
+    """
+    try:
+        response = table.update_item(
+            Key={"request_id": request_id},
+            UpdateExpression="SET task_token = :task_token",
+            ConditionExpression="attribute_exists(request_id)",
+            ExpressionAttributeValues={":task_token": task_token},
+            ReturnValues="ALL_NEW",
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return None
+        raise
+
+    item = response["Attributes"]
+    notify_completion(item, sfn_client)
+    return item
+
+def get_status_item(table, request_id):
+    """
+    Read the attributes of the control item reported by the status endpoint,
+    with a strongly consistent read so progress never goes backwards.
+    Returns:
+        dict: The projected control item, or None if the request does not exist.
+    """
+    names = {f"#a{position}": name for position, name in enumerate(STATUS_ATTRIBUTES)}
+    response = table.get_item(
+        Key={"request_id": request_id},
+        ProjectionExpression=", ".join(names),
+        ExpressionAttributeNames=names,
+        ConsistentRead=True,
+    )
+    return response.get("Item")
+
+
+def describe_progress(item, now=None):
+    """
+    Summarize the progress of a request from its control item.
+    Throughput is measured from the creation of the request to now, or to its
+    last processed batch once it completed. The ETA assumes the remaining
+    batches are processed at the same rate.
+    Args:
+        item (dict): Control table item.
+        now (float): Current time in epoch seconds; defaults to the clock.
+    Returns:
+        dict: Status, counts, throughput and ETA of the request.
+    """
+    now = time.time() if now is None else now
+    complete = is_complete(item)
+    processed = int(item.get("processed_batches", 0))
+    expected = int(item["expected_batches"]) if "expected_batches" in item else None
+    progress = {
+        "status": item.get("status") or ("completed" if complete else "incomplete"),
+        "processed_batches": processed,
+        "expected_batches": expected,
+        "processed_records": int(item.get("processed_records", 0)),
+        "failed_records": int(item.get("failed_records", 0)),
+    }
+    for name in ("total_contacts", "unique_contacts"):
+        if name in item:
+            progress[name] = int(item[name])
+    if "error" in item:
+        progress["error"] = item["error"]
+
+    if "created_at" not in item:
+        return progress
+    end = float(item.get("updated_at", now)) if complete else now
+    elapsed = max(end - float(item["created_at"]), 0.0)
+    progress["elapsed_seconds"] = round(elapsed, 1)
+    if elapsed > 0:
+        progress["batches_per_second"] = round(processed / elapsed, 3)
+        progress["records_per_second"] = round(progress["processed_records"] / elapsed, 1)
+    if complete:
+        progress["eta_seconds"] = 0
+    elif expected is not None and processed and elapsed > 0:
+        progress["eta_seconds"] = round((expected - processed) * elapsed / processed, 1)
+    else:
+        # Unknown until the batch count is recorded and a batch is processed
+        progress["eta_seconds"] = None
+    return progress
+
+
+def list_finished_parts(request_id, after=None):
+    """
+    Pre-signed URLs of the result parts the workers already wrote, in batch
+    order, so clients can consume the output before the request completes.
+    Args:
+        request_id (str): The request.
+        after (int): Only list the parts of later batches.
+    Returns:
+        dict: The "parts", each with its "batch_id", "size" and "url", and
+            "next_after" when more parts are available.
+    """
+    prefix = parts_prefix(request_id)
+    list_kwargs = {"Bucket": bucket_name, "Prefix": prefix, "MaxKeys": max_status_parts}
+    if after is not None:
+        # Keys are zero-padded batch ids, so the next batch's key sorts after the given one's
+        list_kwargs["StartAfter"] = f"{prefix}{after + 1:06d}"
+    response = s3_client.list_objects_v2(**list_kwargs)
+    contents = response.get("Contents", [])
+    parts = [
+        {
+            "batch_id": part_batch_id(part["Key"]),
+            "size": part["Size"],
+            "url": s3_client.generate_presigned_url(
+                "get_object", Params={"Bucket": bucket_name, "Key": part["Key"]}, ExpiresIn=url_expiry_seconds
+            ),
+        }
+        for part in contents
+        if part["Size"]
+    ]
+    result = {"parts": parts}
+    if response.get("IsTruncated") and contents:
+        result["next_after"] = part_batch_id(contents[-1]["Key"])
+    return result
+
+
+def get_status(table, request_id, after=None):
+    """
+    Progress of a request and its finished result parts, cached for STATUS_CACHE_TTL_SECONDS.
+    Returns:
+        dict: The status response body, or None if the request does not exist.
+    """
+    cache_key = (request_id, after)
+    status = status_cache.get(cache_key)
+    if status is not None:
+        metrics.add("StatusCacheHits")
+        return status
+
+    with metrics.timer("Lookup"):
+        item = get_status_item(table, request_id)
+    if not item:
+        return None
+    status = {"request_id": request_id, **describe_progress(item)}
+    if bucket_name:
+        status.update(list_finished_parts(request_id, after))
+    status_cache.put(cache_key, status)
+    return status
+
 
 def lambda_handler(event, context):
     """
-    Check if all batches for a request are processed.
+    Report the progress of a request.
+    Called by Step Functions with a "request_id" and "task_token", and by the
+    GET /status/{id} route, which accepts an "after" batch id to page through
+    the finished result parts.
     """
     try:
-        request_id = event.get("request_id")
+        request_id = event.get("request_id") or (event.get("pathParameters") or {}).get("id")
         if not request_id:
             raise KeyError("Missing 'request_id' in event payload.")
 
         table = dynamodb.Table(control_table_name)
-        response = table.get_item(Key={"request_id": request_id})
-
-        item = response.get("Item")
-        if not item:
+        task_token = event.get("task_token")
+        if task_token:
+            with metrics.timer("Lookup"):
+                item = register_task_token(table, request_id, task_token)
+            status = {"request_id": request_id, **describe_progress(item)} if item else None
+        else:
+            after = (event.get("queryStringParameters") or {}).get("after")
+            if after is not None:
+                if not after.isdigit():
+                    return {
+                        "statusCode": 400,
+                        "body": json.dumps({"error": "'after' must be a batch id."}),
+                    }
+                after = int(after)
+            status = get_status(table, request_id, after)
+        if not status:
             return {
                 "statusCode": 404,
                 "body": json.dumps({"error": f"Request ID '{request_id}' not found."}),
             }
 
-        expected_batches = int(item["expected_batches"])
-        processed_batches = int(item["processed_batches"])
-        status = "completed" if processed_batches >= expected_batches else "incomplete"
-
         return {
             "statusCode": 200,
-            "body": json.dumps({"status": status}),
+            "body": json.dumps(status),
         }
 
     except KeyError as e:
@@ -54,3 +245,6 @@ def lambda_handler(event, context):
             "statusCode": 500,
             "body": json.dumps({"error": f"Internal server error: {str(e)}"}),
         }
+
+    finally:
+        metrics.flush()
@@ -0,0 +1 @@
+from .status_cache import StatusCache
@@ -0,0 +1,45 @@
+import time
+from collections import OrderedDict
+
+
+class StatusCache:
+    """
+    In-process cache of status responses with a short TTL. It lives at module
+    level, so clients polling aggressively are served by a warm Lambda without
+    reading the control table on every call.
+    """
+
+    def __init__(self, ttl_seconds=2, max_entries=1024):
+        """
+        Args:
+            ttl_seconds (float): Lifetime of a cached response; 0 disables the cache.
+            max_entries (int): Responses kept before the oldest is evicted.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        """
+        Returns:
+            dict: The cached response, or None if it is missing or expired.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self.entries[key]
+            return None
+        return value
+
+    def put(self, key, value):
+        """
+        Cache a response for ttl_seconds.
+        """
+        if self.ttl_seconds <= 0:
+            return
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
@@ -2,7 +2,10 @@ import json
 import pytest
 from moto import mock_aws
 import boto3
-from lambdas.check_completion.app import lambda_handler
+from lambdas.check_completion import app
+from lambdas.check_completion.app import describe_progress, lambda_handler
+from lambdas.check_completion.status_cache import StatusCache
+from lambdas.common.result_parts import part_key
 
 
 @pytest.fixture
@@ -44,6 +47,9 @@ def dynamodb_setup(monkeypatch):
 
         # Set environment variable
         monkeypatch.setenv("CONTROL_TABLE_NAME", control_table_name)
+        # Responses cached by an earlier test must not leak into this one
+        monkeypatch.setattr(app, "status_cache", StatusCache())
+        monkeypatch.setattr(app, "bucket_name", None)
 
         yield table
 
@@ -96,3 +102,86 @@ def test_lambda_handler_not_found(dynamodb_setup):
     body = json.loads(response["body"])
     assert "error" in body
     assert "not found" in body["error"]
+
+
+def test_lambda_handler_registers_task_token(dynamodb_setup, monkeypatch):
+    """
+    Test that a task token is stored and resumed right away when the request is already complete.
+    """
+    notifications = []
+    monkeypatch.setattr(
+        "lambdas.check_completion.app.sfn_client.send_task_success", lambda **kwargs: notifications.append(kwargs)
+    )
+
+    response = lambda_handler({"request_id": "uuid-67890", "task_token": "token-67890"}, None)
+    assert json.loads(response["body"])["status"] == "incomplete"
+    assert dynamodb_setup.get_item(Key={"request_id": "uuid-67890"})["Item"]["task_token"] == "token-67890"
+    assert notifications == []
+
+    response = lambda_handler({"request_id": "uuid-12345", "task_token": "token-12345"}, None)
+    assert json.loads(response["body"])["status"] == "completed"
+    assert [notification["taskToken"] for notification in notifications] == ["token-12345"]
+
+
+def test_describe_progress_reports_throughput_and_eta():
+    """
+    Test the counts, throughput and ETA derived from the control item.
+    """
+    item = {
+        "request_id": "uuid-1",
+        "expected_batches": 10,
+        "processed_batches": 4,
+        "processed_records": 400,
+        "failed_records": 3,
+        "created_at": 1000,
+        "updated_at": 1015,
+    }
+
+    progress = describe_progress(item, now=1020)
+    completed = describe_progress({**item, "processed_batches": 10}, now=1100)
+
+    assert progress["status"] == "incomplete"
+    assert progress["failed_records"] == 3
+    assert progress["batches_per_second"] == 0.2
+    assert progress["records_per_second"] == 20.0
+    assert progress["eta_seconds"] == 30.0
+    assert completed["elapsed_seconds"] == 15.0
+    assert completed["eta_seconds"] == 0
+    assert describe_progress({"request_id": "uuid-1", "processed_batches": 0, "created_at": 1000}, now=1001)["eta_seconds"] is None
+    failed = describe_progress({**item, "status": "failed", "error": "Invalid request body"}, now=1020)
+    assert (failed["status"], failed["error"]) == ("failed", "Invalid request body")
+
+
+def test_lambda_handler_lists_finished_parts(dynamodb_setup, monkeypatch):
+    """
+    Test that GET /status/{id} returns pre-signed URLs of finished parts, paged with "after", from a cached read.
+    """
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="output-bucket")
+    for batch_id in (0, 1, 3):
+        s3.put_object(Bucket="output-bucket", Key=part_key("uuid-67890", batch_id, "ndjson"), Body=b'{"id":"a"}\n')
+    monkeypatch.setattr(app, "bucket_name", "output-bucket")
+    monkeypatch.setattr(app, "max_status_parts", 2)
+    reads = []
+    record_read = lambda params, **kwargs: reads.append(params)
+    app.dynamodb.meta.client.meta.events.register("provide-client-params.dynamodb.GetItem", record_read)
+
+    event = {"pathParameters": {"id": "uuid-67890"}}
+    first = json.loads(lambda_handler(event, None)["body"])
+    cached = json.loads(lambda_handler(event, None)["body"])
+    rest = json.loads(lambda_handler({**event, "queryStringParameters": {"after": "1"}}, None)["body"])
+    invalid = lambda_handler({**event, "queryStringParameters": {"after": "x"}}, None)
+    app.dynamodb.meta.client.meta.events.unregister("provide-client-params.dynamodb.GetItem", record_read)
+
+    assert first["processed_batches"] == 5
+    assert first["expected_batches"] == 10
+    assert [part["batch_id"] for part in first["parts"]] == [0, 1]
+    assert first["parts"][0]["url"].startswith("https://")
+    assert first["next_after"] == 1
+    assert cached == first
+    assert [part["batch_id"] for part in rest["parts"]] == [3]
+    assert "next_after" not in rest
+    assert invalid["statusCode"] == 400
+    assert len(reads) == 2
+    assert reads[0]["ConsistentRead"] is True
+
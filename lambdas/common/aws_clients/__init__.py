@@ -0,0 +1 @@
+from .aws_clients import CLIENT_CONFIG, get_client, get_resource, lazy_client, lazy_resource, lazy_table
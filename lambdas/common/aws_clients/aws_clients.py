@@ -0,0 +1,81 @@
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+# Shared by every client of a container: connections are kept alive across warm
+# invocations, and the pool is large enough for the thread pools writing to
+# DynamoDB, sending to SQS or reading scan segments in parallel
+CLIENT_CONFIG = Config(
+    max_pool_connections=int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "32")),
+    tcp_keepalive=True,
+    retries={"mode": "standard", "max_attempts": 3},
+)
+
+_clients = {}
+_resources = {}
+_lock = threading.Lock()
+
+
+def get_client(service_name):
+    """
+    Low-level client of a service, created on first use and shared by the whole container.
+    """
+    return _get_or_create(_clients, service_name, boto3.client)
+
+
+def get_resource(service_name):
+    """
+    Resource of a service, for the DynamoDB tables whose items are (de)serialized by boto3.
+    """
+    return _get_or_create(_resources, service_name, boto3.resource)
+
+
+def _get_or_create(registry, service_name, factory):
+    instance = registry.get(service_name)
+    if instance is None:
+        # boto3's default session is not thread-safe while it creates clients
+        with _lock:
+            instance = registry.get(service_name)
+            if instance is None:
+                instance = registry[service_name] = factory(service_name, config=CLIENT_CONFIG)
+    return instance
+
+
+class LazyProxy:
+    """
+    Stands in for a client, resource or table until one of its attributes is
+    used, so importing a handler or constructing its components makes no client.
+    """
+
+    def __init__(self, factory):
+        """
+        Args:
+            factory (callable): Builds the proxied object on first use.
+        """
+        self._factory = factory
+        self._target = None
+
+    def __getattr__(self, name):
+        if name in ("_factory", "_target"):
+            raise AttributeError(name)
+        target = self._target
+        if target is None:
+            target = self._target = self._factory()
+        return getattr(target, name)
+
+
+def lazy_client(service_name):
+    return LazyProxy(lambda: get_client(service_name))
+
+
+def lazy_resource(service_name):
+    return LazyProxy(lambda: get_resource(service_name))
+
+
+def lazy_table(table_name):
+    """
+    DynamoDB Table of the shared resource, built on first use.
+    """
+    return LazyProxy(lambda: get_resource("dynamodb").Table(table_name))
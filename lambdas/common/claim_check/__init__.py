@@ -0,0 +1 @@
+from .claim_check import claim_check_key, pack_batch, unpack_batch
\ No newline at end of file
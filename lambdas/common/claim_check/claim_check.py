@@ -0,0 +1,26 @@
+import json
+import zlib
+
+# Prefix of the S3 objects holding oversized batch messages
+CLAIM_CHECK_PREFIX = "claim-checks/"
+
+
+def claim_check_key(request_id, batch_id):
+    """
+    S3 key of the stored batch of an oversized message.
+    """
+    return f"{CLAIM_CHECK_PREFIX}{request_id}/{batch_id}.json.zz"
+
+
+def pack_batch(batch):
+    """
+    Serialize a batch as zlib-compressed JSON.
+    """
+    return zlib.compress(json.dumps(batch, separators=(",", ":")).encode("utf-8"))
+
+
+def unpack_batch(data):
+    """
+    Deserialize a batch written by pack_batch.
+    """
+    return json.loads(zlib.decompress(data))
@@ -0,0 +1 @@
+from .completion import batch_marker_key, is_complete, notify_completion
\ No newline at end of file
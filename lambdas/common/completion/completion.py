@@ -0,0 +1,61 @@
+import json
+
+from botocore.exceptions import ClientError
+
+# Errors meaning the task token was already used or the execution is gone
+_STALE_TOKEN_ERRORS = {"TaskTimedOut", "TaskDoesNotExist", "InvalidToken"}
+
+
+def batch_marker_key(request_id, batch_id):
+    """
+    Control table key of the marker recording that a batch was processed.
+    """
+    return f"{request_id}#batch#{batch_id}"
+
+
+def is_complete(item):
+    """
+    Check whether every expected batch of a control table item is processed.
+    Args:
+        item (dict): Control table item.
+    Returns:
+        bool: True when the request has a batch count and all batches are processed.
+    """
+    if "expected_batches" not in item:
+        return False
+    return int(item.get("processed_batches", 0)) >= int(item["expected_batches"])
+
+
+def notify_completion(item, sfn_client):
+    """
+    Resume the Step Functions execution waiting on a completed request, or fail
+    it as soon as the request is marked failed.
+    Both the worker that processes the last batch and the completion check that
+    registers the task token may call this; the second notification is ignored.
+    Args:
+        item (dict): Control table item, including the "task_token" when one is registered.
+        sfn_client: boto3 Step Functions client.
+    Returns:
+        bool: True if the execution was notified by this call.
+    """
+    task_token = item.get("task_token")
+    failed = item.get("status") == "failed"
+    if not task_token or not (failed or is_complete(item)):
+        return False
+
+    try:
+        if failed:
+            sfn_client.send_task_failure(
+                taskToken=task_token, error="RequestFailed", cause=item.get("error", "")
+            )
+        else:
+            sfn_client.send_task_success(
+                taskToken=task_token,
+                output=json.dumps({"request_id": item["request_id"], "status": "completed"}),
+            )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] in _STALE_TOKEN_ERRORS:
+            print(f"Completion for request {item['request_id']} was already reported")
+            return False
+        raise
@@ -0,0 +1 @@
+from .contact_key import IDENTITY_FIELDS, normalize_key, contact_digest
\ No newline at end of file
@@ -0,0 +1,28 @@
+import hashlib
+import json
+
+IDENTITY_FIELDS = ("first_name", "last_name", "company_domain")
+
+
+def normalize_key(record):
+    """
+    Build the identity key of a contact.
+    Returns:
+        tuple: (first_name, last_name, company_domain) stripped and lower-cased,
+            or None if the record is missing one of them.
+    """
+    values = tuple(record.get(field) for field in IDENTITY_FIELDS)
+    if not all(isinstance(value, str) for value in values):
+        return None
+    return tuple(value.strip().lower() for value in values)
+
+
+def contact_digest(record):
+    """
+    Compact 8-byte hash of a contact: its normalized identity plus every other field.
+    Contacts with the same digest are treated as duplicates.
+    """
+    identity = normalize_key(record)
+    others = {field: value for field, value in record.items() if identity is None or field not in IDENTITY_FIELDS}
+    payload = json.dumps([identity, others], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=8).digest()
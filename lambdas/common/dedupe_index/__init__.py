@@ -0,0 +1 @@
+from .dedupe_index import index_key, encode_index, decode_index, expand_records
\ No newline at end of file
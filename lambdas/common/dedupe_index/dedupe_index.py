@@ -0,0 +1,68 @@
+import sys
+import zlib
+from array import array
+
+
+def index_key(request_id):
+    """
+    S3 key of the dedupe index of a request.
+    """
+    return f"dedupe/{request_id}.idx"
+
+
+def encode_index(index):
+    """
+    Serialize a dedupe index (unique position of every original contact) as
+    zlib-compressed little-endian uint32 values.
+    """
+    values = array("I", index)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return zlib.compress(values.tobytes())
+
+
+def decode_index(data):
+    """
+    Deserialize an index written by encode_index.
+    """
+    values = array("I")
+    values.frombytes(zlib.decompress(data))
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def expand_records(records, index):
+    """
+    Re-expand unique records to the original contact order.
+    Unique ids are assigned in order of first occurrence, so the unique records
+    are consumed in order and only those referenced again later are held in memory.
+    Args:
+        records (iterable): Unique records, in unique id order.
+        index (sequence): Unique id of every original contact.
+    Yields:
+        dict: One record per original contact.
+    """
+    remaining = {}
+    for unique_id in index:
+        remaining[unique_id] = remaining.get(unique_id, 0) + 1
+
+    records = iter(records)
+    held = {}
+    next_unique_id = 0
+    for unique_id in index:
+        if unique_id == next_unique_id:
+            record = next(records)
+            next_unique_id += 1
+        elif unique_id in held:
+            record = held[unique_id]
+        else:
+            raise ValueError(f"Dedupe index references unique id {unique_id} out of order")
+
+        remaining[unique_id] -= 1
+        if remaining[unique_id]:
+            held[unique_id] = record
+        else:
+            held.pop(unique_id, None)
+            del remaining[unique_id]
+        yield record
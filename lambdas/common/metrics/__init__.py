@@ -0,0 +1 @@
+from .metrics import MAX_METRICS, MAX_VALUES, Metrics, NullMetrics, StreamTimer, metrics_from_environment
@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+NAMESPACE = "IntegrationPipeline"
+# Embedded Metric Format limits per log event
+MAX_METRICS = 100
+MAX_VALUES = 100
+
+
+class Metrics:
+    """
+    Collects the stage timings and counters of an invocation and writes them as
+    CloudWatch Embedded Metric Format (EMF) log lines. CloudWatch extracts the
+    metrics from the function's logs, so no API call is made on the hot path.
+    """
+
+    def __init__(self, service, namespace=NAMESPACE, sink=print):
+        """
+        Args:
+            service (str): Value of the "Service" dimension, the Lambda emitting the metrics.
+            namespace (str): CloudWatch namespace of the metrics.
+            sink (callable): Receives every EMF document as a JSON string; print
+                writes it to the function's log.
+        """
+        self.service = service
+        self.namespace = namespace
+        self.sink = sink
+        self.values = {}
+        self.units = {}
+        self.lock = threading.Lock()
+
+    def put(self, name, value, unit="Count"):
+        """
+        Record one observation of a metric. Every observation is kept, so
+        CloudWatch can compute percentiles over them.
+        """
+        with self.lock:
+            self.values.setdefault(name, []).append(value)
+            self.units[name] = unit
+
+    def add(self, name, value=1, unit="Count"):
+        """
+        Add to a counter, reported as a single value per flush.
+        """
+        with self.lock:
+            values = self.values.setdefault(name, [0])
+            values[0] += value
+            self.units[name] = unit
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Record the time spent in a block as the "<stage>Time" metric, in milliseconds.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.put_time(stage, time.perf_counter() - started)
+
+    def put_time(self, stage, seconds):
+        self.put(f"{stage}Time", seconds * 1000, "Milliseconds")
+
+    def put_rate(self, name, count, seconds):
+        """
+        Record a throughput, e.g. records per second.
+        """
+        if seconds > 0:
+            self.put(name, count / seconds, "Count/Second")
+
+    def flush(self):
+        """
+        Write the collected metrics and start over. Metrics with more observations
+        than EMF allows in one event are spread over several documents.
+        """
+        with self.lock:
+            values, units = self.values, self.units
+            self.values, self.units = {}, {}
+        if not values:
+            return
+
+        chunks = {
+            name: [series[start:start + MAX_VALUES] for start in range(0, len(series), MAX_VALUES)]
+            for name, series in values.items()
+        }
+        for position in range(max(len(series_chunks) for series_chunks in chunks.values())):
+            names = [name for name, series_chunks in chunks.items() if position < len(series_chunks)]
+            for start in range(0, len(names), MAX_METRICS):
+                document = self._document(names[start:start + MAX_METRICS], units)
+                for name in names[start:start + MAX_METRICS]:
+                    chunk = chunks[name][position]
+                    document[name] = chunk[0] if len(chunk) == 1 else chunk
+                self.sink(json.dumps(document))
+
+    def _document(self, names, units):
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [["Service"]],
+                        "Metrics": [{"Name": name, "Unit": units[name]} for name in names],
+                    }
+                ],
+            },
+            "Service": self.service,
+        }
+
+
+class NullMetrics(Metrics):
+    """
+    Discards every metric. Used by components created without metrics, as in tests.
+    """
+
+    def __init__(self, service=None):
+        super().__init__(service, sink=lambda document: None)
+
+    def put(self, name, value, unit="Count"):
+        pass
+
+    def add(self, name, value=1, unit="Count"):
+        pass
+
+
+def metrics_from_environment(service):
+    """
+    Metrics of a Lambda, or NullMetrics when METRICS_ENABLED is "false".
+    """
+    if os.environ.get("METRICS_ENABLED", "true").lower() == "false":
+        return NullMetrics(service)
+    return Metrics(service, namespace=os.environ.get("METRICS_NAMESPACE", NAMESPACE))
+
+
+class StreamTimer:
+    """
+    Time spent producing the items of an iterator. Streamed stages run inside
+    each other, so the time of a stage is the time of its iterator minus the
+    time of the iterator it consumes.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.items = 0
+
+    def wrap(self, iterable):
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.seconds += time.perf_counter() - started
+                return
+            self.seconds += time.perf_counter() - started
+            self.items += 1
+            yield item
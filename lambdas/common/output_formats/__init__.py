@@ -0,0 +1,9 @@
+from .output_formats import (
+    CONCATENABLE_FORMATS,
+    CONTENT_TYPES,
+    DEFAULT_OUTPUT_FORMAT,
+    FILE_EXTENSIONS,
+    OUTPUT_FORMATS,
+    STITCHABLE_FORMATS,
+    serialize_records,
+)
@@ -0,0 +1,265 @@
+import csv
+import io
+import json
+import zlib
+from decimal import Decimal
+from itertools import chain, islice
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Text output is encoded and compressed in fragments of about this size
+FRAGMENT_SIZE = 64 * 1024
+# Records read before the CSV header is written; fields first seen later are not written
+CSV_SAMPLE_RECORDS = 1000
+# Parquet row groups held back to find the type of columns that start out empty
+PARQUET_SCHEMA_GROUPS = 10
+
+CONTENT_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "ndjson.gz": "application/gzip",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+FILE_EXTENSIONS = {
+    "json": "json",
+    "ndjson": "ndjson",
+    "ndjson.gz": "ndjson.gz",
+    "csv": "csv",
+    "parquet": "parquet",
+}
+
+# Formats aggregate_results can write; split_batches validates the format a request asks for
+OUTPUT_FORMATS = tuple(CONTENT_TYPES)
+DEFAULT_OUTPUT_FORMAT = "json"
+# Formats whose files can be concatenated byte for byte into a single valid file
+CONCATENABLE_FORMATS = ("ndjson", "ndjson.gz")
+# Formats whose files can be joined into a single valid file: concatenated, or JSON arrays merged
+STITCHABLE_FORMATS = CONCATENABLE_FORMATS + ("json",)
+
+
+def _json_default(value):
+    """
+    Convert DynamoDB numbers back to plain JSON numbers.
+    """
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, set):
+        return sorted(value, key=str)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_encoder = json.JSONEncoder(default=_json_default, separators=(",", ":"))
+
+
+def serialize_records(records, output_format="json", row_group_size=10000):
+    """
+    Serialize records incrementally.
+    Args:
+        records (iterable): Records to serialize.
+        output_format (str): "json" for a compact JSON array, "ndjson" for one record
+            per line, "ndjson.gz" for gzip-compressed NDJSON, "csv", or "parquet"
+            (needs the pyarrow package).
+        row_group_size (int): Records per Parquet row group.
+    Yields:
+        bytes: Encoded fragments of the output file.
+    """
+    if output_format not in CONTENT_TYPES:
+        raise ValueError(f"Unsupported output format '{output_format}'")
+
+    if output_format == "ndjson":
+        for record in records:
+            yield (_encoder.encode(record) + "\n").encode("utf-8")
+    elif output_format == "ndjson.gz":
+        yield from _gzip(_coalesce(_encoder.encode(record) + "\n" for record in records))
+    elif output_format == "csv":
+        yield from _serialize_csv(records)
+    elif output_format == "parquet":
+        yield from _serialize_parquet(records, row_group_size)
+    else:
+        yield b"["
+        for position, record in enumerate(records):
+            prefix = "," if position else ""
+            yield (prefix + _encoder.encode(record)).encode("utf-8")
+        yield b"]"
+
+
+def _coalesce(texts):
+    """
+    Join small text fragments into encoded fragments of about FRAGMENT_SIZE bytes.
+    """
+    buffer, size = [], 0
+    for text in texts:
+        buffer.append(text)
+        size += len(text)
+        if size >= FRAGMENT_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def _gzip(fragments):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for fragment in fragments:
+        data = compressor.compress(fragment)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _serialize_csv(records):
+    """
+    CSV with the fields of the first CSV_SAMPLE_RECORDS records as columns, in
+    order of first appearance. Non-string values are written as JSON.
+    """
+    records = iter(records)
+    sample = list(islice(records, CSV_SAMPLE_RECORDS))
+    columns = list(dict.fromkeys(field for record in sample for field in record))
+    known = set(columns)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    incomplete = 0
+    for record in chain(sample, records):
+        if not known.issuperset(record):
+            incomplete += 1
+        writer.writerow([_csv_value(record.get(column)) for column in columns])
+        if buffer.tell() >= FRAGMENT_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+    if incomplete:
+        print(f"{incomplete} records had fields missing from the CSV columns {columns}")
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    return _encoder.encode(value)
+
+
+def _serialize_parquet(records, row_group_size):
+    """
+    Parquet written one row group at a time as records are read.
+    Numbers are stored as doubles, so integers and decimals can share a column,
+    and nested values as JSON strings. A column's type is taken from its first
+    values: row groups are held back (up to PARQUET_SCHEMA_GROUPS of them) until
+    every column has one, and columns still without a value are strings.
+    Raises:
+        ValueError: If pyarrow is missing, or a value does not fit its column's type.
+    """
+    if pyarrow is None:
+        raise ValueError("parquet output requires the pyarrow package")
+    records = iter(records)
+    row_group_size = max(1, row_group_size)
+
+    # Settle the schema on the first row groups
+    pending, schema = [], None
+    while len(pending) < PARQUET_SCHEMA_GROUPS:
+        rows = [_arrow_row(record) for record in islice(records, row_group_size)]
+        if not rows:
+            break
+        pending.append(rows)
+        schema = _merge_schemas(schema, _infer_schema(rows))
+        if not any(pyarrow.types.is_null(field.type) for field in schema):
+            break
+    if schema is None:
+        return
+    schema = pyarrow.schema(
+        [field.with_type(pyarrow.string()) if pyarrow.types.is_null(field.type) else field for field in schema]
+    )
+
+    sink = _FragmentSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    known = set(schema.names)
+    incomplete = 0
+    groups = chain(pending, iter(lambda: [_arrow_row(record) for record in islice(records, row_group_size)], []))
+    for rows in groups:
+        incomplete += sum(not known.issuperset(row) for row in rows)
+        writer.write_table(_arrow_table(rows, schema))
+        yield from sink.drain()
+    writer.close()
+    yield from sink.drain()
+    if incomplete:
+        print(f"{incomplete} records had fields missing from the Parquet schema {schema.names}")
+
+
+def _arrow_row(record):
+    row = {}
+    for field, value in record.items():
+        if isinstance(value, (Decimal, int)) and not isinstance(value, bool):
+            value = _arrow_number(field, value)
+        elif isinstance(value, (dict, list, set)):
+            value = _encoder.encode(value)
+        row[field] = value
+    return row
+
+
+def _arrow_number(field, value):
+    number = float(value)
+    # Doubles hold integers exactly only up to 2**53; fail rather than round larger ones
+    if abs(number) > 2 ** 53 and number.is_integer() and int(value) != int(number):
+        raise ValueError(f"Field '{field}' value {value} cannot be stored exactly in Parquet")
+    return number
+
+
+def _infer_schema(rows):
+    try:
+        return pyarrow.Table.from_pylist(rows).schema
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError) as e:
+        raise ValueError(f"Records do not share a Parquet schema: {e}") from e
+
+
+def _merge_schemas(schema, group_schema):
+    """
+    Combine the schema of a new row group with the schema so far; columns
+    without a value take the type of the group.
+    """
+    if schema is None:
+        return group_schema
+    try:
+        return pyarrow.unify_schemas([schema, group_schema])
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError) as e:
+        raise ValueError(f"Records do not share a Parquet schema: {e}") from e
+
+
+def _arrow_table(rows, schema):
+    try:
+        return pyarrow.Table.from_pylist(rows, schema=schema)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError) as e:
+        raise ValueError(f"Records do not fit the Parquet schema {schema}: {e}") from e
+
+
+class _FragmentSink(io.RawIOBase):
+    """
+    Write-only file collecting what the Parquet writer writes, so it can be streamed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.fragments = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.fragments.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        fragments, self.fragments = self.fragments, []
+        return fragments
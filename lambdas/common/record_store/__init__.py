@@ -0,0 +1 @@
+from .record_store import PARTITION_KEY, SORT_KEY, RecordStore
\ No newline at end of file
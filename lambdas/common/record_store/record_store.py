@@ -0,0 +1,130 @@
+import heapq
+
+from boto3.dynamodb.conditions import Key
+
+# Key schema of the enriched records table
+PARTITION_KEY = "request_id"
+SORT_KEY = "record_key"
+
+
+class RecordStore:
+    """
+    Key schema of the enriched records table, shared by the worker that writes
+    the records and the aggregation that reads them back.
+    Records are partitioned by request and sorted by batch and position, so a
+    request is read with range queries, already in upload order. Hot requests
+    can be write-sharded: batches are spread over several partitions,
+    "<request_id>#<shard>", which the reader merges back in order.
+    """
+
+    def __init__(self, table, shards=1):
+        """
+        Args:
+            table: boto3 DynamoDB Table resource of the records table.
+            shards (int): Partitions a request's records are spread over. Writers
+                and readers must use the same value.
+        """
+        self.table = table
+        self.shards = max(1, shards)
+
+    @staticmethod
+    def sort_key(batch_id, position):
+        """
+        Sort key of a record; zero-padded so keys sort in batch and position order.
+        """
+        return f"{batch_id:06d}#{position:05d}"
+
+    def partition(self, request_id, batch_id):
+        """
+        Partition key value holding a batch of a request.
+        """
+        if self.shards == 1:
+            return request_id
+        return f"{request_id}#{batch_id % self.shards}"
+
+    def keyed(self, record, request_id, batch_id, position):
+        """
+        Return a copy of a record with its storage keys.
+        """
+        return {
+            **record,
+            PARTITION_KEY: self.partition(request_id, batch_id),
+            SORT_KEY: self.sort_key(batch_id, position),
+        }
+
+    def partitions(self, request_id):
+        """
+        Partition key values holding the records of a request.
+        """
+        if self.shards == 1:
+            return [request_id]
+        return [f"{request_id}#{shard}" for shard in range(self.shards)]
+
+    def read(self, request_id):
+        """
+        Read the records of a request in batch and position order.
+        Each shard is paged lazily with a query; shards are merged on the sort key.
+        Yields:
+            dict: One record at a time, with "request_id" set to the request.
+        """
+        yield from self.merge([self.query(partition) for partition in self.partitions(request_id)], request_id)
+
+    def merge(self, partitions, request_id):
+        """
+        Merge the ordered records of a request's partitions on the sort key.
+        Args:
+            partitions (list): One iterable of records per partition, in sort key order.
+            request_id (str): The request, set as the partition key of sharded records.
+        Yields:
+            dict: One record at a time, in batch and position order.
+        """
+        if self.shards == 1:
+            yield from partitions[0]
+            return
+        for item in heapq.merge(*partitions, key=lambda item: item[SORT_KEY]):
+            item[PARTITION_KEY] = request_id
+            yield item
+
+    def query(self, partition, first_batch=None, end_batch=None):
+        """
+        Page through the records of a partition in sort key order.
+        Args:
+            partition (str): Partition key value.
+            first_batch (int): First batch to read, or None to start at the first record.
+            end_batch (int): Batch to stop before, or None to read to the last record.
+        Yields:
+            dict: One record at a time.
+        """
+        for page in self.query_pages(partition, first_batch, end_batch):
+            yield from page
+
+    def query_pages(self, partition, first_batch=None, end_batch=None, client=None):
+        """
+        Same as query, one page of records at a time.
+        Args:
+            client: DynamoDB client of the table's resource to query with instead of
+                the Table resource, which is not thread-safe.
+        Yields:
+            list: The records of each query response.
+        """
+        condition = Key(PARTITION_KEY).eq(partition)
+        # Sort keys of a batch start with its padded id followed by "#", so they sort after the bare id
+        if first_batch is not None and end_batch is not None:
+            condition &= Key(SORT_KEY).between(f"{first_batch:06d}", f"{end_batch:06d}")
+        elif first_batch is not None:
+            condition &= Key(SORT_KEY).gte(f"{first_batch:06d}")
+        elif end_batch is not None:
+            condition &= Key(SORT_KEY).lt(f"{end_batch:06d}")
+        query_kwargs = {"KeyConditionExpression": condition}
+        if client is not None:
+            query_kwargs["TableName"] = self.table.name
+        query = client.query if client is not None else self.table.query
+        while True:
+            response = query(**query_kwargs)
+            if response.get("Items"):
+                yield response["Items"]
+
+            last_evaluated_key = response.get("LastEvaluatedKey")
+            if not last_evaluated_key:
+                return
+            query_kwargs["ExclusiveStartKey"] = last_evaluated_key
@@ -0,0 +1,11 @@
+from .result_parts import (
+    RESULT_PARTS_PREFIX,
+    RESULT_SEGMENTS_PREFIX,
+    part_batch_id,
+    part_key,
+    parts_prefix,
+    segment_batches,
+    segment_group,
+    segment_key,
+    segments_prefix,
+)
@@ -0,0 +1,62 @@
+from ..output_formats import FILE_EXTENSIONS
+
+# Prefix of the S3 objects holding the output of each processed batch
+RESULT_PARTS_PREFIX = "parts/"
+
+
+def parts_prefix(request_id):
+    """
+    S3 prefix of the result parts of a request.
+    """
+    return f"{RESULT_PARTS_PREFIX}{request_id}/"
+
+
+def part_key(request_id, batch_id, output_format):
+    """
+    S3 key of the result part of a batch; zero-padded so parts list in batch order.
+    """
+    return f"{parts_prefix(request_id)}{batch_id:06d}.{FILE_EXTENSIONS[output_format]}"
+
+
+def part_batch_id(key):
+    """
+    Batch of a result part, from its key.
+    """
+    return int(key.rsplit("/", 1)[-1].split(".", 1)[0])
+
+
+
+# Prefix of the S3 objects joining the parts of a range of batches, large enough
+# for the aggregation to copy them as multipart upload parts
+RESULT_SEGMENTS_PREFIX = "segments/"
+
+
+def segment_group(batch_id, group_size):
+    """
+    First and last batch of the range of group_size batches holding a batch.
+    Batch ids start at 1.
+    """
+    first_batch = (batch_id - 1) // group_size * group_size + 1
+    return first_batch, first_batch + group_size - 1
+
+
+def segments_prefix(request_id):
+    """
+    S3 prefix of the result segments of a request.
+    """
+    return f"{RESULT_SEGMENTS_PREFIX}{request_id}/"
+
+
+def segment_key(request_id, first_batch, last_batch, output_format):
+    """
+    S3 key of the segment joining the parts of batches first_batch to last_batch.
+    """
+    return f"{segments_prefix(request_id)}{first_batch:06d}-{last_batch:06d}.{FILE_EXTENSIONS[output_format]}"
+
+
+def segment_batches(key):
+    """
+    First and last batch of a result segment, from its key.
+    """
+    first_batch, last_batch = key.rsplit("/", 1)[-1].split(".", 1)[0].split("-")
+    return int(first_batch), int(last_batch)
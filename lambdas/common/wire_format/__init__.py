@@ -0,0 +1 @@
+from .wire_format import WIRE_FORMAT_VERSION, COMPRESSIONS, encode_batch, decode_batch, unpack_message
\ No newline at end of file
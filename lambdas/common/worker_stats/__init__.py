@@ -0,0 +1 @@
+from .worker_stats import WORKER_STATS_KEY
\ No newline at end of file
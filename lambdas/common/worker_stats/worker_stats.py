@@ -0,0 +1,3 @@
+# Control table item where workers publish their recent processing latency.
+# It shares the request_id key space, so the name cannot collide with a UUID.
+WORKER_STATS_KEY = "__worker_stats__"
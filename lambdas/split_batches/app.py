@@ -1,10 +1,18 @@
 import os
 import json
 
+from ..common.metrics import metrics_from_environment
+from ..common.output_formats import OUTPUT_FORMATS
 from .batch_splitter import BatchSplitter
+from .batch_sizing_policy import BatchSizingPolicy
 from .sqs_queue import SQSQueue
 from .control_table import DynamoDBControlTable
+from .contact_deduplicator import ContactDeduplicator
 from .request_processor import RequestProcessor
+from .contact_stream import iter_contacts
+from .s3_range_planner import S3RangePlanner
+
+metrics = metrics_from_environment("split_batches")
 
 
 def lambda_handler(event, context):
@@ -17,18 +25,59 @@ def lambda_handler(event, context):
         dict: HTTP response indicating success or failure.
     """
     try:
-        payload = json.loads(event["body"])
-        batch_splitter = BatchSplitter(batch_size=100)
-        sqs_queue = SQSQueue(queue_url=os.environ["SQS_QUEUE_URL"])
+        body = event["body"]
+        try:
+            # Contacts are parsed one at a time as batches are sent
+            payload = {"contacts": iter_contacts(body)}
+        except KeyError:
+            # Otherwise the contacts must be staged in S3
+            payload = json.loads(body)
+            if "source" not in payload:
+                raise KeyError("contacts")
+        # The output format is a query string parameter, or a field of S3-staged requests
+        output_format = (event.get("queryStringParameters") or {}).get("output_format") or payload.get("output_format")
+        if output_format is not None and output_format not in OUTPUT_FORMATS:
+            return {
+                "statusCode": 400,
+                "body": json.dumps(
+                    {"error": f"Unsupported output format '{output_format}', expected one of {list(OUTPUT_FORMATS)}"}
+                ),
+            }
+        payload["output_format"] = output_format
         dynamodb_table = DynamoDBControlTable(table_name=os.environ["DYNAMO_TABLE_NAME"])
+        worker_stats = dynamodb_table.get_worker_stats()
+        policy = BatchSizingPolicy(
+            max_records=int(os.environ.get("MAX_BATCH_SIZE", "100")),
+            time_budget_seconds=float(os.environ.get("BATCH_TIME_BUDGET_SECONDS", "5")),
+            seconds_per_record=float(worker_stats["seconds_per_record"]) if "seconds_per_record" in worker_stats else None,
+        )
+        batch_splitter = BatchSplitter(policy=policy)
+        sqs_queue = SQSQueue(
+            queue_url=os.environ["SQS_QUEUE_URL"],
+            claim_check_bucket=os.environ.get("CLAIM_CHECK_BUCKET", os.environ.get("S3_BUCKET_NAME")),
+            wire_format=os.environ.get("MESSAGE_WIRE_FORMAT", "json"),
+            compression=os.environ.get("MESSAGE_COMPRESSION", "zlib"),
+        )
+
+        deduplicator = None
+        if os.environ.get("DEDUPLICATE_CONTACTS", "false").lower() == "true":
+            deduplicator = ContactDeduplicator(bucket_name=os.environ["S3_BUCKET_NAME"])
 
         processor = RequestProcessor(
             sqs_queue=sqs_queue, 
             batch_splitter=batch_splitter,
-            dynamodb_table=dynamodb_table
+            dynamodb_table=dynamodb_table,
+            deduplicator=deduplicator,
+            range_planner=S3RangePlanner(batch_size=batch_splitter.batch_size),
+            metrics=metrics,
             )
 
         result = processor.process(payload)
+        if result.get("status") == "failed":
+            return {
+                "statusCode": 400,
+                "body": json.dumps(result),
+            }
 
         return {
             "statusCode": 200,
@@ -51,4 +100,7 @@ def lambda_handler(event, context):
         return {
             "statusCode": 500,
             "body": json.dumps({"error": "Internal server error"}),
-        }
\ No newline at end of file
+        }
+
+    finally:
+        metrics.flush()
\ No newline at end of file
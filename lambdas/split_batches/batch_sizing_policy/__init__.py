@@ -0,0 +1 @@
+from .batch_sizing_policy import BatchSizingPolicy
\ No newline at end of file
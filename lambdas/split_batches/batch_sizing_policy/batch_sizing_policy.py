@@ -0,0 +1,57 @@
+import json
+import math
+
+# Stay below the size at which SQSQueue moves a batch to a claim check
+DEFAULT_MAX_BYTES = 200 * 1024
+
+
+class BatchSizingPolicy:
+    """
+    Decides where BatchSplitter cuts a batch.
+    A batch ends when it reaches the record limit or when the next contact
+    would push its estimated serialized size over the byte limit. The record
+    limit is lowered when the observed worker latency says a full batch would
+    not finish within the time budget of one worker invocation.
+    """
+
+    def __init__(self, max_records=100, max_bytes=DEFAULT_MAX_BYTES, time_budget_seconds=None,
+                 seconds_per_record=None):
+        """
+        Initializes the BatchSizingPolicy instance.
+        Args:
+            max_records (int): Largest number of contacts in a batch.
+            max_bytes (int): Largest estimated JSON size of a batch, in bytes.
+            time_budget_seconds (float): Time a worker may spend on one batch, a
+                margin below the worker timeout and the SQS visibility timeout.
+            seconds_per_record (float): Recent worker processing time per contact,
+                or None if unknown.
+        """
+        self.max_records = max(1, max_records)
+        self.max_bytes = max_bytes
+        self.time_budget_seconds = time_budget_seconds
+        self.seconds_per_record = seconds_per_record
+
+    def record_limit(self):
+        """
+        Returns:
+            int: Number of contacts after which a batch is cut.
+        """
+        if not self.time_budget_seconds or not self.seconds_per_record:
+            return self.max_records
+        return max(1, min(self.max_records, math.floor(self.time_budget_seconds / self.seconds_per_record)))
+
+    @staticmethod
+    def estimate_bytes(contact):
+        """
+        Estimated size of a contact in a JSON-encoded batch, separator included.
+        """
+        return len(json.dumps(contact, separators=(",", ":"))) + 1
+
+    def fits(self, records, size, contact_bytes):
+        """
+        Whether a contact of contact_bytes can join a batch of records contacts
+        and size bytes. A batch always takes at least one contact.
+        """
+        if not records:
+            return True
+        return records < self.record_limit() and size + contact_bytes <= self.max_bytes
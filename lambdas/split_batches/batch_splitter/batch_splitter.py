@@ -1,10 +1,41 @@
+from itertools import islice
+
+
 class BatchSplitter:
     """ Class to split a batch into smaller batches """
 
-    def __init__(self, batch_size):
-        self.batch_size = batch_size
+    def __init__(self, batch_size=None, policy=None):
+        """
+        Args:
+            batch_size (int): Number of contacts per batch, when no policy is given.
+            policy (BatchSizingPolicy): Cuts batches by record count, estimated
+                bytes and observed worker latency.
+        """
+        if batch_size is None and policy is None:
+            raise ValueError("Either batch_size or policy is required")
+        self.policy = policy
+        self.batch_size = policy.record_limit() if policy is not None else batch_size
 
     def split(self, data):
-        """ Split the data into batches """
-        for i in range(0, len(data), self.batch_size):
-            yield data[i: i + self.batch_size]
+        """ Split the data into batches, consuming any iterable lazily """
+        if self.policy is not None:
+            yield from self._split_by_policy(data)
+            return
+        iterator = iter(data)
+        while True:
+            batch = list(islice(iterator, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def _split_by_policy(self, data):
+        batch, size = [], 0
+        for contact in data:
+            contact_bytes = self.policy.estimate_bytes(contact)
+            if not self.policy.fits(len(batch), size, contact_bytes):
+                yield batch
+                batch, size = [], 0
+            batch.append(contact)
+            size += contact_bytes
+        if batch:
+            yield batch
@@ -0,0 +1 @@
+from .contact_deduplicator import ContactDeduplicator
\ No newline at end of file
@@ -0,0 +1,59 @@
+from array import array
+
+from ...common.aws_clients import lazy_client
+from ...common.contact_key import contact_digest
+from ...common.dedupe_index import index_key, encode_index
+
+
+class ContactDeduplicator:
+    """
+    Removes duplicate contacts from a request before it is split into batches.
+    """
+
+    def __init__(self, bucket_name):
+        """
+        Initializes the ContactDeduplicator instance.
+        Args:
+            bucket_name (str): S3 bucket where the dedupe index is stored for aggregation.
+        """
+        self.bucket_name = bucket_name
+        self.s3_client = lazy_client("s3")
+
+    def deduplicate(self, contacts):
+        """
+        Keeps the first occurrence of every contact in a single streaming pass.
+        Contacts are compared on an 8-byte hash of their normalized identity and other fields.
+        Args:
+            contacts (iterable): Contacts in upload order.
+        Returns:
+            tuple: An iterator over the unique contacts, in order of first occurrence,
+                and an array that receives the unique id of every original contact
+                as the iterator is consumed.
+        """
+        index = array("I")
+        return self._unique(contacts, index), index
+
+    @staticmethod
+    def _unique(contacts, index):
+        unique_ids = {}
+        for contact in contacts:
+            digest = contact_digest(contact)
+            unique_id = unique_ids.get(digest)
+            if unique_id is None:
+                unique_id = unique_ids[digest] = len(unique_ids)
+                yield contact
+            index.append(unique_id)
+
+    def save_index(self, request_id, index):
+        """
+        Stores the dedupe index so the aggregation can restore the original order.
+        Args:
+            request_id (str): The unique ID for the request.
+            index (array): Unique id of every original contact.
+        """
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=index_key(request_id),
+            Body=encode_index(index),
+            ContentType="application/octet-stream",
+        )
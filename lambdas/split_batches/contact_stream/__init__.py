@@ -0,0 +1 @@
+from .contact_stream import iter_contacts
\ No newline at end of file
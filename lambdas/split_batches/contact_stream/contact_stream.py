@@ -0,0 +1,77 @@
+import json
+import re
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+
+def iter_contacts(body, key="contacts"):
+    """
+    Incrementally parse the contacts of a request body.
+    Only one contact is decoded at a time instead of the whole body. The body is
+    scanned up to the contacts array right away, so a missing field is reported
+    before any contact is consumed.
+    Args:
+        body (str): JSON request body, an object with a "contacts" array.
+        key (str): Name of the array to stream.
+    Returns:
+        generator: Yields the contacts one by one.
+    Raises:
+        KeyError: If the body has no such field.
+        ValueError: If the body is not valid JSON of the expected shape.
+    """
+    position = _find_array(body, key)
+    return _iter_array(body, position)
+
+
+def _find_array(body, key):
+    """
+    Return the position right after the opening bracket of the array stored under key.
+    """
+    position = _skip(body, 0)
+    if body[position:position + 1] != "{":
+        raise ValueError("Request body must be a JSON object")
+    position = _skip(body, position + 1)
+
+    while body[position:position + 1] != "}":
+        name, position = _decoder.raw_decode(body, position)
+        if not isinstance(name, str):
+            raise ValueError("Expected a field name")
+        position = _expect(body, position, ":")
+
+        if name == key:
+            if body[position:position + 1] != "[":
+                raise ValueError(f"Field '{key}' must be an array")
+            return position + 1
+
+        # Decode and discard any other field
+        _, position = _decoder.raw_decode(body, position)
+        position = _skip(body, position)
+        if body[position:position + 1] == ",":
+            position = _skip(body, position + 1)
+    raise KeyError(key)
+
+
+def _iter_array(body, position):
+    position = _skip(body, position)
+    if body[position:position + 1] == "]":
+        return
+    while True:
+        item, position = _decoder.raw_decode(body, position)
+        yield item
+        position = _skip(body, position)
+        separator = body[position:position + 1]
+        if separator == "]":
+            return
+        position = _expect(body, position, ",")
+
+
+def _skip(body, position):
+    return _WHITESPACE.match(body, position).end()
+
+
+def _expect(body, position, token):
+    position = _skip(body, position)
+    if body[position:position + 1] != token:
+        raise ValueError(f"Expected '{token}' at position {position}")
+    return _skip(body, position + 1)
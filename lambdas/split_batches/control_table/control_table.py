@@ -1,4 +1,8 @@
-import boto3
+import time
+
+from ...common.aws_clients import lazy_client, lazy_table
+from ...common.completion import notify_completion
+from ...common.worker_stats import WORKER_STATS_KEY
 
 class DynamoDBControlTable:
     """
@@ -12,20 +16,56 @@ class DynamoDBControlTable:
             table_name (str): The name of the DynamoDB table.
         """
         self.table_name = table_name
-        self.dynamodb = boto3.resource("dynamodb")
-        self.table = self.dynamodb.Table(table_name)
+        self.table = lazy_table(table_name)
+        self.sfn_client = lazy_client("stepfunctions")
 
-    def initialize_request(self, request_id, total_batches):
+    def initialize_request(self, request_id, total_batches=None, **attributes):
         """
-        Initialize a record in the control table.
+        Initialize a record in the control table, with its creation time for
+        the throughput reported by the status endpoint.
+        Args:
+            request_id (str): The unique ID for the request.
+            total_batches (int): The total number of batches for the request, or None
+                if it is only known once splitting finishes (see finalize_request).
+            **attributes: Additional attributes stored on the record.
+        """
+        item = {
+            **attributes,
+            "request_id": request_id,
+            "processed_batches": 0,
+            "created_at": int(time.time()),
+        }
+        if total_batches is not None:
+            item["expected_batches"] = total_batches
+        self.table.put_item(Item=item)
+
+    def finalize_request(self, request_id, total_batches, **attributes):
+        """
+        Record the number of batches once every batch has been queued.
+        Workers may already have processed all of them, in which case the
+        waiting execution is resumed from here.
         Args:
             request_id (str): The unique ID for the request.
             total_batches (int): The total number of batches for the request.
+            **attributes: Additional attributes stored on the record.
         """
-        self.table.put_item(
-            Item={
-                "request_id": request_id,
-                "expected_batches": total_batches,
-                "processed_batches": 0
-            }
+        values = {**attributes, "expected_batches": total_batches}
+        names = {f"#a{position}": name for position, name in enumerate(values)}
+        response = self.table.update_item(
+            Key={"request_id": request_id},
+            UpdateExpression="SET " + ", ".join(f"{alias} = :v{alias[2:]}" for alias in names),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={f":v{position}": value for position, value in enumerate(values.values())},
+            ReturnValues="ALL_NEW",
         )
+        notify_completion(response["Attributes"], self.sfn_client)
+
+    def get_worker_stats(self):
+        """
+        Read the processing latency recently published by the workers.
+        Returns:
+            dict: The stats item, with "seconds_per_record", or an empty dict if
+                no worker has reported yet.
+        """
+        response = self.table.get_item(Key={"request_id": WORKER_STATS_KEY})
+        return response.get("Item", {})
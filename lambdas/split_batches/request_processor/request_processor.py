@@ -1,47 +1,183 @@
+import time
 import uuid
+from itertools import count
+
+from ...common.metrics import NullMetrics, StreamTimer
 
 class RequestProcessor:
     """
     Processes the incoming request to split and enqueue contacts.
     """
 
-    def __init__(self, sqs_queue, batch_splitter, dynamodb_table):
+    def __init__(self, sqs_queue, batch_splitter, dynamodb_table, deduplicator=None, range_planner=None, metrics=None):
         """
         Initializes the RequestProcessor instance.
         Args:
             sqs_queue (SQSQueue): Instance of SQSQueue.
             batch_splitter (BatchSplitter): Instance of BatchSplitter.
             dynamodb_table (DynamoDBControlTable): Instance of DynamoDBControlTable.
+            deduplicator (ContactDeduplicator): Optional stage that enqueues each distinct contact once.
+            range_planner (S3RangePlanner): Plans the batches of requests staged in S3.
+            metrics (Metrics): Receives the stage timings and counts of each request.
         """
         self.sqs_queue = sqs_queue
         self.batch_splitter = batch_splitter
         self.dynamodb_table = dynamodb_table
+        self.deduplicator = deduplicator
+        self.range_planner = range_planner
+        self.metrics = metrics if metrics is not None else NullMetrics()
 
     def process(self, payload):
         """
         Processes the incoming request.
-        Splits the contacts into batches, sends them to SQS, and initializes the DynamoDB control table.
+        Streams the contacts into batches and sends each batch to SQS as soon as it
+        is full, so the contact list is never fully materialized. The DynamoDB
+        control table record is created first and receives the batch count at the end.
+        If the contacts turn out to be malformed partway through, the batches
+        already read are still sent and counted, and the request is recorded
+        as failed instead of being left without a batch count.
         Args:
-            payload (dict): The incoming payload containing contacts.
+            payload (dict): The incoming payload containing contacts, as a list or an iterator,
+                and optionally the "output_format" of the aggregated file.
         Returns:
-            dict: Metadata about the processed request.
+            dict: Metadata about the processed request, with a "failed" status and
+                the "error" when the contacts could not be parsed.
         """
+        if "source" in payload and "contacts" not in payload:
+            return self.process_source(payload["source"], payload.get("output_format"))
+
         # Generate a unique request ID
         request_id = str(uuid.uuid4())
 
-        # Split contacts into batches
-        contacts = payload["contacts"]
-        batches = list(self.batch_splitter.split(contacts))
-        total_batches = len(batches)
+        # Parsing, splitting and sending are streamed into each other and timed apart
+        parse_timer, split_timer = StreamTimer(), StreamTimer()
+        parse_errors = []
+        contacts = _until_invalid(parse_timer.wrap(payload["contacts"]), parse_errors)
+        contact_count = count()
+        contacts = (contact for contact, _ in zip(contacts, contact_count))
+
+        # Drop duplicate contacts and keep the index needed to restore them in the output
+        index = None
+        if self.deduplicator is not None:
+            contacts, index = self.deduplicator.deduplicate(contacts)
 
-        # Initialize DynamoDB record for the request
-        self.dynamodb_table.initialize_request(request_id, total_batches)
+        # Initialize DynamoDB record for the request before workers can report progress
+        output_format = payload.get("output_format")
+        self.dynamodb_table.initialize_request(request_id, **_format_attributes(output_format))
 
-        # Send each batch to the SQS queue
-        for batch_id, batch in enumerate(batches, start=1):
-            self.sqs_queue.send_message(batch, request_id, batch_id)
+        # Split contacts into batches and send them to the SQS queue as they fill
+        batches = split_timer.wrap(self.batch_splitter.split(contacts))
+        started = time.perf_counter()
+        report = self.sqs_queue.send_batches(batches, request_id)
+        elapsed = time.perf_counter() - started
+        total_batches = report["total"]
+        if report["failed"]:
+            self._fail_enqueue(request_id, report, "batches", total_contacts=next(contact_count))
+
+        total_contacts = next(contact_count)
+        # Unique ids are assigned in order, so the largest one gives the unique count
+        unique_contacts = max(index, default=-1) + 1 if index is not None else total_contacts
+        attributes = {"total_contacts": total_contacts}
+        if parse_errors:
+            attributes.update(status="failed", error=f"Invalid request body: {parse_errors[0]}")
+        elif index is not None and unique_contacts < total_contacts:
+            self.deduplicator.save_index(request_id, index)
+            attributes["unique_contacts"] = unique_contacts
+
+        # Record the number of batches now that it is known
+        self.dynamodb_table.finalize_request(request_id, total_batches, **attributes)
+        if parse_errors:
+            print(f"Request {request_id} failed after {total_contacts} contacts: {parse_errors[0]}")
+            self.metrics.add("InvalidRequests", 1)
+            return {
+                "request_id": request_id,
+                "status": "failed",
+                "error": attributes["error"],
+                "total_batches": total_batches,
+                "total_contacts": total_contacts,
+            }
+
+        self.metrics.put_time("Parse", parse_timer.seconds)
+        # Includes deduplication
+        self.metrics.put_time("Split", split_timer.seconds - parse_timer.seconds)
+        self.metrics.put_time("Enqueue", elapsed - split_timer.seconds)
+        self.metrics.add("Contacts", total_contacts)
+        self.metrics.add("Batches", total_batches)
+        self.metrics.put_rate("ContactsPerSecond", total_contacts, elapsed)
 
         return {
             "request_id": request_id,
             "total_batches": total_batches,
+            "total_contacts": total_contacts,
+            "unique_contacts": unique_contacts,
+            **_format_attributes(output_format),
+        }
+
+    def process_source(self, source, output_format=None):
+        """
+        Processes a request whose contacts are staged in an S3 NDJSON or CSV file.
+        Enqueues one byte range descriptor per batch; workers read their range
+        with a ranged GET instead of receiving the contacts in the message.
+        Args:
+            source (dict): "bucket", "key" and "format" of the staged file.
+            output_format (str): Format of the aggregated file, or None for the default.
+        Returns:
+            dict: Metadata about the processed request.
+        """
+        if self.range_planner is None:
+            raise ValueError("S3-staged requests are not enabled")
+
+        request_id = str(uuid.uuid4())
+        with self.metrics.timer("Plan"):
+            ranges = self.range_planner.plan(source)
+
+        self.dynamodb_table.initialize_request(request_id, **_format_attributes(output_format))
+        with self.metrics.timer("Enqueue"):
+            report = self.sqs_queue.send_batches(ranges, request_id)
+        if report["failed"]:
+            self._fail_enqueue(request_id, report, "ranges")
+        self.dynamodb_table.finalize_request(request_id, report["total"])
+        self.metrics.add("Batches", report["total"])
+
+        return {
+            "request_id": request_id,
+            "total_batches": report["total"],
+            **_format_attributes(output_format),
         }
+
+
+    def _fail_enqueue(self, request_id, report, unit, **attributes):
+        """
+        Mark a request whose batches could not all be enqueued as failed, with
+        the batches that were enqueued as its batch count, so whoever waits on
+        it is released, then raise.
+        Raises:
+            RuntimeError: Always.
+        """
+        error = (
+            f"Failed to enqueue {len(report['failed'])} of {report['total']} {unit} "
+            f"for request {request_id}: {report['failed']}"
+        )
+        self.metrics.add("FailedRequests", 1)
+        self.dynamodb_table.finalize_request(
+            request_id, report["total"] - len(report["failed"]), status="failed", error=error, **attributes
+        )
+        raise RuntimeError(error)
+
+
+def _until_invalid(contacts, errors):
+    """
+    Yield contacts until the stream is exhausted or fails to parse; a parse
+    error ends the stream and is appended to errors.
+    """
+    try:
+        yield from contacts
+    except ValueError as e:
+        errors.append(e)
+
+
+def _format_attributes(output_format):
+    """
+    The output format stored on the control item, omitted when the default applies.
+    """
+    return {"output_format": output_format} if output_format else {}
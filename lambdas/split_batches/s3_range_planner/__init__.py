@@ -0,0 +1 @@
+from .s3_range_planner import S3RangePlanner
\ No newline at end of file
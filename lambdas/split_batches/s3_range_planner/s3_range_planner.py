@@ -0,0 +1,77 @@
+import csv
+import io
+import math
+
+from ...common.aws_clients import lazy_client
+
+SUPPORTED_FORMATS = ("ndjson", "csv")
+
+
+class S3RangePlanner:
+    """
+    Plans byte ranges over a staged NDJSON or CSV contact file in S3.
+    Each range becomes one batch: a worker reads it with a ranged GET and parses
+    the records that start inside it, so the splitter never downloads the file.
+    """
+
+    def __init__(self, batch_size, sample_bytes=64 * 1024):
+        """
+        Initializes the S3RangePlanner instance.
+        Args:
+            batch_size (int): Target number of records per range.
+            sample_bytes (int): Bytes read from the start of the file to read the CSV
+                header and estimate the average record size.
+        """
+        self.batch_size = batch_size
+        self.sample_bytes = sample_bytes
+        self.s3_client = lazy_client("s3")
+
+    def plan(self, source):
+        """
+        Splits a staged file into record-aligned byte ranges.
+        A record belongs to the range in which it starts; workers read past the end
+        of their range to finish the last record and skip a partial first record.
+        Args:
+            source (dict): "bucket", "key" and "format" ("ndjson" or "csv") of the file.
+        Returns:
+            list: One range descriptor per batch, with the source plus "start", "end",
+                "data_start" and "size" byte offsets, and "columns" for CSV files.
+        """
+        file_format = source.get("format", "ndjson")
+        if file_format not in SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported source format '{file_format}'")
+        bucket, key = source["bucket"], source["key"]
+
+        size = self.s3_client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        if size == 0:
+            return []
+        sample = self.s3_client.get_object(
+            Bucket=bucket, Key=key, Range=f"bytes=0-{min(self.sample_bytes, size) - 1}"
+        )["Body"].read()
+
+        descriptor = {"bucket": bucket, "key": key, "format": file_format, "size": size}
+        data_start = 0
+        if file_format == "csv":
+            header_end = sample.find(b"\n")
+            if header_end < 0:
+                raise ValueError("CSV header must fit in the sample read from the start of the file")
+            data_start = header_end + 1
+            descriptor["columns"] = next(csv.reader(io.StringIO(sample[:header_end].decode("utf-8").rstrip("\r"))))
+        descriptor["data_start"] = data_start
+
+        # Estimate the average record size from the complete lines of the sample
+        sample_data = sample[data_start:]
+        last_newline = sample_data.rfind(b"\n")
+        lines = sample_data[:last_newline + 1].count(b"\n") if last_newline >= 0 else 0
+        record_bytes = (last_newline + 1) / lines if lines else max(len(sample_data), 1)
+
+        range_bytes = max(int(record_bytes * self.batch_size), 1)
+        total_ranges = math.ceil((size - data_start) / range_bytes)
+        return [
+            {
+                **descriptor,
+                "start": data_start + position * range_bytes,
+                "end": min(data_start + (position + 1) * range_bytes, size),
+            }
+            for position in range(total_ranges)
+        ]
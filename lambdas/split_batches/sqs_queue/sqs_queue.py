@@ -1,18 +1,53 @@
 import json
-import boto3
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from botocore.exceptions import ClientError
+
+from ...common.aws_clients import lazy_client
+from ...common.claim_check import claim_check_key, pack_batch
+from ...common.wire_format import encode_batch
+
+# SendMessageBatch limits: 10 entries and 256 KB for the whole request
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 256 * 1024
+RETRY_BACKOFF = 0.1
+# Message bodies above this size are stored in S3 and replaced by a claim check
+CLAIM_CHECK_THRESHOLD = 240 * 1024
+WIRE_FORMATS = ("json", "compact")
+
 
 class SQSQueue:
     """
     A class to interact with an SQS queue.
     """
-    def __init__(self, queue_url):
+    def __init__(self, queue_url, max_workers=8, max_retries=3, claim_check_bucket=None,
+                 claim_check_threshold=CLAIM_CHECK_THRESHOLD, wire_format="json", compression="zlib"):
         """
         Initializes the SQSQueue instance.
         Args:
             queue_url (str): The URL of the SQS queue.
+            max_workers (int): Number of SendMessageBatch calls in flight at once.
+            max_retries (int): Retries for entries that SQS reports as failed.
+            claim_check_bucket (str): S3 bucket for batches too large for a message.
+                Without it oversized batches are sent as is and rejected by SQS.
+            claim_check_threshold (int): Message size in bytes above which the
+                batch is stored in S3.
+            wire_format (str): "json" sends the contacts as a plain list, "compact"
+                packs them as a column header plus rows.
+            compression (str): Compression of compact batches, "none", "zlib" or "zstd".
         """
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError(f"Unsupported wire format '{wire_format}'")
         self.queue_url = queue_url
-        self.sqs_client = boto3.client("sqs")
+        self.sqs_client = lazy_client("sqs")
+        self.s3_client = lazy_client("s3") if claim_check_bucket else None
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.claim_check_bucket = claim_check_bucket
+        self.claim_check_threshold = claim_check_threshold
+        self.wire_format = wire_format
+        self.compression = compression
 
     def send_message(self, batch, request_id, batch_id):
         """
@@ -22,12 +57,134 @@ class SQSQueue:
             request_id (str): Unique identifier for the request.
             batch_id (int): Identifier for the current batch.
         """
+        self.sqs_client.send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=self._encode(batch, request_id, batch_id),
+        )
+
+    def send_batches(self, batches, request_id, start=1):
+        """
+        Sends several batches of contacts using SendMessageBatch.
+        Messages are packed up to 10 per call without exceeding the 256 KB
+        request limit, and the calls run on a bounded thread pool. Batches are
+        consumed lazily and each request is sent as soon as it is full, so at
+        most a few requests are held in memory at a time. Only the entries that
+        SQS reports as failed are retried.
+        Args:
+            batches (iterable): Batches of contacts, or S3 range descriptors, in order.
+            request_id (str): Unique identifier for the request.
+            start (int): Identifier of the first batch.
+        Returns:
+            dict: Delivery report with the "total" number of batches, the number
+                of "sent" messages and the ids of the "failed" batches.
+        """
+        report = {"total": 0, "sent": 0, "failed": []}
+        entries = (
+            {"Id": str(batch_id), "MessageBody": self._encode(batch, request_id, batch_id)}
+            for batch_id, batch in enumerate(batches, start=start)
+        )
+
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for group in self._pack(entries):
+                report["total"] += len(group)
+                if len(in_flight) >= self.max_workers * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self._collect(done, report)
+                in_flight.add(executor.submit(self._send_group, group))
+            self._collect(in_flight, report)
+
+        report["failed"].sort()
+        return report
+
+    @staticmethod
+    def _collect(futures, report):
+        for future in futures:
+            sent, failed = future.result()
+            report["sent"] += sent
+            report["failed"].extend(failed)
+
+    def _send_group(self, entries):
+        """
+        Sends one SendMessageBatch request and retries its failed entries.
+        Returns:
+            tuple: Number of messages sent and the ids of the batches that failed.
+        """
+        sent, rejected = 0, []
+        pending = entries
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            try:
+                response = self.sqs_client.send_message_batch(QueueUrl=self.queue_url, Entries=pending)
+            except ClientError as e:
+                print(f"Error sending message batch to SQS: {e}")
+                continue
+
+            sent += len(response.get("Successful", []))
+            retryable = set()
+            for failure in response.get("Failed", []):
+                # Sender faults (e.g. an oversized message) will not succeed on retry
+                if failure.get("SenderFault"):
+                    print(f"SQS rejected batch {failure['Id']}: {failure.get('Message')}")
+                    rejected.append(failure["Id"])
+                else:
+                    retryable.add(failure["Id"])
+            pending = [entry for entry in pending if entry["Id"] in retryable]
+            if not pending:
+                break
+        return sent, [int(entry_id) for entry_id in rejected] + [int(entry["Id"]) for entry in pending]
+
+    @staticmethod
+    def _pack(entries):
+        """
+        Packs entries into groups of at most 10 entries and 256 KB.
+        Yields:
+            list: One group of entries per SendMessageBatch request.
+        """
+        group, group_bytes = [], 0
+        for entry in entries:
+            entry_bytes = len(entry["MessageBody"].encode("utf-8"))
+            if group and (len(group) == MAX_BATCH_ENTRIES or group_bytes + entry_bytes > MAX_BATCH_BYTES):
+                yield group
+                group, group_bytes = [], 0
+            group.append(entry)
+            group_bytes += entry_bytes
+        if group:
+            yield group
+
+    def _encode(self, batch, request_id, batch_id):
         message = {
             "request_id": request_id,
             "batch_id": batch_id,
-            "batch": batch,
         }
-        self.sqs_client.send_message(
-            QueueUrl=self.queue_url,
-            MessageBody=json.dumps(message),
-        )
\ No newline at end of file
+        if isinstance(batch, dict):
+            # A byte range descriptor of a staged S3 file rather than inline contacts
+            message["source"] = batch
+        elif self.wire_format == "compact":
+            message["packed"] = encode_batch(batch, self.compression)
+        else:
+            message["batch"] = batch
+        body = json.dumps(message, separators=(",", ":"))
+        if self.claim_check_bucket and len(body.encode("utf-8")) > self.claim_check_threshold:
+            body = json.dumps(self._check_in(batch, request_id, batch_id))
+        return body
+
+    def _check_in(self, batch, request_id, batch_id):
+        """
+        Stores an oversized batch in S3.
+        Returns:
+            dict: The message carrying a pointer to the stored batch.
+        """
+        key = claim_check_key(request_id, batch_id)
+        self.s3_client.put_object(
+            Bucket=self.claim_check_bucket,
+            Key=key,
+            Body=pack_batch(batch),
+            ContentType="application/octet-stream",
+        )
+        return {
+            "request_id": request_id,
+            "batch_id": batch_id,
+            "claim_check": {"bucket": self.claim_check_bucket, "key": key},
+        }
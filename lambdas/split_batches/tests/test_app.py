@@ -3,6 +3,16 @@ import pytest
 from moto import mock_aws
 import boto3
 from lambdas.split_batches import app
+from lambdas.split_batches.sqs_queue import SQSQueue
+from lambdas.split_batches.batch_splitter import BatchSplitter
+from lambdas.split_batches.batch_sizing_policy import BatchSizingPolicy
+from lambdas.common.worker_stats import WORKER_STATS_KEY
+from lambdas.common.dedupe_index import index_key, decode_index
+from lambdas.common.metrics import MAX_VALUES, Metrics
+from lambdas.common.aws_clients import get_client
+from lambdas.common.claim_check import unpack_batch
+from lambdas.common.wire_format import unpack_message
+from lambdas.split_batches.contact_stream import iter_contacts
 
 
 @pytest.fixture
@@ -88,3 +98,366 @@ def test_lambda_handler(aws_setup):
     assert item["request_id"] == body["request_id"]
     assert item["expected_batches"] == 1
     assert item["processed_batches"] == 0
+
+
+def test_send_batches_packs_messages(aws_setup):
+    """
+    Test that send_batches packs up to 10 messages per SendMessageBatch call.
+    """
+    sqs_queue = SQSQueue(queue_url=aws_setup["queue_url"], max_workers=4)
+    calls = []
+    sqs_queue.sqs_client.meta.events.register(
+        "provide-client-params.sqs.SendMessageBatch", lambda params, **kwargs: calls.append(len(params["Entries"]))
+    )
+
+    batches = [[{"first_name": "John", "last_name": "Doe", "company_domain": "mycompany.com"}]] * 25
+    report = sqs_queue.send_batches(batches, "uuid-12345")
+
+    assert report == {"total": 25, "sent": 25, "failed": []}
+    assert sorted(calls) == [5, 10, 10]
+
+
+def test_send_batches_retries_only_failed_entries(aws_setup, monkeypatch):
+    """
+    Test that only the entries reported as failed are sent again.
+    """
+    sqs_queue = SQSQueue(queue_url=aws_setup["queue_url"])
+    monkeypatch.setattr("lambdas.split_batches.sqs_queue.sqs_queue.RETRY_BACKOFF", 0)
+    sent_ids = []
+
+    def mock_send_message_batch(QueueUrl, Entries):
+        sent_ids.append([entry["Id"] for entry in Entries])
+        if len(sent_ids) == 1:
+            return {
+                "Successful": [{"Id": "1"}],
+                "Failed": [
+                    {"Id": "2", "SenderFault": False, "Code": "InternalError"},
+                    {"Id": "3", "SenderFault": True, "Code": "InvalidParameterValue"},
+                ],
+            }
+        return {"Successful": [{"Id": entry["Id"]} for entry in Entries], "Failed": []}
+
+    monkeypatch.setattr(sqs_queue.sqs_client, "send_message_batch", mock_send_message_batch)
+    report = sqs_queue.send_batches([[{"id": 1}], [{"id": 2}], [{"id": 3}]], "uuid-12345")
+
+    assert sent_ids == [["1", "2", "3"], ["2"]]
+    assert report == {"total": 3, "sent": 2, "failed": [3]}
+
+
+def test_lambda_handler_deduplicates_contacts(aws_setup, monkeypatch):
+    """
+    Test that duplicate contacts are enqueued once and the dedupe index is stored.
+    """
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="aggregated-output")
+    monkeypatch.setenv("S3_BUCKET_NAME", "aggregated-output")
+    monkeypatch.setenv("DEDUPLICATE_CONTACTS", "true")
+
+    john = {"first_name": "John", "last_name": "Doe", "company_domain": "mycompany.com"}
+    jane = {"first_name": "Jane", "last_name": "Smith", "company_domain": "notmycompany.com"}
+    shouting_john = {"first_name": "JOHN ", "last_name": "doe", "company_domain": "MyCompany.com"}
+    mock_event = {"body": json.dumps({"contacts": [john, jane, shouting_john, jane]})}
+
+    response = app.lambda_handler(mock_event, None)
+
+    body = json.loads(response["body"])
+    assert body["total_contacts"] == 4
+    assert body["unique_contacts"] == 2
+
+    messages = aws_setup["sqs_client"].receive_message(QueueUrl=aws_setup["queue_url"], MaxNumberOfMessages=10)
+    assert json.loads(messages["Messages"][0]["Body"])["batch"] == [john, jane]
+
+    index = decode_index(s3.get_object(Bucket="aggregated-output", Key=index_key(body["request_id"]))["Body"].read())
+    assert list(index) == [0, 1, 0, 1]
+
+
+def test_iter_contacts_streams_array():
+    """
+    Test that contacts are parsed one by one, skipping other fields.
+    """
+    body = '{"source": {"name": "upload", "tags": [1, 2]}, "contacts" : [ {"first_name": "John"},{"first_name": "Jane"} ], "extra": true}'
+
+    contacts = iter_contacts(body)
+
+    assert next(contacts) == {"first_name": "John"}
+    assert list(contacts) == [{"first_name": "Jane"}]
+    assert list(iter_contacts('{"contacts": []}')) == []
+    with pytest.raises(KeyError):
+        iter_contacts('{"other": [1]}')
+    with pytest.raises(ValueError):
+        list(iter_contacts('{"contacts": [{"first_name": "John"} {"first_name": "Jane"}]}'))
+
+
+def test_lambda_handler_streams_batches(aws_setup):
+    """
+    Test that a large upload is streamed into batches and the batch count is recorded at the end.
+    """
+    contacts = [
+        {"first_name": f"First{i}", "last_name": "Doe", "company_domain": "mycompany.com"} for i in range(250)
+    ]
+
+    response = app.lambda_handler({"body": json.dumps({"contacts": contacts})}, None)
+
+    body = json.loads(response["body"])
+    assert body["total_batches"] == 3
+    assert body["total_contacts"] == 250
+    table = boto3.resource("dynamodb", region_name="us-east-1").Table(aws_setup["table_name"])
+    item = table.get_item(Key={"request_id": body["request_id"]})["Item"]
+    assert item["expected_batches"] == 3
+    assert item["processed_batches"] == 0
+
+
+def test_lambda_handler_marks_malformed_body_failed(aws_setup):
+    """
+    Test that a body malformed after some batches were sent is recorded as a failed request.
+    """
+    contacts = [
+        {"first_name": f"First{i}", "last_name": "Doe", "company_domain": "mycompany.com"} for i in range(250)
+    ]
+    body = json.dumps({"contacts": contacts})[:-2] + " oops]}"
+
+    response = app.lambda_handler({"body": body}, None)
+
+    assert response["statusCode"] == 400
+    result = json.loads(response["body"])
+    assert result["status"] == "failed"
+    assert result["total_contacts"] == 250
+    assert "Invalid request body" in result["error"]
+    table = boto3.resource("dynamodb", region_name="us-east-1").Table(aws_setup["table_name"])
+    item = table.get_item(Key={"request_id": result["request_id"]})["Item"]
+    assert item["status"] == "failed"
+    assert item["expected_batches"] == result["total_batches"] == 3
+
+
+def test_lambda_handler_missing_contacts(aws_setup):
+    """
+    Test that a body without contacts is rejected.
+    """
+    response = app.lambda_handler({"body": json.dumps({"people": []})}, None)
+
+    assert response["statusCode"] == 400
+    assert "contacts" in json.loads(response["body"])["error"]
+
+
+def test_lambda_handler_s3_source(aws_setup):
+    """
+    Test that an S3-staged request enqueues byte range descriptors instead of contacts.
+    """
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="staged-contacts")
+    lines = [json.dumps({"first_name": f"First{i}", "last_name": "Doe", "company_domain": "mycompany.com"}) for i in range(250)]
+    s3.put_object(Bucket="staged-contacts", Key="contacts.ndjson", Body="\n".join(lines).encode("utf-8"))
+    mock_event = {"body": json.dumps({"source": {"bucket": "staged-contacts", "key": "contacts.ndjson"}})}
+
+    response = app.lambda_handler(mock_event, None)
+
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    assert body["total_batches"] == 3
+    messages = aws_setup["sqs_client"].receive_message(QueueUrl=aws_setup["queue_url"], MaxNumberOfMessages=10)
+    descriptors = sorted((json.loads(message["Body"])["source"] for message in messages["Messages"]), key=lambda d: d["start"])
+    assert descriptors[0]["start"] == 0
+    assert descriptors[-1]["end"] == len("\n".join(lines))
+
+
+def test_lambda_handler_marks_request_failed_when_enqueueing_fails(aws_setup, monkeypatch):
+    """
+    Test that a request whose ranges cannot all be enqueued is finalized as failed before erroring.
+    """
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="staged-contacts")
+    lines = [json.dumps({"first_name": f"First{i}", "last_name": "Doe", "company_domain": "mycompany.com"}) for i in range(250)]
+    s3.put_object(Bucket="staged-contacts", Key="contacts.ndjson", Body="\n".join(lines).encode("utf-8"))
+    monkeypatch.setattr("lambdas.split_batches.sqs_queue.sqs_queue.RETRY_BACKOFF", 0)
+    failing = lambda QueueUrl, Entries: {
+        "Successful": [],
+        "Failed": [{"Id": entry["Id"], "SenderFault": False, "Code": "InternalError"} for entry in Entries],
+    }
+    monkeypatch.setattr(get_client("sqs"), "send_message_batch", failing)
+
+    response = app.lambda_handler({"body": json.dumps({"source": {"bucket": "staged-contacts", "key": "contacts.ndjson"}})}, None)
+
+    assert response["statusCode"] == 500
+    items = aws_setup["dynamodb_client"].scan(TableName=aws_setup["table_name"])["Items"]
+    assert len(items) == 1
+    assert items[0]["status"] == {"S": "failed"}
+    assert items[0]["expected_batches"] == {"N": "0"}
+    assert "Failed to enqueue 3 of 3 ranges" in items[0]["error"]["S"]
+
+
+def test_lambda_handler_streamed_request_records_enqueued_batches_on_failure(aws_setup, monkeypatch):
+    """
+    Test that a streamed request with a batch SQS keeps rejecting is failed with the batches that were enqueued.
+    """
+    contacts = [
+        {"first_name": f"First{i}", "last_name": "Doe", "company_domain": "mycompany.com"} for i in range(250)
+    ]
+    monkeypatch.setattr("lambdas.split_batches.sqs_queue.sqs_queue.RETRY_BACKOFF", 0)
+    sqs = get_client("sqs")
+    send_message_batch = sqs.send_message_batch
+
+    def reject_second_batch(QueueUrl, Entries):
+        response = send_message_batch(QueueUrl=QueueUrl, Entries=[entry for entry in Entries if entry["Id"] != "2"])
+        if any(entry["Id"] == "2" for entry in Entries):
+            response.setdefault("Failed", []).append({"Id": "2", "SenderFault": False, "Code": "InternalError"})
+        return response
+
+    monkeypatch.setattr(sqs, "send_message_batch", reject_second_batch)
+
+    response = app.lambda_handler({"body": json.dumps({"contacts": contacts})}, None)
+
+    assert response["statusCode"] == 500
+    item = aws_setup["dynamodb_client"].scan(TableName=aws_setup["table_name"])["Items"][0]
+    assert item["status"] == {"S": "failed"}
+    assert item["expected_batches"] == {"N": "2"}
+    assert item["total_contacts"] == {"N": "250"}
+    messages = aws_setup["sqs_client"].receive_message(QueueUrl=aws_setup["queue_url"], MaxNumberOfMessages=10)
+    assert len(messages["Messages"]) == 2
+
+
+def test_lambda_handler_stores_output_format(aws_setup):
+    """
+    Test that the requested output format is validated and stored on the control item.
+    """
+    contacts = json.dumps({"contacts": [{"first_name": "John", "last_name": "Doe", "company_domain": "mycompany.com"}]})
+
+    response = app.lambda_handler({"body": contacts, "queryStringParameters": {"output_format": "parquet"}}, None)
+    invalid = app.lambda_handler({"body": contacts, "queryStringParameters": {"output_format": "xml"}}, None)
+
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    assert body["output_format"] == "parquet"
+    item = aws_setup["dynamodb_client"].get_item(
+        TableName=aws_setup["table_name"], Key={"request_id": {"S": body["request_id"]}}
+    )["Item"]
+    assert item["output_format"] == {"S": "parquet"}
+    assert "created_at" in item
+    assert invalid["statusCode"] == 400
+    assert "xml" in json.loads(invalid["body"])["error"]
+
+
+def test_send_batches_claim_checks_oversized_messages(aws_setup):
+    """
+    Test that a batch too large for an SQS message is stored in S3 and replaced by a pointer.
+    """
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="claim-checks")
+    sqs_queue = SQSQueue(queue_url=aws_setup["queue_url"], claim_check_bucket="claim-checks")
+    large_batch = [{"first_name": f"John{i}", "notes": "x" * 4000} for i in range(100)]
+    small_batch = [{"first_name": "Jane"}]
+
+    report = sqs_queue.send_batches([large_batch, small_batch], "uuid-12345")
+
+    assert report == {"total": 2, "sent": 2, "failed": []}
+    messages = aws_setup["sqs_client"].receive_message(QueueUrl=aws_setup["queue_url"], MaxNumberOfMessages=10)
+    bodies = {body["batch_id"]: body for body in (json.loads(m["Body"]) for m in messages["Messages"])}
+    assert bodies[2]["batch"] == small_batch
+    pointer = bodies[1]["claim_check"]
+    assert "batch" not in bodies[1]
+    stored = s3.get_object(Bucket=pointer["bucket"], Key=pointer["key"])["Body"].read()
+    assert unpack_batch(stored) == large_batch
+
+
+@pytest.mark.parametrize("compression", ["none", "zlib"])
+def test_send_batches_compact_wire_format(aws_setup, compression):
+    """
+    Test that compact messages are smaller than plain JSON and decode to the same contacts.
+    """
+    batch = [
+        {"first_name": f"John{i}", "last_name": "Doe", "company_domain": "mycompany.com"}
+        for i in range(50)
+    ]
+    batch.append({"last_name": "Smith", "first_name": "Jane"})
+    sizes = {}
+    for wire_format in ("json", "compact"):
+        sqs_queue = SQSQueue(queue_url=aws_setup["queue_url"], wire_format=wire_format, compression=compression)
+        sqs_queue.send_batches([batch], "uuid-12345")
+        message = aws_setup["sqs_client"].receive_message(QueueUrl=aws_setup["queue_url"])["Messages"][0]
+        aws_setup["sqs_client"].delete_message(QueueUrl=aws_setup["queue_url"], ReceiptHandle=message["ReceiptHandle"])
+        sizes[wire_format] = len(message["Body"])
+        body = unpack_message(json.loads(message["Body"]))
+        assert body["batch"] == batch
+        assert list(body["batch"][-1]) == ["last_name", "first_name"]
+
+    assert sizes["compact"] < sizes["json"]
+
+
+def test_batch_sizing_policy_cuts_by_bytes_and_latency():
+    """
+    Test that batches are cut by record count, estimated bytes and worker latency.
+    """
+    contacts = [{"first_name": f"John{i}", "notes": "x" * (10 if i % 2 else 1000)} for i in range(60)]
+
+    by_bytes = BatchSplitter(policy=BatchSizingPolicy(max_records=50, max_bytes=5000))
+    batches = list(by_bytes.split(contacts))
+    assert [contact for batch in batches for contact in batch] == contacts
+    assert all(sum(BatchSizingPolicy.estimate_bytes(c) for c in batch) <= 5000 for batch in batches)
+    assert max(len(batch) for batch in batches) < 50
+
+    # 0.25 s per record in a 5 s budget leaves room for 20 records
+    by_latency = BatchSizingPolicy(max_records=50, max_bytes=10 ** 7, time_budget_seconds=5, seconds_per_record=0.25)
+    assert [len(batch) for batch in BatchSplitter(policy=by_latency).split(contacts)] == [20, 20, 20]
+    assert BatchSizingPolicy(max_records=50, time_budget_seconds=5).record_limit() == 50
+
+
+def test_lambda_handler_sizes_batches_from_worker_stats(aws_setup, monkeypatch):
+    """
+    Test that the handler honours MAX_BATCH_SIZE and the latency published by workers.
+    """
+    monkeypatch.setenv("MAX_BATCH_SIZE", "40")
+    monkeypatch.setenv("BATCH_TIME_BUDGET_SECONDS", "3")
+    contacts = [{"first_name": f"John{i}", "last_name": "Doe", "company_domain": "mycompany.com"} for i in range(100)]
+    mock_event = {"body": json.dumps({"contacts": contacts})}
+
+    response = app.lambda_handler(mock_event, None)
+    assert json.loads(response["body"])["total_batches"] == 3
+
+    aws_setup["dynamodb_client"].put_item(
+        TableName=aws_setup["table_name"],
+        Item={"request_id": {"S": WORKER_STATS_KEY}, "seconds_per_record": {"N": "0.2"}},
+    )
+    response = app.lambda_handler(mock_event, None)
+    assert json.loads(response["body"])["total_batches"] == 7
+
+
+def test_lambda_handler_emits_stage_metrics(aws_setup, monkeypatch):
+    """
+    Test that each request writes its stage timings and counts as an EMF document.
+    """
+    documents = []
+    monkeypatch.setattr(app, "metrics", Metrics("split_batches", sink=documents.append))
+    contacts = [{"first_name": f"John{i}", "last_name": "Doe", "company_domain": "mycompany.com"} for i in range(150)]
+
+    response = app.lambda_handler({"body": json.dumps({"contacts": contacts})}, None)
+
+    assert response["statusCode"] == 200
+    document = json.loads(documents[0])
+    definition = document["_aws"]["CloudWatchMetrics"][0]
+    assert definition["Dimensions"] == [["Service"]]
+    assert document["Service"] == "split_batches"
+    names = {metric["Name"]: metric["Unit"] for metric in definition["Metrics"]}
+    for stage in ("Parse", "Split", "Enqueue"):
+        assert names[f"{stage}Time"] == "Milliseconds"
+        assert document[f"{stage}Time"] >= 0
+    assert document["Contacts"] == 150
+    assert document["Batches"] == 2
+
+
+def test_metrics_spread_observations_over_documents():
+    """
+    Test that a metric with more observations than EMF allows per event is
+    written over several documents, and that flushing starts over.
+    """
+    documents = []
+    metrics = Metrics("worker", sink=documents.append)
+    for latency in range(MAX_VALUES * 2 + 50):
+        metrics.put("ProviderLatency", latency, "Milliseconds")
+    metrics.add("Records", 3)
+
+    metrics.flush()
+    metrics.flush()
+
+    parsed = [json.loads(document) for document in documents]
+    assert [len(document["ProviderLatency"]) for document in parsed] == [MAX_VALUES, MAX_VALUES, 50]
+    assert [document.get("Records") for document in parsed] == [3, None, None]
+    assert sum((document["ProviderLatency"] for document in parsed), []) == list(range(MAX_VALUES * 2 + 50))
@@ -1,24 +1,215 @@
 import json
 import os
+import time
+from botocore.exceptions import ClientError
+from ..common.aws_clients import lazy_client
+from ..common.metrics import metrics_from_environment
+from ..common.output_formats import CONCATENABLE_FORMATS, DEFAULT_OUTPUT_FORMAT
+from ..common.record_store import RecordStore
+from ..common.result_parts import segment_group
+from ..common.wire_format import unpack_message
 from .batch_processor import BatchProcessor
+from .claim_check import ClaimCheckResolver
+from .control_table import ControlTableClient
 from .dynamodb import DynamoDBClient
+from .enrichment_cache import EnrichmentCache
+from .failed_record_queue import FailedRecordQueue
+from .part_writer import ResultPartWriter
 from .provider_factory import ProviderFactory
+from .provider_guard import CircuitBreaker, ProviderUnavailableError, SharedRateLimiter, TokenBucket
+from .s3_range_reader import S3RangeReader
 
 # Initialize components
-dynamo_client = DynamoDBClient(table_name=os.environ["DYNAMO_TABLE_NAME"])
-provider_factory = ProviderFactory()
-batch_processor = BatchProcessor(dynamo_client=dynamo_client, provider_factory=provider_factory)
+metrics = metrics_from_environment("worker")
+dynamo_client = DynamoDBClient(
+    table_name=os.environ["DYNAMO_TABLE_NAME"],
+    max_workers=int(os.environ.get("DYNAMO_WRITE_WORKERS", "1")),
+    metrics=metrics,
+)
+control_table = ControlTableClient(table_name=os.environ.get("CONTROL_TABLE_NAME", "DefaultControlTable"))
+# Module-level so cached enrichments survive warm invocations
+enrichment_cache = EnrichmentCache(
+    max_entries=int(os.environ.get("ENRICHMENT_CACHE_SIZE", "10000")),
+    ttl_seconds=int(os.environ.get("ENRICHMENT_CACHE_TTL_SECONDS", "3600")),
+    table_name=os.environ.get("ENRICHMENT_CACHE_TABLE"),
+)
+# Module-level so the limiter's leased tokens and the breaker's history survive warm invocations
+rate_limiters = {}
+if os.environ.get("PROVIDER_RATE_LIMIT"):
+    if os.environ.get("PROVIDER_RATE_LIMIT_SHARED", "true").lower() == "true":
+        rate_limiters["default"] = SharedRateLimiter(
+            table_name=control_table.table_name, name="default", rate=int(os.environ["PROVIDER_RATE_LIMIT"])
+        )
+    else:
+        rate_limiters["default"] = TokenBucket(rate=float(os.environ["PROVIDER_RATE_LIMIT"]))
+circuit_breakers = {
+    "default": CircuitBreaker(
+        failure_rate=float(os.environ.get("CIRCUIT_BREAKER_FAILURE_RATE", "0.5")),
+        reset_seconds=float(os.environ.get("CIRCUIT_BREAKER_RESET_SECONDS", "30")),
+    )
+}
+# A batch the provider could not take is hidden until the breaker lets a trial call through
+sqs_client = lazy_client("sqs")
+queue_url = os.environ.get("SQS_QUEUE_URL")
+provider_retry_seconds = int(
+    os.environ.get("PROVIDER_RETRY_DELAY_SECONDS", os.environ.get("CIRCUIT_BREAKER_RESET_SECONDS", "30"))
+)
+# On its last delivery before the DLQ, such a batch is parked and counted as failed instead
+max_receive_count = int(os.environ.get("MAX_RECEIVE_COUNT", "0"))
+provider_factory = ProviderFactory(
+    cache=enrichment_cache,
+    rate_limiters=rate_limiters,
+    circuit_breakers=circuit_breakers,
+    chains=json.loads(os.environ.get("PROVIDER_CHAINS", "{}")),
+    metrics=metrics,
+)
+range_reader = S3RangeReader()
+# Without a failure queue a message with failed records is retried as a whole
+failed_record_queue = (
+    FailedRecordQueue(queue_url=os.environ["FAILED_RECORDS_QUEUE_URL"])
+    if os.environ.get("FAILED_RECORDS_QUEUE_URL")
+    else None
+)
+# Each batch's output is written to S3 as soon as it is stored, for incremental aggregation
+part_writer = (
+    ResultPartWriter(
+        bucket_name=os.environ["S3_BUCKET_NAME"], read_workers=int(os.environ.get("SEGMENT_READ_WORKERS", "8"))
+    )
+    if os.environ.get("WRITE_RESULT_PARTS", "false").lower() == "true"
+    else None
+)
+# Parts of this many consecutive batches are joined into a segment the aggregation can copy
+segment_batches = int(os.environ.get("RESULT_SEGMENT_BATCHES", "0"))
+output_format = os.environ.get("OUTPUT_FORMAT", DEFAULT_OUTPUT_FORMAT)
+claim_check_resolver = ClaimCheckResolver(max_entries=int(os.environ.get("CLAIM_CHECK_CACHE_SIZE", "16")))
+batch_processor = BatchProcessor(
+    dynamo_client=dynamo_client,
+    provider_factory=provider_factory,
+    max_concurrency=int(os.environ.get("ENRICHMENT_CONCURRENCY", "1")),
+    call_timeout=float(os.environ["ENRICHMENT_TIMEOUT_SECONDS"]) if "ENRICHMENT_TIMEOUT_SECONDS" in os.environ else None,
+    record_store=RecordStore(dynamo_client.table, shards=int(os.environ.get("RECORD_SHARDS", "1"))),
+    provider_name=os.environ.get("ENRICHMENT_PROVIDER", "default"),
+    metrics=metrics,
+)
 
 def lambda_handler(event, context):
     """
     Main Lambda handler for processing SQS messages.
+    Each message is processed on its own; only the messages that failed are
+    reported back, so SQS redelivers them and deletes the others.
+    Returns:
+        dict: The "batchItemFailures" with the message ids to redeliver.
     """
+    failures = []
     try:
         for record in event["Records"]:
-            body = json.loads(record["body"])
+            try:
+                _process_message(record)
+            except Exception as e:
+                print(f"Error processing SQS message {record.get('messageId')}: {e}")
+                failures.append({"itemIdentifier": record.get("messageId")})
+        metrics.add("FailedMessages", len(failures))
+    finally:
+        print(f"Enrichment cache stats: {enrichment_cache.stats}")
+        metrics.flush()
+    return {"batchItemFailures": failures}
+
+
+def _process_message(record):
+    """
+    Enrich and store the batch of one SQS message and count it towards its request.
+    """
+    # Compact messages are unpacked to the same shape as plain JSON ones
+    body = unpack_message(json.loads(record["body"]))
+    if "request_id" in body and control_table.is_batch_processed(body["request_id"], body["batch_id"]):
+        # A redelivery of a batch that was already stored and counted
+        print(f"Skipping batch {body['batch_id']} of request {body['request_id']}, already processed")
+        return
+    started = time.perf_counter()
+    with metrics.timer("Load"):
+        if "batch" in body:
             batch = body["batch"]
+        elif "claim_check" in body:
+            # Oversized batches are stored in S3 and the message only points to them
+            batch = claim_check_resolver.resolve(body)
+        else:
+            # Batches of S3-staged requests carry a byte range instead of the contacts
+            batch = range_reader.read(body["source"])
+
+    try:
+        report = batch_processor.process_batch(batch, body.get("request_id"), body.get("batch_id"))
+    except ProviderUnavailableError:
+        if not _is_last_delivery(record) or failed_record_queue is None or "request_id" not in body:
+            _delay_redelivery(record)
+            raise
+        # The DLQ would take the batch uncounted and the request would never complete
+        print(f"Provider still unavailable for batch {body['batch_id']} of request {body['request_id']}, parking it")
+        metrics.add("DeadLetteredBatches")
+        report = {"succeeded": [], "failed": list(range(len(batch))), "records": []}
+        started = None
+    failed = report["failed"]
+    if failed:
+        if failed_record_queue is None or "request_id" not in body:
+            # Let SQS redeliver the message rather than count an incomplete batch
+            raise RuntimeError(f"Failed to save {len(failed)} records of batch {body.get('batch_id')}")
+        # Park the failed records so the rest of the batch is not processed again
+        failed_record_queue.send_records(body["request_id"], body["batch_id"], batch, failed)
 
-            batch_processor.process_batch(batch)
+    # The part must exist before the batch counts, so it is there once the request completes
+    if part_writer is not None and "request_id" in body:
+        _write_part(body["request_id"], body["batch_id"], report["records"])
+
+    # Count the batch towards the request's progress
+    if "request_id" in body:
+        with metrics.timer("Commit"):
+            control_table.mark_batch_processed(
+                body["request_id"], body["batch_id"], failed_records=len(failed), records=len(batch)
+            )
+        # Lets split_batches size batches to what a worker can finish in time
+        if started is not None:
+            control_table.record_latency(time.perf_counter() - started, len(batch))
+
+
+def _is_last_delivery(record):
+    """
+    Whether SQS moves the message to the DLQ if this delivery fails as well.
+    """
+    receive_count = int(record.get("attributes", {}).get("ApproximateReceiveCount", "1"))
+    return max_receive_count > 0 and receive_count >= max_receive_count
+
+
+def _delay_redelivery(record):
+    """
+    Keep a message hidden until the provider may be available again, so its
+    deliveries are not used up while the circuit breaker is open.
+    """
+    if not queue_url or "receiptHandle" not in record:
+        return
+    try:
+        sqs_client.change_message_visibility(
+            QueueUrl=queue_url, ReceiptHandle=record["receiptHandle"], VisibilityTimeout=provider_retry_seconds
+        )
+    except ClientError as e:
+        print(f"Error delaying the redelivery of SQS message {record.get('messageId')}: {e}")
+
+
+def _write_part(request_id, batch_id, records):
+    """
+    Write the result part of a batch, and the segment of its range of batches
+    once all their parts are written. Without a part the aggregation falls back
+    to reading the records table, and without a segment to downloading its parts,
+    so a failure is logged rather than failing the batch.
+    """
+    try:
+        with metrics.timer("Part"):
+            part_format = control_table.get_output_format(request_id) or output_format
+            part_writer.write(request_id, batch_id, records, part_format)
+        if segment_batches > 0 and part_format in CONCATENABLE_FORMATS:
+            # The batch completing a range joins its parts, before it counts towards the request
+            first_batch, last_batch = segment_group(batch_id, segment_batches)
+            if control_table.register_part(request_id, batch_id, first_batch, last_batch):
+                with metrics.timer("Segment"):
+                    part_writer.write_segment(request_id, first_batch, last_batch, part_format)
     except Exception as e:
-        print(f"Error processing SQS message: {e}")
-        raise
+        print(f"Error writing the result part of batch {batch_id} of request {request_id}: {e}")
+        metrics.add("PartErrors")
@@ -1,22 +1,180 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+from ...common.metrics import NullMetrics
+from ...common.record_store import RecordStore
+from ..provider_guard import ProviderUnavailableError
+
+
 class BatchProcessor:
     """
     Processes a batch of records, enriches them, and stores them in DynamoDB.
     """
 
-    def __init__(self, dynamo_client, provider_factory):
+    def __init__(
+        self, dynamo_client, provider_factory, max_concurrency=1, call_timeout=None, record_store=None,
+        provider_name="default", metrics=None,
+    ):
+        """
+        Args:
+            dynamo_client (DynamoDBClient): Client used to store the enriched records.
+            provider_factory (ProviderFactory): Factory returning the data providers.
+            max_concurrency (int): Upper bound on concurrent enrich_record calls. Providers can
+                lower it with a "max_concurrency" attribute.
+            call_timeout (float): Seconds to wait for one enrich_record call in concurrent mode.
+            record_store (RecordStore): Key schema of the records table; defaults to
+                unsharded request partitions.
+            provider_name (str): Provider or provider chain the records are enriched with.
+            metrics (Metrics): Receives the enrichment and write timings of each batch.
+        """
         self.dynamo_client = dynamo_client
         self.provider_factory = provider_factory
+        self.max_concurrency = max(1, max_concurrency)
+        self.call_timeout = call_timeout
+        self.record_store = record_store if record_store is not None else RecordStore(table=None)
+        self.provider_name = provider_name
+        self.metrics = metrics if metrics is not None else NullMetrics()
 
-    def process_batch(self, batch):
+    def process_batch(self, batch, request_id=None, batch_id=None):
         """
         Enrich and store a batch of records.
+        Args:
+            batch (list): The contacts of the batch.
+            request_id (str): The request of the batch. When given with batch_id, every
+                record is stored under its request partition and a batch and position
+                sort key, so a redelivered batch overwrites its records.
+            batch_id (int): The batch identifier within the request.
+        Returns:
+            dict: Report with the positions of the "succeeded" and "failed" records in the batch,
+                and the saved "records" in position order. Records that could not be enriched
+                are not saved and are reported as failed.
+        Raises:
+            ProviderUnavailableError: If the provider's circuit breaker is open or its
+                rate limit was not available in time; the whole batch should be retried later.
         """
-        enriched_records = []
-        for record in batch:
-            # Fetch the provider (currently one, but scalable)
-            provider = self.provider_factory.get_provider("default")
-            enriched_record = provider.enrich_record(record)
-            enriched_records.append(enriched_record)
+        started = time.perf_counter()
+        provider = self.provider_factory.get_provider(self.provider_name)
+        with self.metrics.timer("Enrich"):
+            if self.provider_factory.supports_bulk(self.provider_name):
+                enriched_records, enrich_failed = self._enrich_bulk(provider, batch)
+            else:
+                enriched_records, enrich_failed = self._enrich(provider, batch)
 
         # Store enriched records in DynamoDB
-        self.dynamo_client.save_records(enriched_records)
+        positions = [position for position, record in enumerate(enriched_records) if record is not None]
+        if request_id is not None and batch_id is not None:
+            for position in positions:
+                enriched_records[position] = self.record_store.keyed(
+                    enriched_records[position], request_id, batch_id, position
+                )
+        with self.metrics.timer("Write"):
+            report = self.dynamo_client.save_records([enriched_records[position] for position in positions])
+
+        failed = sorted(enrich_failed + [positions[index] for index in report["failed"]])
+        if failed:
+            print(f"Failed to process {len(failed)} of {len(batch)} records")
+        self.metrics.add("Records", len(batch))
+        self.metrics.add("FailedRecords", len(failed))
+        self.metrics.put_rate("RecordsPerSecond", len(batch), time.perf_counter() - started)
+        succeeded = [positions[index] for index in report["succeeded"]]
+        return {
+            "succeeded": succeeded,
+            "failed": failed,
+            "records": [enriched_records[position] for position in succeeded],
+        }
+
+    def _enrich_bulk(self, provider, batch):
+        """
+        Enrich a batch with the provider's enrich_records bulk API.
+        Records the bulk call could not enrich, or the whole batch if the call
+        fails, fall back to enrich_record one record at a time.
+        Returns:
+            tuple: Enriched records (None where enrichment failed) and the failed positions.
+        """
+        try:
+            enriched_records = list(provider.enrich_records(batch))
+            if len(enriched_records) != len(batch):
+                raise ValueError(f"enrich_records returned {len(enriched_records)} records for {len(batch)}")
+        except ProviderUnavailableError:
+            raise
+        except Exception as e:
+            print(f"Bulk enrichment failed, falling back to per-record enrichment: {e}")
+            return self._enrich(provider, batch)
+
+        missing = [position for position, record in enumerate(enriched_records) if record is None]
+        if not missing:
+            return enriched_records, []
+
+        retried, retry_failed = self._enrich(provider, [batch[position] for position in missing])
+        for position, record in zip(missing, retried):
+            enriched_records[position] = record
+        return enriched_records, [missing[index] for index in retry_failed]
+
+    @staticmethod
+    def _enrich_sequential(provider, batch):
+        """
+        Enrich the records one after the other, isolating per-record failures.
+        """
+        enriched_records, failed = [], []
+        for position, record in enumerate(batch):
+            try:
+                enriched_records.append(provider.enrich_record(record))
+            except ProviderUnavailableError:
+                raise
+            except Exception as e:
+                print(f"Enrichment of record {position} failed: {e}")
+                enriched_records.append(None)
+                failed.append(position)
+        return enriched_records, failed
+
+    def _enrich(self, provider, batch):
+        """
+        Enrich the records of a batch, keeping their order.
+        At most the allowed number of calls run at a time and each call is
+        given call_timeout seconds from the moment it starts, so records waiting
+        for a slot never time out. A call that times out is abandoned and frees
+        its slot for the next record.
+        Returns:
+            tuple: Enriched records (None where enrichment failed) and the failed positions.
+        """
+        concurrency = min(self.max_concurrency, getattr(provider, "max_concurrency", self.max_concurrency))
+        if concurrency <= 1 or len(batch) <= 1:
+            return self._enrich_sequential(provider, batch)
+
+        enriched_records = [None] * len(batch)
+        failed = []
+        queued = iter(enumerate(batch))
+        running = {}
+        # One thread per record at most, so abandoned calls never hold back the next ones
+        executor = ThreadPoolExecutor(max_workers=len(batch))
+        try:
+            while True:
+                for position, record in islice(queued, concurrency - len(running)):
+                    deadline = None if self.call_timeout is None else time.monotonic() + self.call_timeout
+                    running[executor.submit(provider.enrich_record, record)] = (position, deadline)
+                if not running:
+                    break
+                deadlines = [deadline for _, deadline in running.values() if deadline is not None]
+                timeout = max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    position, _ = running.pop(future)
+                    try:
+                        enriched_records[position] = future.result()
+                    except ProviderUnavailableError:
+                        raise
+                    except Exception as e:
+                        print(f"Enrichment of record {position} failed: {e}")
+                        failed.append(position)
+                now = time.monotonic()
+                for future, (position, deadline) in list(running.items()):
+                    if deadline is not None and deadline <= now:
+                        print(f"Enrichment of record {position} timed out after {self.call_timeout}s")
+                        del running[future]
+                        failed.append(position)
+        finally:
+            # Do not wait on calls that already timed out
+            executor.shutdown(wait=False, cancel_futures=True)
+        failed.sort()
+        return enriched_records, failed
@@ -0,0 +1 @@
+from .claim_check import ClaimCheckResolver
\ No newline at end of file
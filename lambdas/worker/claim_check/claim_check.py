@@ -0,0 +1,44 @@
+from collections import OrderedDict
+
+from ...common.aws_clients import lazy_client
+from ...common.claim_check import unpack_batch
+
+
+class ClaimCheckResolver:
+    """
+    Loads the batches that split_batches stored in S3 because they were too
+    large for an SQS message.
+    """
+
+    def __init__(self, max_entries=16):
+        """
+        Args:
+            max_entries (int): Resolved batches kept in memory, so a redelivered
+                message does not download its batch again.
+        """
+        self.max_entries = max_entries
+        self.s3_client = lazy_client("s3")
+        self._batches = OrderedDict()
+
+    def resolve(self, body):
+        """
+        Return the contacts of a message that carries a claim check.
+        Args:
+            body (dict): Decoded message body with a "claim_check" pointer.
+        Returns:
+            list: The contacts of the batch.
+        """
+        pointer = body["claim_check"]
+        cache_key = (pointer["bucket"], pointer["key"])
+        batch = self._batches.get(cache_key)
+        if batch is not None:
+            self._batches.move_to_end(cache_key)
+            return batch
+
+        response = self.s3_client.get_object(Bucket=pointer["bucket"], Key=pointer["key"])
+        batch = unpack_batch(response["Body"].read())
+        if self.max_entries > 0:
+            self._batches[cache_key] = batch
+            if len(self._batches) > self.max_entries:
+                self._batches.popitem(last=False)
+        return batch
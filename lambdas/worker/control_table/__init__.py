@@ -0,0 +1 @@
+from .control_table import ControlTableClient
\ No newline at end of file
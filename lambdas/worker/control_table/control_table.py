@@ -0,0 +1,192 @@
+import time
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+from ...common.aws_clients import lazy_client, lazy_table
+from ...common.completion import batch_marker_key, is_complete, notify_completion
+from ...common.worker_stats import WORKER_STATS_KEY
+
+
+class ControlTableClient:
+    """
+    Tracks batch progress for a request in the control table.
+    """
+
+    def __init__(self, table_name, latency_smoothing=0.2, stats_interval_seconds=60,
+                 marker_ttl_seconds=7 * 24 * 3600, max_cached_requests=128):
+        """
+        Args:
+            table_name (str): The name of the control table.
+            marker_ttl_seconds (int): Lifetime of the per-batch completion markers,
+                which only need to outlive redeliveries of the batch.
+            latency_smoothing (float): Weight of the latest batch in the moving
+                average of the per-record latency.
+            stats_interval_seconds (float): Minimum time between two latency
+                updates written by this worker.
+            max_cached_requests (int): Requests whose output format is kept in memory.
+        """
+        self.table_name = table_name
+        self.table = lazy_table(table_name)
+        self.sfn_client = lazy_client("stepfunctions")
+        self.marker_ttl_seconds = marker_ttl_seconds
+        self.latency_smoothing = latency_smoothing
+        self.stats_interval_seconds = stats_interval_seconds
+        self.seconds_per_record = None
+        self._stats_written_at = None
+        self.max_cached_requests = max_cached_requests
+        # The output format never changes once a request is created
+        self._output_formats = {}
+
+    def is_batch_processed(self, request_id, batch_id):
+        """
+        Check the completion marker of a batch with a strongly consistent read,
+        so a redelivered batch can be acknowledged without enriching it again.
+        """
+        response = self.table.get_item(
+            Key={"request_id": batch_marker_key(request_id, batch_id)},
+            ProjectionExpression="request_id",
+            ConsistentRead=True,
+        )
+        return "Item" in response
+
+    def get_output_format(self, request_id):
+        """
+        Read the output format a request asked for, once per request.
+        Returns:
+            str: The format stored by split_batches, or None if the request uses the default.
+        """
+        if request_id not in self._output_formats:
+            response = self.table.get_item(Key={"request_id": request_id}, ProjectionExpression="output_format")
+            if len(self._output_formats) >= self.max_cached_requests:
+                # Forget the oldest request
+                del self._output_formats[next(iter(self._output_formats))]
+            self._output_formats[request_id] = response.get("Item", {}).get("output_format")
+        return self._output_formats[request_id]
+
+    def mark_batch_processed(self, request_id, batch_id, failed_records=0, records=0):
+        """
+        Count a processed batch, at most once per batch_id.
+        The batch's completion marker and the request's counter are written in one
+        transaction, so a batch is never counted without its marker or twice.
+        The update that brings processed_batches up to expected_batches resumes
+        the waiting Step Functions execution.
+        Args:
+            request_id (str): The request of the batch.
+            batch_id (int): The processed batch.
+            failed_records (int): Records of the batch sent to the failure queue.
+            records (int): Records in the batch, added to the request's processed_records.
+        Returns:
+            bool: True if this call completed the request.
+        """
+        update = "ADD processed_batches :one"
+        values = {":one": 1, ":now": int(time.time())}
+        if failed_records:
+            update += ", failed_records :failed"
+            values[":failed"] = failed_records
+        if records:
+            update += ", processed_records :records"
+            values[":records"] = records
+        # Progress time of the request, for its throughput and ETA
+        update += " SET updated_at = :now"
+        marker = {
+            "request_id": batch_marker_key(request_id, batch_id),
+            "failed_records": failed_records,
+            "expires_at": int(time.time()) + self.marker_ttl_seconds,
+        }
+        try:
+            self.table.meta.client.transact_write_items(
+                TransactItems=[
+                    {
+                        "Put": {
+                            "TableName": self.table_name,
+                            "Item": marker,
+                            "ConditionExpression": "attribute_not_exists(request_id)",
+                        }
+                    },
+                    {
+                        "Update": {
+                            "TableName": self.table_name,
+                            "Key": {"request_id": request_id},
+                            "UpdateExpression": update,
+                            "ConditionExpression": "attribute_exists(request_id)",
+                            "ExpressionAttributeValues": values,
+                        }
+                    },
+                ]
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+            reasons = [reason.get("Code") for reason in e.response.get("CancellationReasons", [])]
+            if reasons[:1] == ["ConditionalCheckFailed"]:
+                print(f"Batch {batch_id} of request {request_id} was already counted")
+                return False
+            if reasons[1:2] == ["ConditionalCheckFailed"]:
+                print(f"Request {request_id} of batch {batch_id} is unknown")
+                return False
+            raise
+
+        item = self.table.get_item(Key={"request_id": request_id}, ConsistentRead=True).get("Item", {})
+        if not is_complete(item):
+            return False
+        print(f"Request {request_id} completed with batch {batch_id}")
+        notify_completion(item, self.sfn_client)
+        return True
+
+    def register_part(self, request_id, batch_id, first_batch, last_batch):
+        """
+        Record that the result part of a batch was written, on the item of its
+        range of batches. Batch ids are added to a set, so a redelivered batch is
+        only counted once.
+        Args:
+            request_id (str): The request of the batch.
+            batch_id (int): The batch whose part was written.
+            first_batch (int): First batch of the range.
+            last_batch (int): Last batch of the range.
+        Returns:
+            bool: True if the part of every batch of the range was written.
+        """
+        response = self.table.update_item(
+            Key={"request_id": f"{request_id}#segment#{first_batch}"},
+            UpdateExpression="ADD batches :batch SET expires_at = :expires",
+            ExpressionAttributeValues={
+                ":batch": {batch_id},
+                ":expires": int(time.time()) + self.marker_ttl_seconds,
+            },
+            ReturnValues="UPDATED_NEW",
+        )
+        return len(response["Attributes"]["batches"]) == last_batch - first_batch + 1
+
+    def record_latency(self, seconds, records):
+        """
+        Fold the processing time of a batch into this worker's moving average
+        and publish it for split_batches to size the next batches.
+        The average is written at most once per stats interval; failures to write
+        it are logged and ignored.
+        Args:
+            seconds (float): Time spent processing the batch.
+            records (int): Number of contacts in the batch.
+        """
+        if records <= 0:
+            return
+        latency = seconds / records
+        if self.seconds_per_record is None:
+            self.seconds_per_record = latency
+        else:
+            self.seconds_per_record += self.latency_smoothing * (latency - self.seconds_per_record)
+
+        now = time.monotonic()
+        if self._stats_written_at is not None and now - self._stats_written_at < self.stats_interval_seconds:
+            return
+        self._stats_written_at = now
+        try:
+            self.table.put_item(
+                Item={
+                    "request_id": WORKER_STATS_KEY,
+                    "seconds_per_record": Decimal(f"{self.seconds_per_record:.6f}"),
+                    "updated_at": int(time.time()),
+                }
+            )
+        except ClientError as e:
+            print(f"Error publishing worker latency: {e}")
@@ -1,18 +1,140 @@
-import boto3
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from ...common.aws_clients import lazy_table
+from ...common.metrics import NullMetrics
+
+# DynamoDB accepts at most 25 put requests per BatchWriteItem call
+MAX_BATCH_WRITE_ITEMS = 25
+
 
 class DynamoDBClient:
     """
     Handles interactions with the DynamoDB table.
     """
 
-    def __init__(self, table_name):
+    def __init__(
+        self, table_name, bulk_write=True, max_workers=1, max_retries=5, base_backoff=0.05, max_backoff=2.0, metrics=None,
+    ):
+        """
+        Args:
+            table_name (str): The name of the DynamoDB table.
+            bulk_write (bool): Group records into BatchWriteItem calls instead of one put_item per record.
+            max_workers (int): Number of chunks written concurrently in bulk mode.
+            max_retries (int): Retries for unprocessed items before they are reported as failed.
+            base_backoff (float): Base delay in seconds for the jittered exponential backoff.
+            max_backoff (float): Upper bound in seconds for a single backoff delay.
+            metrics (Metrics): Receives the consumed write capacity, retries and failed writes.
+        """
         self.table_name = table_name
-        self.dynamodb = boto3.resource("dynamodb")
-        self.table = self.dynamodb.Table(table_name)
+        self.table = lazy_table(table_name)
+        self.bulk_write = bulk_write
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.metrics = metrics if metrics is not None else NullMetrics()
 
     def save_records(self, records):
         """
         Save a list of records to DynamoDB.
+        Returns:
+            dict: Write report with the positions of the records that were
+                "succeeded" and "failed", relative to the input list.
+        """
+        if not self.bulk_write:
+            return self._put_records(records)
+
+        chunks = [
+            list(range(start, min(start + MAX_BATCH_WRITE_ITEMS, len(records))))
+            for start in range(0, len(records), MAX_BATCH_WRITE_ITEMS)
+        ]
+        if self.max_workers > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+                results = list(executor.map(lambda chunk: self._write_chunk(records, chunk), chunks))
+        else:
+            results = [self._write_chunk(records, chunk) for chunk in chunks]
+
+        failed = sorted(position for chunk_failed in results for position in chunk_failed)
+        failed_set = set(failed)
+        return {
+            "succeeded": [position for position in range(len(records)) if position not in failed_set],
+            "failed": failed,
+        }
+
+    def _put_records(self, records):
+        """
+        Write records one by one with put_item.
+        """
+        report = {"succeeded": [], "failed": []}
+        for position, record in enumerate(records):
+            try:
+                response = self.table.put_item(Item=record, ReturnConsumedCapacity="TOTAL")
+                self._record_response(response)
+                report["succeeded"].append(position)
+            except ClientError as e:
+                print(f"Error saving record {position}: {e}")
+                self.metrics.add("WriteErrors")
+                report["failed"].append(position)
+        return report
+
+    def _write_chunk(self, records, positions):
+        """
+        Write up to 25 records with BatchWriteItem, retrying unprocessed items.
+        Returns:
+            list: Positions of the records that could not be written.
+        """
+        # The resource client is thread-safe and handles (de)serialization of Python types
+        client = self.table.meta.client
+        pending = list(positions)
+        attempt = 0
+        while pending:
+            request = [{"PutRequest": {"Item": records[position]}} for position in pending]
+            try:
+                response = client.batch_write_item(
+                    RequestItems={self.table_name: request}, ReturnConsumedCapacity="TOTAL"
+                )
+            except ClientError as e:
+                print(f"Error writing batch to DynamoDB: {e}")
+                self.metrics.add("WriteErrors")
+                return pending
+            self._record_response(response)
+
+            unprocessed = response.get("UnprocessedItems", {}).get(self.table_name, [])
+            if not unprocessed:
+                return []
+
+            # Match unprocessed items back to their positions, in order
+            unprocessed_items = [entry["PutRequest"]["Item"] for entry in unprocessed]
+            pending = [position for position in pending if records[position] in unprocessed_items]
+
+            attempt += 1
+            if attempt > self.max_retries:
+                print(f"Giving up on {len(pending)} unprocessed items after {self.max_retries} retries")
+                return pending
+            self.metrics.add("WriteRetries")
+            time.sleep(self._backoff(attempt))
+        return []
+
+    def _record_response(self, response):
+        """
+        Count the write capacity a call consumed and the throttling retries botocore made.
+        """
+        consumed = response.get("ConsumedCapacity", [])
+        if isinstance(consumed, dict):
+            consumed = [consumed]
+        capacity = sum(entry.get("CapacityUnits", 0) for entry in consumed)
+        if capacity:
+            self.metrics.add("ConsumedWriteCapacity", float(capacity))
+        retries = response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        if retries:
+            self.metrics.add("RequestRetries", retries)
+
+    def _backoff(self, attempt):
+        """
+        Full-jitter exponential backoff delay for the given retry attempt.
         """
-        for record in records:
-            self.table.put_item(Item=record)
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
@@ -0,0 +1 @@
+from .enrichment_cache import EnrichmentCache, CachingProvider, BulkCachingProvider, cached_provider, normalize_key
\ No newline at end of file
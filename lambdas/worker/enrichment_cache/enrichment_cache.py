@@ -0,0 +1,260 @@
+import threading
+import time
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+from ...common.aws_clients import lazy_table
+from ...common.contact_key import normalize_key
+
+# BatchGetItem accepts at most 100 keys per call
+MAX_BATCH_GET_KEYS = 100
+
+
+class EnrichmentCache:
+    """
+    In-process LRU cache of enrichment results with a TTL, optionally backed by
+    a shared DynamoDB table. The in-process cache lives at module level in the
+    worker, so it survives warm Lambda invocations.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=3600, table_name=None):
+        """
+        Args:
+            max_entries (int): Entries kept in memory before the least recently used is evicted.
+            ttl_seconds (int): Lifetime of a cached result.
+            table_name (str): Optional DynamoDB table shared by all workers, keyed on "cache_key"
+                with TTL enabled on "expires_at".
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.table = lazy_table(table_name) if table_name else None
+        self.stats = {"hits": 0, "shared_hits": 0, "misses": 0}
+
+    def get(self, key):
+        """
+        Look up the enrichment fields cached for a key.
+        Returns:
+            dict: Cached fields, or None on a miss.
+        """
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        """
+        Look up several keys, checking the shared table once for all local misses.
+        Returns:
+            list: Cached fields for each key, None for misses.
+        """
+        now = time.time()
+        results = [self._get_local(key, now) for key in keys]
+        local_misses = {position for position, fields in enumerate(results) if fields is None}
+        if self.table is not None and local_misses:
+            shared = self._get_shared({keys[position] for position in local_misses}, now)
+            for position in local_misses:
+                fields = shared.get(keys[position])
+                if fields is not None:
+                    results[position] = fields
+                    self._put_local(keys[position], fields, now)
+
+        with self.lock:
+            for position, fields in enumerate(results):
+                if fields is None:
+                    self.stats["misses"] += 1
+                elif position in local_misses:
+                    self.stats["shared_hits"] += 1
+                else:
+                    self.stats["hits"] += 1
+        return results
+
+    def put(self, key, fields):
+        """
+        Cache the enrichment fields of a key locally and in the shared table.
+        """
+        self.put_many([(key, fields)])
+
+    def put_many(self, entries):
+        """
+        Cache several (key, fields) pairs.
+        """
+        now = time.time()
+        for key, fields in entries:
+            self._put_local(key, fields, now)
+        if self.table is None or not entries:
+            return
+        expires_at = int(now + self.ttl_seconds)
+        try:
+            with self.table.batch_writer(overwrite_by_pkeys=["cache_key"]) as writer:
+                for key, fields in entries:
+                    writer.put_item(Item={"cache_key": self._shared_key(key), "fields": fields, "expires_at": expires_at})
+        except (ClientError, TypeError) as e:
+            # The shared cache is an optimization; never fail enrichment because of it
+            print(f"Error writing to the shared enrichment cache: {e}")
+
+    def _get_local(self, key, now):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, fields = entry
+            if expires_at <= now:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return fields
+
+    def _put_local(self, key, fields, now):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (now + self.ttl_seconds, fields)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _get_shared(self, keys, now):
+        """
+        Fetch keys from the shared table with BatchGetItem.
+        Returns:
+            dict: Cached fields by key for the keys found and not expired.
+        """
+        found = {}
+        keys_by_shared_key = {self._shared_key(key): key for key in keys}
+        shared_keys = list(keys_by_shared_key)
+        client = self.table.meta.client
+        try:
+            for start in range(0, len(shared_keys), MAX_BATCH_GET_KEYS):
+                request = {
+                    self.table.name: {
+                        "Keys": [{"cache_key": shared_key} for shared_key in shared_keys[start:start + MAX_BATCH_GET_KEYS]],
+                    }
+                }
+                while request:
+                    response = client.batch_get_item(RequestItems=request)
+                    for item in response.get("Responses", {}).get(self.table.name, []):
+                        # Expired items linger until DynamoDB's TTL sweep removes them
+                        if item.get("expires_at", 0) > now:
+                            found[keys_by_shared_key[item["cache_key"]]] = item["fields"]
+                    request = response.get("UnprocessedKeys")
+        except ClientError as e:
+            print(f"Error reading the shared enrichment cache: {e}")
+        return found
+
+    @staticmethod
+    def _shared_key(key):
+        return "|".join(key)
+
+
+class CachingProvider:
+    """
+    Wraps a data provider so repeated contacts are served from an EnrichmentCache.
+    Only the fields the provider adds or changes are cached, under the contact's
+    normalized identity prefixed with the namespace of the provider.
+    """
+
+    def __init__(self, provider, cache, namespace):
+        """
+        Args:
+            provider: The data provider or provider chain to wrap.
+            cache (EnrichmentCache): Cache shared by every wrapped provider.
+            namespace (str): Identifies the provider and its version, so results are
+                never served to another provider or chain.
+        """
+        self.provider = provider
+        self.cache = cache
+        self.namespace = namespace
+
+    def __getattr__(self, name):
+        # Expose the wrapped provider's settings (e.g. max_concurrency)
+        return getattr(self.provider, name)
+
+    def enrich_record(self, record):
+        """
+        Enrich a record, using the cached result for a known contact.
+        """
+        key = self._key(record)
+        if key is None:
+            return self.provider.enrich_record(record)
+
+        fields = self.cache.get(key)
+        if fields is not None:
+            return {**record, **fields}
+
+        enriched_record = self.provider.enrich_record(record)
+        self.cache.put(key, _added_fields(record, enriched_record))
+        return enriched_record
+
+    def _key(self, record):
+        """
+        Cache key of a record, or None if it has no identity.
+        """
+        key = normalize_key(record)
+        return None if key is None else (self.namespace, *key)
+
+
+class BulkCachingProvider(CachingProvider):
+    """
+    CachingProvider for providers that implement enrich_records.
+    """
+
+    def enrich_records(self, records):
+        """
+        Enrich a batch, calling the provider in bulk for the cache misses only.
+        """
+        keys = [self._key(record) for record in records]
+        cacheable = [position for position, key in enumerate(keys) if key is not None]
+        cached = dict(zip(cacheable, self.cache.get_many([keys[position] for position in cacheable])))
+
+        enriched_records = [None] * len(records)
+        misses = []
+        for position, record in enumerate(records):
+            fields = cached.get(position)
+            if fields is None:
+                misses.append(position)
+            else:
+                enriched_records[position] = {**record, **fields}
+        if not misses:
+            return enriched_records
+
+        # Call the provider once per distinct contact; duplicates reuse the result
+        first_positions = {}
+        calls = []
+        for position in misses:
+            key = keys[position]
+            if key is None or key not in first_positions:
+                if key is not None:
+                    first_positions[key] = position
+                calls.append(position)
+
+        fresh = self.provider.enrich_records([records[position] for position in calls])
+        new_entries = {}
+        for position, enriched_record in zip(calls, fresh):
+            enriched_records[position] = enriched_record
+            if enriched_record is not None and keys[position] is not None:
+                new_entries[keys[position]] = _added_fields(records[position], enriched_record)
+        for position in misses:
+            fields = new_entries.get(keys[position])
+            if enriched_records[position] is None and fields is not None:
+                enriched_records[position] = {**records[position], **fields}
+        self.cache.put_many(list(new_entries.items()))
+        return enriched_records
+
+
+def cached_provider(provider, cache, namespace):
+    """
+    Wrap a provider with the caching layer matching its interface.
+    """
+    if callable(getattr(provider, "enrich_records", None)):
+        return BulkCachingProvider(provider, cache, namespace)
+    return CachingProvider(provider, cache, namespace)
+
+
+def _added_fields(record, enriched_record):
+    """
+    Fields of the enriched record that are new or differ from the input record.
+    """
+    return {
+        field: value for field, value in enriched_record.items()
+        if field not in record or record[field] != value
+    }
@@ -0,0 +1 @@
+from .failed_record_queue import FailedRecordQueue
\ No newline at end of file
@@ -0,0 +1,77 @@
+import json
+
+from ...common.aws_clients import lazy_client
+
+# SendMessageBatch limits: 10 entries and 256 KB for the whole request
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 256 * 1024
+
+
+class FailedRecordQueue:
+    """
+    Sends the records of a batch that could not be enriched or saved to a
+    failure queue, so the rest of the batch is not redelivered because of them.
+    On a FIFO queue each record is deduplicated on its request, batch and
+    position, so a batch redelivered after a partial send does not send the
+    records that already went through a second time.
+    """
+
+    def __init__(self, queue_url):
+        """
+        Args:
+            queue_url (str): URL of the queue receiving failed records; a ".fifo" queue
+                makes the sends idempotent within SQS's five minute deduplication window.
+        """
+        self.queue_url = queue_url
+        self.fifo = queue_url.endswith(".fifo")
+        self.sqs_client = lazy_client("sqs")
+
+    def send_records(self, request_id, batch_id, batch, positions):
+        """
+        Send one message per failed record.
+        Args:
+            request_id (str): The request of the batch.
+            batch_id (int): The batch the records belong to.
+            batch (list): The contacts of the batch.
+            positions (list): Positions of the failed contacts in the batch.
+        Raises:
+            RuntimeError: If some records could not be sent, so the caller lets
+                SQS redeliver the batch instead of losing them.
+        """
+        entries = [
+            {
+                "Id": str(position),
+                "MessageBody": json.dumps(
+                    {
+                        "request_id": request_id,
+                        "batch_id": batch_id,
+                        "position": position,
+                        "failed_record": batch[position],
+                    }
+                ),
+            }
+            for position in positions
+        ]
+        if self.fifo:
+            for entry in entries:
+                entry["MessageGroupId"] = request_id
+                entry["MessageDeduplicationId"] = f"{request_id}#{batch_id}#{entry['Id']}"
+
+        failed = []
+        group, group_bytes = [], 0
+        for entry in entries:
+            entry_bytes = len(entry["MessageBody"].encode("utf-8"))
+            if group and (len(group) == MAX_BATCH_ENTRIES or group_bytes + entry_bytes > MAX_BATCH_BYTES):
+                failed += self._send_group(group)
+                group, group_bytes = [], 0
+            group.append(entry)
+            group_bytes += entry_bytes
+        if group:
+            failed += self._send_group(group)
+
+        if failed:
+            raise RuntimeError(f"Failed to send records {failed} of batch {batch_id} to the failure queue")
+
+    def _send_group(self, entries):
+        response = self.sqs_client.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+        return [int(failure["Id"]) for failure in response.get("Failed", [])]
@@ -0,0 +1 @@
+from .part_writer import ResultPartWriter
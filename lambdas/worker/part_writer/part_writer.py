@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from ...common.aws_clients import lazy_client
+from ...common.output_formats import CONTENT_TYPES, serialize_records
+from ...common.record_store import PARTITION_KEY
+from ...common.result_parts import part_key, segment_key
+
+
+class ResultPartWriter:
+    """
+    Writes the enriched records of each processed batch to its own S3 object,
+    so the aggregation only has to stitch the parts together or list them.
+    """
+
+    def __init__(self, bucket_name, read_workers=8):
+        """
+        Args:
+            bucket_name (str): Bucket of the aggregated output.
+            read_workers (int): Parts downloaded concurrently when joining them into a segment.
+        """
+        self.bucket_name = bucket_name
+        self.read_workers = max(1, read_workers)
+        self.s3_client = lazy_client("s3")
+
+    def write(self, request_id, batch_id, records, output_format):
+        """
+        Serialize the stored records of a batch into its part object.
+        A redelivered batch overwrites its part.
+        Args:
+            request_id (str): The request of the batch.
+            batch_id (int): The batch identifier within the request.
+            records (list): The records saved for the batch, in position order.
+            output_format (str): Output format of the request.
+        Returns:
+            str: Key of the part object.
+        """
+        # Sharded records are stored under "<request_id>#<shard>"; the output shows the request
+        records = [{**record, PARTITION_KEY: request_id} for record in records]
+        key = part_key(request_id, batch_id, output_format)
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=key,
+            Body=b"".join(serialize_records(records, output_format)),
+            ContentType=CONTENT_TYPES[output_format],
+        )
+        return key
+
+    def write_segment(self, request_id, first_batch, last_batch, output_format):
+        """
+        Join the parts of a range of batches into one segment object. Parts are
+        a few KB, far below the 5 MB minimum of a multipart upload part; segments
+        are large enough for the aggregation to copy them with UploadPartCopy
+        instead of downloading every part. Only formats whose parts concatenate
+        (see CONCATENABLE_FORMATS) can be joined.
+        Args:
+            request_id (str): The request of the batches.
+            first_batch (int): First batch of the range.
+            last_batch (int): Last batch of the range.
+            output_format (str): Output format of the request.
+        Returns:
+            str: Key of the segment object.
+        """
+        def read(batch_id):
+            key = part_key(request_id, batch_id, output_format)
+            return self.s3_client.get_object(Bucket=self.bucket_name, Key=key)["Body"].read()
+
+        with ThreadPoolExecutor(max_workers=self.read_workers) as executor:
+            body = b"".join(executor.map(read, range(first_batch, last_batch + 1)))
+        key = segment_key(request_id, first_batch, last_batch, output_format)
+        self.s3_client.put_object(
+            Bucket=self.bucket_name, Key=key, Body=body, ContentType=CONTENT_TYPES[output_format]
+        )
+        return key
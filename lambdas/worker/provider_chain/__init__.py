@@ -0,0 +1 @@
+from .provider_chain import HedgedProvider, LatencyHistogram, WaterfallProvider, build_chain, timed_provider
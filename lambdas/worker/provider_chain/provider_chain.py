@@ -0,0 +1,317 @@
+import bisect
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ...common.metrics import NullMetrics
+from ..provider_guard import ProviderUnavailableError, is_provider_failure
+
+# Latency bucket upper bounds in seconds, log-spaced from 1 ms to about 60 s
+_BUCKET_BOUNDS = [0.001 * 1.25 ** exponent for exponent in range(50)]
+
+# Threads running the calls of every hedged chain of the container
+HEDGE_MAX_WORKERS = 32
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def shared_executor():
+    """
+    Bounded thread pool shared by the hedged chains, created on first use.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="hedge")
+    return _executor
+
+
+class LatencyHistogram:
+    """
+    Thread-safe histogram of a provider's call latencies.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(_BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self.lock:
+            self.counts[bisect.bisect_left(_BUCKET_BOUNDS, seconds)] += 1
+            self.count += 1
+
+    def percentile(self, fraction):
+        """
+        Upper bound of the bucket holding the given fraction of the calls.
+        Returns:
+            float: Latency in seconds, or None before any call was observed.
+        """
+        with self.lock:
+            if not self.count:
+                return None
+            rank = max(1, math.ceil(fraction * self.count))
+            seen = 0
+            for bucket, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank:
+                    return _BUCKET_BOUNDS[bucket] if bucket < len(_BUCKET_BOUNDS) else math.inf
+        return math.inf
+
+
+class TimedProvider:
+    """
+    Records the latency of every call of a provider in a histogram, and as the
+    "ProviderLatency" metric when given metrics.
+    """
+
+    def __init__(self, provider, histogram, metrics=None):
+        self.provider = provider
+        self.histogram = histogram
+        self.metrics = metrics if metrics is not None else NullMetrics()
+
+    def __getattr__(self, name):
+        # Expose the wrapped provider's settings (e.g. max_concurrency)
+        return getattr(self.provider, name)
+
+    def enrich_record(self, record):
+        started = time.perf_counter()
+        try:
+            return self.provider.enrich_record(record)
+        finally:
+            self._observe(time.perf_counter() - started)
+
+    def _observe(self, seconds):
+        self.histogram.observe(seconds)
+        self.metrics.put("ProviderLatency", seconds * 1000, "Milliseconds")
+
+
+class BulkTimedProvider(TimedProvider):
+    """
+    TimedProvider for providers that implement enrich_records; a bulk call is
+    recorded as its latency per record.
+    """
+
+    def enrich_records(self, records):
+        started = time.perf_counter()
+        try:
+            return self.provider.enrich_records(records)
+        finally:
+            if records:
+                self._observe((time.perf_counter() - started) / len(records))
+
+
+def timed_provider(provider, histogram, metrics=None):
+    """
+    Wrap a provider with the latency recorder matching its interface.
+    """
+    if callable(getattr(provider, "enrich_records", None)):
+        return BulkTimedProvider(provider, histogram, metrics)
+    return TimedProvider(provider, histogram, metrics)
+
+
+class WaterfallProvider:
+    """
+    Asks a list of providers in turn. Each provider only receives the records
+    the previous ones left without one of the required fields, so no lookup
+    is paid for twice. A provider that is unavailable or failing (throttling,
+    network errors, timeouts) is skipped; any other error, such as a KeyError
+    for a malformed record or a bug, propagates.
+    """
+
+    def __init__(self, providers, required_fields=("professional_email",)):
+        """
+        Args:
+            providers (list): Providers in the order they are asked.
+            required_fields (tuple): Fields a record needs to leave the waterfall.
+        """
+        self.providers = providers
+        self.required_fields = tuple(required_fields)
+        limits = [provider.max_concurrency for provider in providers if hasattr(provider, "max_concurrency")]
+        if limits:
+            self.max_concurrency = min(limits)
+
+    def enrich_record(self, record):
+        """
+        Enrich a record with the first providers that fill the required fields.
+        Raises:
+            Exception: The last provider error, if no provider returned a record.
+        """
+        return self.enrich_records([record])[0]
+
+    def enrich_records(self, records):
+        """
+        Enrich a batch, sending each provider only the records still incomplete.
+        Returns:
+            list: Enriched records, best effort for records no provider completed,
+                and None for records every provider failed on.
+        Raises:
+            Exception: The last provider error, if no record was enriched at all.
+        """
+        results = [None] * len(records)
+        pending = list(range(len(records)))
+        last_error = None
+        for provider in self.providers:
+            if not pending:
+                break
+            inputs = [results[position] or records[position] for position in pending]
+            outputs, error = self._call(provider, inputs)
+            last_error = error or last_error
+            still_pending = []
+            for position, output in zip(pending, outputs):
+                if output is not None:
+                    results[position] = output
+                if results[position] is None or not self._complete(results[position]):
+                    still_pending.append(position)
+            pending = still_pending
+
+        if last_error is not None and all(result is None for result in results):
+            raise last_error
+        return results
+
+    @staticmethod
+    def _call(provider, inputs):
+        """
+        Call one provider, in bulk when it supports it.
+        Returns:
+            tuple: One output per input, None where the provider failed, and the
+                last error raised by the provider.
+        Raises:
+            Exception: Any error that is not a provider failure.
+        """
+        outputs = [None] * len(inputs)
+        if callable(getattr(provider, "enrich_records", None)):
+            try:
+                bulk_outputs = list(provider.enrich_records(inputs))
+            except Exception as e:
+                if not _is_provider_failure(e):
+                    raise
+                return outputs, e
+            if len(bulk_outputs) == len(inputs):
+                outputs = bulk_outputs
+
+        # Records the bulk call left out are asked one by one, as in BatchProcessor
+        error = None
+        for position, record in enumerate(inputs):
+            if outputs[position] is not None:
+                continue
+            try:
+                outputs[position] = provider.enrich_record(record)
+            except Exception as e:
+                if not _is_provider_failure(e):
+                    raise
+                error = e
+        return outputs, error
+
+    def _complete(self, record):
+        return all(record.get(field) for field in self.required_fields)
+
+
+def _is_provider_failure(error):
+    """
+    Check whether a waterfall should move past a provider after this error.
+    """
+    return isinstance(error, ProviderUnavailableError) or is_provider_failure(error)
+
+
+class HedgedProvider:
+    """
+    Calls a primary provider and, when it has not answered by the chosen
+    percentile of its observed latency, races a secondary provider. The first
+    successful answer wins; the slower call finishes in the background and its
+    result is dropped.
+    """
+
+    def __init__(self, primary, secondary, histogram, percentile=0.95, min_samples=50, executor=None):
+        """
+        Args:
+            primary: Provider asked first.
+            secondary: Provider raced against a slow primary.
+            histogram (LatencyHistogram): Latencies of the primary, which set the hedge delay.
+            percentile (float): Fraction of primary calls expected to finish before hedging.
+            min_samples (int): Primary calls observed before any hedging.
+            executor (Executor): Runs the provider calls; defaults to the pool shared by all hedged chains.
+        """
+        self.primary = primary
+        self.secondary = secondary
+        self.histogram = histogram
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.executor = executor if executor is not None else shared_executor()
+        # Calls of the batch's enrichment threads update the counters concurrently
+        self.stats = {"calls": 0, "hedged": 0, "secondary_wins": 0}
+        self.stats_lock = threading.Lock()
+        limits = [provider.max_concurrency for provider in (primary, secondary) if hasattr(provider, "max_concurrency")]
+        if limits:
+            self.max_concurrency = min(limits)
+
+    def hedge_delay(self):
+        """
+        Seconds to wait for the primary before racing the secondary, or None
+        while too few primary calls were observed.
+        """
+        if self.histogram.count < self.min_samples:
+            return None
+        return self.histogram.percentile(self.percentile)
+
+    def enrich_record(self, record):
+        self._count("calls")
+        primary = self.executor.submit(self.primary.enrich_record, record)
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if done:
+            return self._result_or_fallback(primary, record)
+
+        self._count("hedged")
+        secondary = self.executor.submit(self.secondary.enrich_record, record)
+        pending = {primary, secondary}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is secondary:
+                    self._count("secondary_wins")
+                return result
+        raise error
+
+    def _count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def _result_or_fallback(self, future, record):
+        try:
+            return future.result()
+        except ProviderUnavailableError:
+            # The primary is shedding load: ask the secondary right away
+            return self.secondary.enrich_record(record)
+
+
+def build_chain(spec, providers, histograms):
+    """
+    Build a provider chain from its configuration.
+    Args:
+        spec (dict): "strategy" ("waterfall" or "hedged"), the "providers" names in
+            order and the strategy options ("required_fields", "percentile", "min_samples").
+        providers (dict): Guarded and timed providers by name.
+        histograms (dict): Latency histograms by provider name.
+    """
+    members = [providers[name] for name in spec["providers"]]
+    strategy = spec.get("strategy", "waterfall")
+    if strategy == "waterfall":
+        return WaterfallProvider(members, required_fields=spec.get("required_fields", ("professional_email",)))
+    if strategy == "hedged":
+        if len(members) != 2:
+            raise ValueError("A hedged chain needs exactly two providers")
+        return HedgedProvider(
+            members[0],
+            members[1],
+            histograms[spec["providers"][0]],
+            percentile=spec.get("percentile", 0.95),
+            min_samples=spec.get("min_samples", 50),
+        )
+    raise ValueError(f"Unsupported provider chain strategy '{strategy}'")
@@ -1,18 +1,89 @@
+import hashlib
+import json
+
 from ..data_provider import DataProvider
+from ..enrichment_cache import cached_provider
+from ..provider_chain import LatencyHistogram, build_chain, timed_provider
+from ..provider_guard import guarded_provider
 
 class ProviderFactory:
     """
     Factory for managing data providers.
     """
 
-    def __init__(self):
+    def __init__(self, cache=None, rate_limiters=None, circuit_breakers=None, providers=None, chains=None, metrics=None):
+        """
+        Args:
+            cache (EnrichmentCache): Optional cache wrapped around every provider.
+            rate_limiters (dict): Optional TokenBucket or SharedRateLimiter per provider name.
+            circuit_breakers (dict): Optional CircuitBreaker per provider name.
+            providers (dict): Additional data providers by name, next to "default".
+            chains (dict): Provider chains by name, each a spec with a "strategy"
+                ("waterfall" or "hedged") and the names of its "providers".
+            metrics (Metrics): Receives the latency of every provider call.
+        """
+        self.cache = cache
+        self.rate_limiters = rate_limiters or {}
+        self.circuit_breakers = circuit_breakers or {}
+        self.chains = chains or {}
+        self.metrics = metrics
+        # Latency of every call of each provider, used to time hedged requests
+        self.histograms = {}
         # Register providers (only one for now, scalable later)
-        self.providers = {
-            "default": DataProvider(),
-        }
+        self.sources = {"default": DataProvider(), **(providers or {})}
+        self.providers = {}
 
     def get_provider(self, provider_name):
         """
-        Retrieve a data provider by name.
+        Retrieve a data provider or provider chain by name.
+        Raises:
+            ValueError: If the name, or a member of the chain, is not a registered provider.
+        """
+        provider = self.providers.get(provider_name)
+        if provider is None:
+            provider = self.providers[provider_name] = self._build(provider_name)
+        return provider
+
+    def supports_bulk(self, provider_name):
+        """
+        Check whether a provider implements the optional enrich_records bulk API.
+        """
+        return callable(getattr(self.get_provider(provider_name), "enrich_records", None))
+
+    def _build(self, provider_name):
+        names = self.chains[provider_name]["providers"] if provider_name in self.chains else [provider_name]
+        unknown = [name for name in names if name not in self.sources]
+        if unknown:
+            raise ValueError(f"Unknown provider {', '.join(map(repr, unknown))} in '{provider_name}'")
+        if provider_name in self.chains:
+            members = {name: self._member(name) for name in self.chains[provider_name]["providers"]}
+            provider = build_chain(self.chains[provider_name], members, self.histograms)
+        else:
+            provider = self._member(provider_name)
+        if self.cache is None:
+            return provider
+        return cached_provider(provider, self.cache, self._cache_namespace(provider_name))
+
+    def _cache_namespace(self, provider_name):
+        """
+        Prefix of the cache keys of a provider: its name and version, or for a
+        chain its name and a digest of its spec and members' versions, so a
+        result is only served by the configuration that produced it.
+        """
+        if provider_name not in self.chains:
+            return f"{provider_name}@{getattr(self.sources[provider_name], 'version', '0')}"
+        spec = self.chains[provider_name]
+        members = [self._cache_namespace(name) for name in spec["providers"]]
+        digest = hashlib.sha256(json.dumps([spec, members], sort_keys=True, default=str).encode("utf-8"))
+        return f"{provider_name}@{digest.hexdigest()[:12]}"
+
+    def _member(self, provider_name):
+        """
+        A single provider behind its guard, with its latency recorded. Cache hits
+        neither spend rate limit tokens nor count towards the circuit breaker.
         """
-        return self.providers.get(provider_name, DataProvider())
+        provider = guarded_provider(
+            self.sources[provider_name], self.rate_limiters.get(provider_name), self.circuit_breakers.get(provider_name)
+        )
+        histogram = self.histograms.setdefault(provider_name, LatencyHistogram())
+        return timed_provider(provider, histogram, self.metrics)
@@ -0,0 +1,11 @@
+from .provider_guard import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ProviderError,
+    ProviderUnavailableError,
+    RateLimitTimeoutError,
+    SharedRateLimiter,
+    TokenBucket,
+    guarded_provider,
+    is_provider_failure,
+)
@@ -0,0 +1,372 @@
+import math
+import threading
+import time
+from collections import deque
+
+from botocore.exceptions import ClientError
+
+from ...common.aws_clients import lazy_table
+
+
+# Error codes of AWS-style APIs meaning the provider is throttling or failing
+_PROVIDER_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "ServiceUnavailable",
+    "InternalServerError",
+    "InternalFailure",
+}
+
+
+class ProviderError(Exception):
+    """
+    Raised by data providers for failures on their side, such as throttling or
+    server errors. Unlike errors caused by the record itself, these count
+    towards the circuit breaker.
+    """
+
+
+class ProviderUnavailableError(Exception):
+    """
+    The provider must not be called right now. The batch should be retried
+    later rather than its records reported as failed.
+    """
+
+
+class CircuitOpenError(ProviderUnavailableError):
+    """
+    The provider's circuit breaker is open.
+    """
+
+
+class RateLimitTimeoutError(ProviderUnavailableError):
+    """
+    No rate limit token became available in time.
+    """
+
+
+def is_provider_failure(error):
+    """
+    Check whether an error of a provider call says something about the provider's health.
+    Network errors and timeouts (OSError), ProviderError, and throttling or 5xx
+    responses count; validation errors such as a KeyError for a missing field do not.
+    """
+    if isinstance(error, (ProviderError, OSError)):
+        return True
+    if isinstance(error, ClientError):
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        return error.response.get("Error", {}).get("Code") in _PROVIDER_ERROR_CODES or status == 429 or status >= 500
+    # HTTP client errors (e.g. requests.HTTPError) carry the response status
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is None:
+        status = getattr(error, "status_code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+class TokenBucket:
+    """
+    In-process token bucket limiting the calls of one worker.
+    """
+
+    def __init__(self, rate, burst=None, max_wait_seconds=5.0):
+        """
+        Args:
+            rate (float): Tokens added per second.
+            burst (int): Bucket capacity; defaults to one second of tokens.
+            max_wait_seconds (float): Longest acquire waits before giving up.
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, math.ceil(rate))
+        self.max_wait_seconds = max_wait_seconds
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+        # Calls larger than the burst put the bucket in debt, so any size is served
+        self.max_tokens = None
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens, waiting for the bucket to refill if needed. A call needing
+        more than the burst waits for a full bucket and leaves it in debt.
+        Raises:
+            RateLimitTimeoutError: If the tokens are not available within max_wait_seconds.
+        """
+        deadline = time.monotonic() + self.max_wait_seconds
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                needed = min(tokens, self.burst)
+                if self.tokens >= needed:
+                    self.tokens -= tokens
+                    return
+                wait = (needed - self.tokens) / self.rate
+            if now + wait > deadline:
+                raise RateLimitTimeoutError(f"No rate limit token within {self.max_wait_seconds}s")
+            time.sleep(wait)
+
+
+class SharedRateLimiter:
+    """
+    Rate limit shared by every worker through a DynamoDB table.
+    Each second is a window allowing "rate" tokens, counted on one item of the
+    table. A worker leases a few tokens of the current window at a time with a
+    conditional update and spends them locally, so most calls do not touch
+    DynamoDB. Tokens left in a lease when the window ends are dropped.
+    """
+
+    def __init__(self, table_name, name, rate, lease_size=None, max_wait_seconds=5.0):
+        """
+        Args:
+            table_name (str): Table keyed on "request_id" with TTL on "expires_at";
+                the control table is used in the worker.
+            name (str): Name of the limited provider.
+            rate (int): Calls per second allowed across all workers.
+            lease_size (int): Tokens leased per DynamoDB update; defaults to a tenth of the rate.
+            max_wait_seconds (float): Longest acquire waits before giving up.
+        """
+        self.table = lazy_table(table_name)
+        self.name = name
+        self.rate = max(1, int(rate))
+        self.lease_size = max(1, min(lease_size or self.rate // 10, self.rate))
+        self.max_wait_seconds = max_wait_seconds
+        self.lock = threading.Lock()
+        self.window = None
+        self.leased = 0
+        # Largest acquire a window can serve; bulk calls are split to fit
+        self.max_tokens = self.rate
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens of the current window, waiting for the next windows if needed.
+        All the tokens of a call come from one window, so a call never holds
+        tokens while it waits for more.
+        Raises:
+            ValueError: If more tokens are asked than a window allows; split the call.
+            RateLimitTimeoutError: If the tokens are not available within max_wait_seconds.
+        """
+        if tokens > self.rate:
+            raise ValueError(f"Cannot take {tokens} tokens at once from a limit of {self.rate} per second")
+        deadline = time.time() + self.max_wait_seconds
+        while True:
+            with self.lock:
+                window = int(time.time())
+                if window != self.window:
+                    self.window, self.leased = window, 0
+                needed = tokens - self.leased
+                if needed > 0:
+                    # Lease only what is missing if a full lease no longer fits in the window
+                    size = max(self.lease_size, needed)
+                    self._lease(window, size) or (size > needed and self._lease(window, needed))
+                if self.leased >= tokens:
+                    self.leased -= tokens
+                    return
+            # The window is used up; wait for the next one
+            wait = window + 1 - time.time()
+            if time.time() + wait > deadline:
+                raise RateLimitTimeoutError(f"No {self.name} rate limit token within {self.max_wait_seconds}s")
+            time.sleep(max(wait, 0))
+
+    def _lease(self, window, size):
+        """
+        Lease tokens of a window from the shared table.
+        Returns:
+            bool: False if the window has fewer than size tokens left.
+        """
+        size = min(size, self.rate)
+        try:
+            self.table.update_item(
+                Key={"request_id": f"__rate_limit__#{self.name}#{window}"},
+                UpdateExpression="ADD used :size SET expires_at = :expires_at",
+                ConditionExpression="attribute_not_exists(used) OR used <= :max_used",
+                ExpressionAttributeValues={":size": size, ":max_used": self.rate - size, ":expires_at": window + 3600},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+        self.leased += size
+        return True
+
+
+class CircuitBreaker:
+    """
+    Stops calling a provider whose recent error rate is too high.
+    The breaker opens when at least failure_rate of the calls of the last
+    window_seconds failed, fails fast while open, then lets a single trial
+    call through after reset_seconds and closes again if it succeeds.
+    """
+
+    def __init__(self, failure_rate=0.5, min_calls=20, window_seconds=30.0, reset_seconds=30.0):
+        """
+        Args:
+            failure_rate (float): Share of failed calls that opens the breaker.
+            min_calls (int): Calls in the window before the failure rate is considered.
+            window_seconds (float): Length of the rolling window of outcomes.
+            reset_seconds (float): Time the breaker stays open before a trial call.
+        """
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.reset_seconds = reset_seconds
+        self.outcomes = deque()
+        self.calls = 0
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            return self._state(time.monotonic())
+
+    def before_call(self):
+        """
+        Returns:
+            bool: True if the call is the half-open trial; pass it to record or cancel.
+        Raises:
+            CircuitOpenError: If the provider must not be called.
+        """
+        with self.lock:
+            state = self._state(time.monotonic())
+            if state == "closed":
+                return False
+            if state == "half_open" and not self.trial_running:
+                self.trial_running = True
+                return True
+        raise CircuitOpenError("Provider circuit breaker is open")
+
+    def cancel(self, trial=False):
+        """
+        Release a call allowed by before_call that never reached the provider.
+        Args:
+            trial (bool): What before_call returned for the call.
+        """
+        if not trial:
+            return
+        with self.lock:
+            self.trial_running = False
+
+    def record(self, success, calls=1, trial=False):
+        """
+        Record the outcome of a call allowed by before_call.
+        Only the trial call decides whether an open breaker closes; outcomes of
+        calls that started before the breaker opened are ignored.
+        Args:
+            success (bool): Whether the provider served the call.
+            calls (int): Records the call was for, so a bulk call weighs as much
+                as the per-record calls it replaces.
+            trial (bool): What before_call returned for the call.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if trial:
+                self.trial_running = False
+                if success:
+                    self.opened_at = None
+                    self.outcomes.clear()
+                    self.calls = 0
+                    self.failures = 0
+                else:
+                    self.opened_at = now
+                return
+            if self.opened_at is not None:
+                # A call that was in flight when the breaker opened
+                return
+
+            self.outcomes.append((now, success, calls))
+            self.calls += calls
+            self.failures += 0 if success else calls
+            while self.outcomes and self.outcomes[0][0] < now - self.window_seconds:
+                _, old_success, old_calls = self.outcomes.popleft()
+                self.calls -= old_calls
+                self.failures -= 0 if old_success else old_calls
+            if self.calls >= self.min_calls and self.failures >= self.failure_rate * self.calls:
+                print(f"Opening circuit breaker after {self.failures} failures in {self.calls} calls")
+                self.opened_at = now
+
+    def _state(self, now):
+        if self.opened_at is None:
+            return "closed"
+        if now - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+
+class GuardedProvider:
+    """
+    Wraps a data provider with a rate limiter and a circuit breaker.
+    """
+
+    def __init__(self, provider, limiter=None, breaker=None):
+        self.provider = provider
+        self.limiter = limiter
+        self.breaker = breaker
+
+    def __getattr__(self, name):
+        # Expose the wrapped provider's settings (e.g. max_concurrency)
+        return getattr(self.provider, name)
+
+    def enrich_record(self, record):
+        """
+        Enrich a record once the breaker and the rate limiter allow it.
+        """
+        return self._call(self.provider.enrich_record, record, tokens=1)
+
+    def _call(self, method, argument, tokens):
+        trial = self.breaker.before_call() if self.breaker is not None else False
+        try:
+            if self.limiter is not None:
+                self.limiter.acquire(tokens)
+            result = method(argument)
+        except ProviderUnavailableError:
+            if self.breaker is not None:
+                # Waiting on the limiter says nothing about the provider's health
+                self.breaker.cancel(trial)
+            raise
+        except Exception as e:
+            if self.breaker is not None:
+                if is_provider_failure(e):
+                    self.breaker.record(False, calls=tokens, trial=trial)
+                else:
+                    # A record the provider could not use, e.g. one missing a field
+                    self.breaker.cancel(trial)
+            raise
+        if self.breaker is not None:
+            self.breaker.record(True, calls=tokens, trial=trial)
+        return result
+
+
+class BulkGuardedProvider(GuardedProvider):
+    """
+    GuardedProvider for providers that implement enrich_records.
+    """
+
+    def enrich_records(self, records):
+        """
+        Enrich a batch, taking one rate limit token per record. Batches larger
+        than the limiter can serve at once are enriched in several calls.
+        """
+        chunk_size = getattr(self.limiter, "max_tokens", None) or len(records)
+        if len(records) <= chunk_size:
+            return self._call(self.provider.enrich_records, records, tokens=len(records))
+        enriched_records = []
+        for start in range(0, len(records), chunk_size):
+            chunk = records[start:start + chunk_size]
+            enriched_records.extend(self._call(self.provider.enrich_records, chunk, tokens=len(chunk)))
+        return enriched_records
+
+
+def guarded_provider(provider, limiter=None, breaker=None):
+    """
+    Wrap a provider with the guard matching its interface.
+    """
+    if limiter is None and breaker is None:
+        return provider
+    if callable(getattr(provider, "enrich_records", None)):
+        return BulkGuardedProvider(provider, limiter, breaker)
+    return GuardedProvider(provider, limiter, breaker)
@@ -0,0 +1 @@
+from .s3_range_reader import S3RangeReader
\ No newline at end of file
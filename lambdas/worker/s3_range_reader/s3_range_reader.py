@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+
+from ...common.aws_clients import lazy_client
+
+
+class S3RangeReader:
+    """
+    Reads the contacts of one byte range of a staged S3 file.
+    """
+
+    def __init__(self, overflow_bytes=64 * 1024):
+        """
+        Args:
+            overflow_bytes (int): Extra bytes fetched past the end of the range to
+                finish the last record; more is fetched if a record is longer.
+        """
+        self.overflow_bytes = overflow_bytes
+        self.s3_client = lazy_client("s3")
+
+    def read(self, source):
+        """
+        Parse the records that start inside a range descriptor planned by split_batches.
+        Returns:
+            list: The contacts of the range, in file order.
+        """
+        start, end, size = source["start"], source["end"], source["size"]
+
+        # Read one byte before the range to know whether it starts on a record boundary
+        fetch_start = start - 1 if start > source["data_start"] else start
+        data = self._get(source, fetch_start, min(end + self.overflow_bytes, size))
+        if fetch_start < start:
+            position = data.find(b"\n") + 1
+            if position == 0:
+                data += self._read_to_newline(source, fetch_start + len(data))
+                position = data.find(b"\n") + 1
+        else:
+            position = 0
+
+        lines = []
+        while fetch_start + position < end:
+            line_end = data.find(b"\n", position)
+            if line_end < 0 and fetch_start + len(data) < size:
+                # The last record runs past the data fetched so far
+                data += self._read_to_newline(source, fetch_start + len(data))
+                line_end = data.find(b"\n", position)
+            if line_end < 0:
+                line_end = len(data)
+            line = data[position:line_end].rstrip(b"\r")
+            if line.strip():
+                lines.append(line.decode("utf-8"))
+            position = line_end + 1
+        return self._parse(source, lines)
+
+    def _read_to_newline(self, source, offset):
+        """
+        Fetch bytes from offset until a newline or the end of the file.
+        """
+        data = b""
+        while offset < source["size"]:
+            chunk = self._get(source, offset, min(offset + self.overflow_bytes, source["size"]))
+            data += chunk
+            offset += len(chunk)
+            if b"\n" in chunk:
+                break
+        return data
+
+    def _get(self, source, start, end):
+        """
+        Ranged GET of the bytes in [start, end).
+        """
+        response = self.s3_client.get_object(
+            Bucket=source["bucket"], Key=source["key"], Range=f"bytes={start}-{end - 1}"
+        )
+        return response["Body"].read()
+
+    @staticmethod
+    def _parse(source, lines):
+        if source["format"] == "csv":
+            return [dict(zip(source["columns"], row)) for row in csv.reader(io.StringIO("\n".join(lines)))]
+        return [json.loads(line) for line in lines]
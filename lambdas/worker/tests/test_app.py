@@ -2,8 +2,30 @@ import json
 import pytest
 from moto import mock_aws
 import boto3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from lambdas.worker.app import lambda_handler
+from lambdas.worker.batch_processor import BatchProcessor
+from lambdas.worker.control_table import ControlTableClient
 from lambdas.worker.dynamodb import DynamoDBClient
+from lambdas.worker.provider_factory import ProviderFactory
+from lambdas.worker.data_provider import DataProvider
+from lambdas.split_batches.s3_range_planner import S3RangePlanner
+from lambdas.worker.s3_range_reader import S3RangeReader
+from lambdas.worker.enrichment_cache import EnrichmentCache, normalize_key
+from lambdas.worker.claim_check import ClaimCheckResolver
+from lambdas.worker.failed_record_queue import FailedRecordQueue
+from lambdas.worker.part_writer import ResultPartWriter
+from lambdas.worker.provider_chain import HedgedProvider, LatencyHistogram, WaterfallProvider
+from lambdas.worker.provider_guard import CircuitBreaker, CircuitOpenError, RateLimitTimeoutError, SharedRateLimiter, guarded_provider
+from lambdas.common.aws_clients import CLIENT_CONFIG, get_client
+from lambdas.common.claim_check import pack_batch
+from lambdas.common.metrics import Metrics
+from lambdas.common.result_parts import part_key
+from lambdas.common.wire_format import encode_batch
+from lambdas.common.worker_stats import WORKER_STATS_KEY
+from boto3.dynamodb.conditions import Key
 
 @pytest.fixture
 def dynamodb_setup(monkeypatch):
@@ -17,8 +39,14 @@ def dynamodb_setup(monkeypatch):
         # Create the mock table
         table = dynamodb.create_table(
             TableName=table_name,
-            KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
-            AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
+            KeySchema=[
+                {"AttributeName": "request_id", "KeyType": "HASH"},
+                {"AttributeName": "record_key", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "request_id", "AttributeType": "S"},
+                {"AttributeName": "record_key", "AttributeType": "S"},
+            ],
             BillingMode="PAY_PER_REQUEST",
         )
 
@@ -29,6 +57,34 @@ def dynamodb_setup(monkeypatch):
         }
 
 
+@pytest.fixture
+def control_table_setup(dynamodb_setup, monkeypatch):
+    """
+    Mock control table with a request waiting on two batches.
+    """
+    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+    table = dynamodb.create_table(
+        TableName="ControlTable",
+        KeySchema=[{"AttributeName": "request_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "request_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    table.put_item(
+        Item={
+            "request_id": "uuid-12345",
+            "expected_batches": 2,
+            "processed_batches": 0,
+            "task_token": "token-12345",
+        }
+    )
+
+    control_table = ControlTableClient(table_name="ControlTable")
+    notifications = []
+    monkeypatch.setattr(control_table.sfn_client, "send_task_success", lambda **kwargs: notifications.append(kwargs))
+    monkeypatch.setattr("lambdas.worker.app.control_table", control_table)
+    yield {"table": table, "control_table": control_table, "notifications": notifications}
+
+
 @pytest.fixture
 def sqs_setup(monkeypatch):
     """
@@ -48,7 +104,7 @@ def sqs_setup(monkeypatch):
         }
 
 
-def test_lambda_handler(dynamodb_setup, sqs_setup):
+def test_lambda_handler(control_table_setup, sqs_setup):
     """
     Test the Lambda handler function.
     """
@@ -71,6 +127,8 @@ def test_lambda_handler(dynamodb_setup, sqs_setup):
             {
                 "body": json.dumps(
                     {
+                        "request_id": "uuid-12345",
+                        "batch_id": 1,
                         "batch": [
                             {"id": "1", "first_name": "John", "last_name": "Doe", "company_domain": "example.com"},
                             {"id": "2", "first_name": "Jane", "last_name": "Smith", "company_domain": "example.org"},
@@ -85,10 +143,983 @@ def test_lambda_handler(dynamodb_setup, sqs_setup):
     lambda_handler(mock_event, None)
 
     # Verify data in DynamoDB
-    table = dynamodb_setup["table"]
+    table = boto3.resource("dynamodb", region_name="us-east-1").Table("EnrichedData")
     response = table.scan()
     items = response["Items"]
 
     assert len(items) == 2
     assert any(item["professional_email"] == "john.doe@example.com" for item in items)
     assert any(item["professional_email"] == "jane.smith@example.org" for item in items)
+
+
+def test_save_records_uses_batch_writes(dynamodb_setup):
+    """
+    Test that bulk mode writes 25 records per BatchWriteItem call.
+    """
+    dynamo_client = DynamoDBClient(table_name=dynamodb_setup["table_name"])
+    calls = {"BatchWriteItem": 0, "PutItem": 0}
+
+    def count_call(event_name, **kwargs):
+        calls[event_name.split(".")[-1]] += 1
+
+    events = dynamo_client.table.meta.client.meta.events
+    events.register("before-call.dynamodb.BatchWriteItem", count_call)
+    events.register("before-call.dynamodb.PutItem", count_call)
+
+    records = [
+        {"request_id": "uuid-12345", "record_key": f"{i:05d}", "first_name": "John", "last_name": "Doe"}
+        for i in range(100)
+    ]
+    report = dynamo_client.save_records(records)
+
+    assert calls == {"BatchWriteItem": 4, "PutItem": 0}
+    assert report["succeeded"] == list(range(100))
+    assert report["failed"] == []
+    assert dynamodb_setup["table"].scan(Select="COUNT")["Count"] == 100
+
+
+def test_save_records_retries_unprocessed_items(dynamodb_setup, monkeypatch):
+    """
+    Test that unprocessed items are retried and reported as failed once retries run out.
+    """
+    documents = []
+    metrics = Metrics("worker", sink=documents.append)
+    dynamo_client = DynamoDBClient(table_name=dynamodb_setup["table_name"], max_retries=2, base_backoff=0, metrics=metrics)
+    records = [{"id": str(i)} for i in range(3)]
+    responses = [
+        {
+            "UnprocessedItems": {dynamodb_setup["table_name"]: [{"PutRequest": {"Item": {"id": "2"}}}]},
+            "ConsumedCapacity": [{"TableName": dynamodb_setup["table_name"], "CapacityUnits": 2.0}],
+        },
+        {"UnprocessedItems": {dynamodb_setup["table_name"]: [{"PutRequest": {"Item": {"id": "2"}}}]}},
+        {"UnprocessedItems": {dynamodb_setup["table_name"]: [{"PutRequest": {"Item": {"id": "2"}}}]}},
+    ]
+    sent = []
+
+    def mock_batch_write_item(RequestItems, **kwargs):
+        sent.append(len(RequestItems[dynamodb_setup["table_name"]]))
+        return responses.pop(0)
+
+    monkeypatch.setattr(dynamo_client.table.meta.client, "batch_write_item", mock_batch_write_item)
+    report = dynamo_client.save_records(records)
+
+    assert sent == [3, 1, 1]
+    assert report == {"succeeded": [0, 1], "failed": [2]}
+    metrics.flush()
+    document = json.loads(documents[0])
+    assert document["WriteRetries"] == 2
+    assert document["ConsumedWriteCapacity"] == 2.0
+
+
+def test_lambda_handler_counts_batches_once(control_table_setup):
+    """
+    Test that processed batches are counted once and the last one resumes the execution.
+    """
+    def message(batch_id):
+        return {
+            "body": json.dumps(
+                {
+                    "request_id": "uuid-12345",
+                    "batch_id": batch_id,
+                    "batch": [
+                        {"id": str(batch_id), "first_name": "John", "last_name": "Doe", "company_domain": "example.com"},
+                    ],
+                }
+            )
+        }
+
+    # Batch 1 is delivered twice
+    lambda_handler({"Records": [message(1), message(1)]}, None)
+    item = control_table_setup["table"].get_item(Key={"request_id": "uuid-12345"})["Item"]
+    assert item["processed_batches"] == 1
+    assert item["processed_records"] == 1
+    assert "updated_at" in item
+    assert control_table_setup["notifications"] == []
+
+    lambda_handler({"Records": [message(2)]}, None)
+    item = control_table_setup["table"].get_item(Key={"request_id": "uuid-12345"})["Item"]
+    assert item["processed_batches"] == 2
+    assert len(control_table_setup["notifications"]) == 1
+    assert control_table_setup["notifications"][0]["taskToken"] == "token-12345"
+
+
+def test_lambda_handler_writes_result_parts(control_table_setup, monkeypatch):
+    """
+    Test that each stored batch is written to its result part in the request's output format.
+    """
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="output-bucket")
+    control_table_setup["table"].update_item(
+        Key={"request_id": "uuid-12345"},
+        UpdateExpression="SET output_format = :format",
+        ExpressionAttributeValues={":format": "ndjson"},
+    )
+    monkeypatch.setattr("lambdas.worker.app.part_writer", ResultPartWriter(bucket_name="output-bucket"))
+
+    for batch_id in (0, 1):
+        body = {
+            "request_id": "uuid-12345",
+            "batch_id": batch_id,
+            "batch": [{"first_name": f"John{batch_id}{i}", "last_name": "Doe", "company_domain": "example.com"} for i in range(3)],
+        }
+        response = lambda_handler({"Records": [{"messageId": str(batch_id), "body": json.dumps(body)}]}, None)
+        assert response == {"batchItemFailures": []}
+
+    part = s3.get_object(Bucket="output-bucket", Key=part_key("uuid-12345", 1, "ndjson"))
+    records = [json.loads(line) for line in part["Body"].read().splitlines()]
+    assert part["ContentType"] == "application/x-ndjson"
+    assert [record["first_name"] for record in records] == ["John10", "John11", "John12"]
+    assert records[0]["request_id"] == "uuid-12345"
+    assert records[0]["record_key"] == "000001#00000"
+    assert control_table_setup["control_table"].get_output_format("uuid-12345") == "ndjson"
+    assert len(control_table_setup["notifications"]) == 1
+
+
+def test_result_segments_are_copied_by_the_aggregation(control_table_setup, monkeypatch):
+    """
+    Test that the batch completing a range joins the range's parts into a segment of
+    at least 5 MB before it counts, and that the aggregation copies the segments with
+    UploadPartCopy instead of downloading every part.
+    """
+    from lambdas.aggregate_results import app as aggregate_app
+
+    class DiscardingClient:
+        def save_records(self, records):
+            return {"succeeded": list(range(len(records))), "failed": []}
+
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="output-bucket")
+    control_table_setup["table"].update_item(
+        Key={"request_id": "uuid-12345"},
+        UpdateExpression="SET output_format = :format, expected_batches = :batches",
+        ExpressionAttributeValues={":format": "ndjson", ":batches": 5},
+    )
+    monkeypatch.setattr("lambdas.worker.app.batch_processor", BatchProcessor(DiscardingClient(), ProviderFactory()))
+    monkeypatch.setattr("lambdas.worker.app.part_writer", ResultPartWriter(bucket_name="output-bucket"))
+    monkeypatch.setattr("lambdas.worker.app.segment_batches", 2)
+    notes = "x" * (300 * 1024)
+
+    # Batches finish out of order; each part is about 3 MB
+    for batch_id in (2, 1, 4, 5, 3):
+        batch = [
+            {"first_name": f"John{batch_id}-{i}", "last_name": "Doe", "company_domain": "example.com", "notes": notes}
+            for i in range(10)
+        ]
+        body = {"request_id": "uuid-12345", "batch_id": batch_id, "batch": batch}
+        response = lambda_handler({"Records": [{"messageId": str(batch_id), "body": json.dumps(body)}]}, None)
+        assert response == {"batchItemFailures": []}
+
+    segments = s3.list_objects_v2(Bucket="output-bucket", Prefix="segments/uuid-12345/")["Contents"]
+    assert [segment["Key"].rsplit("/", 1)[-1] for segment in segments] == ["000001-000002.ndjson", "000003-000004.ndjson"]
+    assert all(segment["Size"] >= 5 * 1024 * 1024 for segment in segments)
+    assert len(control_table_setup["notifications"]) == 1
+
+    monkeypatch.setattr(aggregate_app, "bucket_name", "output-bucket")
+    monkeypatch.setattr(aggregate_app, "control_table_name", "ControlTable")
+    monkeypatch.setattr(aggregate_app, "aggregation_mode", "parts")
+    copies, downloads = [], []
+    record_copy = lambda **kwargs: copies.append(kwargs)
+    record_download = lambda **kwargs: downloads.append(kwargs)
+    aggregate_app.s3_client.meta.events.register("before-call.s3.UploadPartCopy", record_copy)
+    aggregate_app.s3_client.meta.events.register("provide-client-params.s3.GetObject", record_download)
+    try:
+        response = aggregate_app.lambda_handler({"request_id": "uuid-12345"}, None)
+    finally:
+        aggregate_app.s3_client.meta.events.unregister("before-call.s3.UploadPartCopy", record_copy)
+        aggregate_app.s3_client.meta.events.unregister("provide-client-params.s3.GetObject", record_download)
+
+    assert response["statusCode"] == 200
+    result = json.loads(response["body"])
+    assert (result["parts"], result["segments"]) == (5, 2)
+    assert len(copies) == 2
+    # Only the part of the last, unfinished range is downloaded
+    downloaded = [download["params"]["Key"] for download in downloads]
+    assert [key for key in downloaded if key.startswith("parts/")] == [part_key("uuid-12345", 5, "ndjson")]
+    body = s3.get_object(Bucket="output-bucket", Key="uuid-12345_aggregated.ndjson")["Body"].read()
+    names = [json.loads(line)["first_name"] for line in body.splitlines()]
+    assert names == [f"John{batch_id}-{i}" for batch_id in range(1, 6) for i in range(10)]
+
+
+def test_process_batch_concurrent_keeps_order():
+    """
+    Test that concurrent enrichment keeps record order and reports timed out records.
+    """
+    class SlowProvider:
+        max_concurrency = 4
+
+        def enrich_record(self, record):
+            time.sleep(0.5 if record["id"] == "3" else 0.01 * (5 - int(record["id"])))
+            return {**record, "enriched": True}
+
+    class Factory(ProviderFactory):
+        def get_provider(self, provider_name):
+            return SlowProvider()
+
+    saved = []
+
+    class RecordingClient:
+        def save_records(self, records):
+            saved.extend(records)
+            return {"succeeded": list(range(len(records))), "failed": []}
+
+    processor = BatchProcessor(RecordingClient(), Factory(), max_concurrency=8, call_timeout=0.2)
+    report = processor.process_batch([{"id": str(i)} for i in range(5)])
+
+    assert [record["id"] for record in saved] == ["0", "1", "2", "4"]
+    assert report == {"succeeded": [0, 1, 2, 4], "failed": [3], "records": saved}
+
+
+def test_process_batch_timeout_starts_with_each_call():
+    """
+    Test that records waiting behind hung calls are enriched instead of reported as timed out.
+    """
+    class HangingProvider:
+        max_concurrency = 2
+
+        def enrich_record(self, record):
+            time.sleep(1.0 if record["id"] in ("0", "1") else 0.05)
+            return {**record, "enriched": True}
+
+    class Factory(ProviderFactory):
+        def get_provider(self, provider_name):
+            return HangingProvider()
+
+    class RecordingClient:
+        def save_records(self, records):
+            return {"succeeded": list(range(len(records))), "failed": []}
+
+    processor = BatchProcessor(RecordingClient(), Factory(), max_concurrency=2, call_timeout=0.3)
+    report = processor.process_batch([{"id": str(i)} for i in range(8)])
+
+    assert report["failed"] == [0, 1]
+    assert report["succeeded"] == [2, 3, 4, 5, 6, 7]
+
+
+def test_process_batch_prefers_bulk_enrichment():
+    """
+    Test that bulk-capable providers are used in bulk, with per-record fallback for missing records.
+    """
+    calls = {"bulk": 0, "single": 0}
+
+    class BulkProvider(DataProvider):
+        def enrich_record(self, record):
+            calls["single"] += 1
+            return {**record, "professional_email": "fallback"}
+
+        def enrich_records(self, records):
+            calls["bulk"] += 1
+            enriched_records = super().enrich_records(records)
+            enriched_records[1] = None
+            return enriched_records
+
+    class Factory(ProviderFactory):
+        def get_provider(self, provider_name):
+            return BulkProvider()
+
+    class RecordingClient:
+        def save_records(self, records):
+            self.records = records
+            return {"succeeded": list(range(len(records))), "failed": []}
+
+    client = RecordingClient()
+    batch = [
+        {"first_name": "John", "last_name": "Doe", "company_domain": "example.com"},
+        {"first_name": "Jane", "last_name": "Smith", "company_domain": "example.org"},
+    ]
+    report = BatchProcessor(client, Factory()).process_batch(batch)
+
+    assert calls == {"bulk": 1, "single": 1}
+    assert report == {"succeeded": [0, 1], "failed": [], "records": client.records}
+    assert [record["professional_email"] for record in client.records] == ["john.doe@example.com", "fallback"]
+
+
+def test_default_provider_bulk_matches_single():
+    """
+    Test that the columnar default provider matches the per-record path.
+    """
+    provider = DataProvider()
+    batch = [
+        {"first_name": "JOHN", "last_name": "Doe", "company_domain": "example.com"},
+        {"first_name": "Jane", "company_domain": "example.org"},
+        {"first_name": "Ünal", "last_name": "Öz", "company_domain": "example.de"},
+    ]
+
+    enriched_records = provider.enrich_records(batch)
+
+    assert enriched_records[0] == provider.enrich_record(batch[0])
+    assert enriched_records[1] is None
+    assert enriched_records[2] == provider.enrich_record(batch[2])
+    assert ProviderFactory().supports_bulk("default")
+
+
+def test_enrichment_cache_serves_duplicate_contacts():
+    """
+    Test that duplicate contacts are served from the cache, keyed on normalized identity.
+    """
+    cache = EnrichmentCache(max_entries=2, ttl_seconds=60)
+    factory = ProviderFactory(cache=cache)
+    provider = factory.get_provider("default")
+    batch = [
+        {"id": "1", "first_name": "John", "last_name": "Doe", "company_domain": "example.com"},
+        {"id": "2", "first_name": " JOHN", "last_name": "doe ", "company_domain": "Example.com"},
+        {"id": "3", "first_name": "Jane", "last_name": "Smith", "company_domain": "example.org"},
+    ]
+
+    first = provider.enrich_records(batch)
+    second = provider.enrich_records(batch)
+
+    assert normalize_key(batch[0]) == normalize_key(batch[1])
+    assert second == first
+    assert second[1]["id"] == "2"
+    assert second[1]["professional_email"] == "john.doe@example.com"
+    assert cache.stats == {"hits": 3, "shared_hits": 0, "misses": 3}
+
+
+def test_enrichment_cache_ttl_and_lru_eviction(monkeypatch):
+    """
+    Test that entries expire after the TTL and the least recently used entry is evicted.
+    """
+    now = [1000.0]
+    monkeypatch.setattr("lambdas.worker.enrichment_cache.enrichment_cache.time.time", lambda: now[0])
+    cache = EnrichmentCache(max_entries=2, ttl_seconds=10)
+
+    cache.put(("a",), {"field": 1})
+    cache.put(("b",), {"field": 2})
+    assert cache.get(("a",)) == {"field": 1}
+    cache.put(("c",), {"field": 3})
+    assert cache.get(("b",)) is None
+
+    now[0] += 11
+    assert cache.get(("a",)) is None
+    assert cache.get(("c",)) is None
+
+
+def test_enrichment_cache_shared_table(dynamodb_setup):
+    """
+    Test that a result cached by one worker is found by another through the shared table.
+    """
+    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+    dynamodb.create_table(
+        TableName="EnrichmentCache",
+        KeySchema=[{"AttributeName": "cache_key", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "cache_key", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    record = {"first_name": "John", "last_name": "Doe", "company_domain": "example.com"}
+
+    first_worker = ProviderFactory(cache=EnrichmentCache(table_name="EnrichmentCache")).get_provider("default")
+    first_worker.enrich_record(record)
+
+    cache = EnrichmentCache(table_name="EnrichmentCache")
+    enriched_record = ProviderFactory(cache=cache).get_provider("default").enrich_record(record)
+
+    assert enriched_record["professional_email"] == "john.doe@example.com"
+    assert cache.stats == {"hits": 0, "shared_hits": 1, "misses": 0}
+
+
+def test_enrichment_cache_is_keyed_per_provider_and_version():
+    """
+    Test that providers and chains sharing a cache never serve each other's results.
+    """
+    class OtherProvider(DataProvider):
+        def enrich_record(self, record):
+            return {**record, "professional_email": "other@example.com"}
+
+        enrich_records = None
+
+    class NewerProvider(OtherProvider):
+        version = "2"
+
+    cache = EnrichmentCache(ttl_seconds=60)
+    chains = {"fallback": {"strategy": "waterfall", "providers": ["other", "default"]}}
+    record = {"first_name": "John", "last_name": "Doe", "company_domain": "example.com"}
+
+    default = ProviderFactory(cache=cache).get_provider("default").enrich_record(record)
+    factory = ProviderFactory(cache=cache, providers={"other": OtherProvider()}, chains=chains)
+    other = factory.get_provider("other").enrich_record(record)
+    chained = factory.get_provider("fallback").enrich_record(record)
+    newer = ProviderFactory(cache=cache, providers={"other": NewerProvider()}).get_provider("other").enrich_record(record)
+
+    assert default["professional_email"] == "john.doe@example.com"
+    assert other["professional_email"] == chained["professional_email"] == "other@example.com"
+    assert newer["professional_email"] == "other@example.com"
+    assert cache.stats == {"hits": 0, "shared_hits": 0, "misses": 4}
+
+
+@pytest.mark.parametrize("file_format", ["ndjson", "csv"])
+def test_s3_ranges_cover_every_record_once(dynamodb_setup, file_format):
+    """
+    Test that the planned byte ranges, read by workers, return every record exactly once.
+    """
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="staged-contacts")
+    contacts = [
+        {"first_name": f"First{i}" * (1 + i % 7), "last_name": "Doe", "company_domain": f"company{i}.com"}
+        for i in range(1000)
+    ]
+    if file_format == "csv":
+        lines = ["first_name,last_name,company_domain"]
+        lines += [f"{c['first_name']},{c['last_name']},{c['company_domain']}" for c in contacts]
+        body = "\r\n".join(lines) + "\r\n"
+    else:
+        body = "\n".join(json.dumps(contact) for contact in contacts)
+    s3.put_object(Bucket="staged-contacts", Key=f"contacts.{file_format}", Body=body.encode("utf-8"))
+
+    source = {"bucket": "staged-contacts", "key": f"contacts.{file_format}", "format": file_format}
+    ranges = S3RangePlanner(batch_size=37, sample_bytes=1024).plan(source)
+    reader = S3RangeReader(overflow_bytes=16)
+    batches = [reader.read(json.loads(json.dumps(descriptor))) for descriptor in ranges]
+
+    assert len(ranges) > 10
+    assert [contact for batch in batches for contact in batch] == contacts
+
+
+def test_lambda_handler_resolves_claim_checks(control_table_setup, monkeypatch):
+    """
+    Test that a claim-checked batch is loaded from S3, and only once across redeliveries.
+    """
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="claim-checks")
+    batch = [
+        {"id": "1", "first_name": "John", "last_name": "Doe", "company_domain": "example.com"},
+        {"id": "2", "first_name": "Jane", "last_name": "Smith", "company_domain": "example.org"},
+    ]
+    s3.put_object(Bucket="claim-checks", Key="claim-checks/uuid-12345/1.json.zz", Body=pack_batch(batch))
+
+    resolver = ClaimCheckResolver(max_entries=4)
+    downloads = []
+    resolver.s3_client.meta.events.register("before-call.s3.GetObject", lambda **kwargs: downloads.append(1))
+    monkeypatch.setattr("lambdas.worker.app.claim_check_resolver", resolver)
+    message = {
+        "request_id": "uuid-12345",
+        "batch_id": 1,
+        "claim_check": {"bucket": "claim-checks", "key": "claim-checks/uuid-12345/1.json.zz"},
+    }
+    mock_event = {"Records": [{"body": json.dumps(message)}]}
+
+    # A redelivery that arrives before the batch is counted resolves the pointer again
+    monkeypatch.setattr(control_table_setup["control_table"], "is_batch_processed", lambda request_id, batch_id: False)
+    lambda_handler(mock_event, None)
+    lambda_handler(mock_event, None)
+
+    items = boto3.resource("dynamodb", region_name="us-east-1").Table("EnrichedData").scan()["Items"]
+    assert sorted(item["professional_email"] for item in items) == ["jane.smith@example.org", "john.doe@example.com"]
+    assert len(downloads) == 1
+
+
+def test_lambda_handler_decodes_compact_messages(control_table_setup):
+    """
+    Test that the worker accepts compact messages alongside plain JSON ones.
+    """
+    batch = [
+        {"id": "1", "first_name": "John", "last_name": "Doe", "company_domain": "example.com"},
+        {"id": "2", "first_name": "Jane", "last_name": "Smith", "company_domain": "example.org"},
+    ]
+    message = {"request_id": "uuid-12345", "batch_id": 1, "packed": encode_batch(batch, "zlib")}
+    mock_event = {"Records": [{"body": json.dumps(message)}]}
+
+    lambda_handler(mock_event, None)
+
+    items = boto3.resource("dynamodb", region_name="us-east-1").Table("EnrichedData").scan()["Items"]
+    assert sorted(item["professional_email"] for item in items) == ["jane.smith@example.org", "john.doe@example.com"]
+
+
+def test_control_table_publishes_worker_latency(control_table_setup, monkeypatch):
+    """
+    Test that the per-record latency is averaged and written at most once per interval.
+    """
+    control_table = control_table_setup["control_table"]
+    clock = [1000.0]
+    monkeypatch.setattr("lambdas.worker.control_table.control_table.time.monotonic", lambda: clock[0])
+    writes = []
+    control_table.table.meta.client.meta.events.register("before-call.dynamodb.PutItem", lambda **kwargs: writes.append(1))
+
+    control_table.record_latency(2.0, 10)
+    control_table.record_latency(4.0, 10)
+    clock[0] += control_table.stats_interval_seconds
+    control_table.record_latency(4.0, 10)
+
+    assert len(writes) == 2
+    item = control_table_setup["table"].get_item(Key={"request_id": WORKER_STATS_KEY})["Item"]
+    assert float(item["seconds_per_record"]) == pytest.approx(control_table.seconds_per_record)
+    assert 0.2 < control_table.seconds_per_record < 0.4
+
+
+def test_lambda_handler_reports_partial_batch_failures(control_table_setup, sqs_setup, monkeypatch):
+    """
+    Test that only failing messages are reported and failed records go to the failure queue.
+    """
+    class PartlyFailingProvider(DataProvider):
+        def enrich_record(self, record):
+            if record["first_name"] == "Broken":
+                raise ValueError("provider error")
+            return super().enrich_record(record)
+
+    class Factory(ProviderFactory):
+        def get_provider(self, provider_name):
+            return PartlyFailingProvider()
+
+        def supports_bulk(self, provider_name):
+            return False
+
+    processor = BatchProcessor(DynamoDBClient(table_name="EnrichedData"), Factory())
+    failed_record_queue = FailedRecordQueue(queue_url=sqs_setup["queue_url"])
+    monkeypatch.setattr("lambdas.worker.app.batch_processor", processor)
+    monkeypatch.setattr("lambdas.worker.app.failed_record_queue", failed_record_queue)
+    batch = [
+        {"id": "1", "first_name": "John", "last_name": "Doe", "company_domain": "example.com"},
+        {"id": "2", "first_name": "Broken", "last_name": "Smith", "company_domain": "example.org"},
+    ]
+    mock_event = {
+        "Records": [
+            {"messageId": "m1", "body": json.dumps({"request_id": "uuid-12345", "batch_id": 1, "batch": batch})},
+            {"messageId": "m2", "body": "not json"},
+        ]
+    }
+
+    response = lambda_handler(mock_event, None)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "m2"}]}
+    messages = sqs_setup["sqs_client"].receive_message(QueueUrl=sqs_setup["queue_url"], MaxNumberOfMessages=10)
+    assert [json.loads(m["Body"])["failed_record"] for m in messages["Messages"]] == [batch[1]]
+    item = control_table_setup["table"].get_item(Key={"request_id": "uuid-12345"})["Item"]
+    assert item["processed_batches"] == 1
+    assert item["failed_records"] == 1
+
+    # Without a failure queue the message is redelivered as a whole
+    monkeypatch.setattr("lambdas.worker.app.failed_record_queue", None)
+    message = {"request_id": "uuid-12345", "batch_id": 2, "batch": batch}
+    response = lambda_handler({"Records": [{"messageId": "m3", "body": json.dumps(message)}]}, None)
+    assert response == {"batchItemFailures": [{"itemIdentifier": "m3"}]}
+
+
+def test_lambda_handler_skips_processed_batches(control_table_setup, monkeypatch):
+    """
+    Test that a redelivered batch is acknowledged without provider calls or writes,
+    and that records are stored under their request and a batch and position sort key.
+    """
+    calls = []
+
+    class CountingProvider(DataProvider):
+        def enrich_record(self, record):
+            calls.append(record["first_name"])
+            return super().enrich_record(record)
+
+    class Factory(ProviderFactory):
+        def get_provider(self, provider_name):
+            return CountingProvider()
+
+        def supports_bulk(self, provider_name):
+            return False
+
+    dynamo_client = DynamoDBClient(table_name="EnrichedData")
+    writes = []
+    dynamo_client.table.meta.client.meta.events.register("before-call.dynamodb.BatchWriteItem", lambda **kwargs: writes.append(1))
+    monkeypatch.setattr("lambdas.worker.app.batch_processor", BatchProcessor(dynamo_client, Factory()))
+    batch = [
+        {"id": "c-1", "first_name": "John", "last_name": "Doe", "company_domain": "example.com"},
+        {"id": "c-2", "first_name": "Jane", "last_name": "Smith", "company_domain": "example.org"},
+    ]
+    message = {"messageId": "m1", "body": json.dumps({"request_id": "uuid-12345", "batch_id": 7, "batch": batch})}
+
+    assert lambda_handler({"Records": [message]}, None) == {"batchItemFailures": []}
+    assert lambda_handler({"Records": [message]}, None) == {"batchItemFailures": []}
+
+    assert calls == ["John", "Jane"]
+    assert len(writes) == 1
+    item = control_table_setup["table"].get_item(Key={"request_id": "uuid-12345"})["Item"]
+    assert item["processed_batches"] == 1
+    records = dynamo_client.table.query(KeyConditionExpression=Key("request_id").eq("uuid-12345"))["Items"]
+    assert [record["record_key"] for record in records] == ["000007#00000", "000007#00001"]
+    assert [record["id"] for record in records] == ["c-1", "c-2"]
+
+
+def test_shared_rate_limiter_caps_calls_across_workers(control_table_setup, monkeypatch):
+    """
+    Test that workers sharing the limiter never exceed the rate within a one-second window.
+    """
+    clock = [1000.0]
+    monkeypatch.setattr("lambdas.worker.provider_guard.provider_guard.time.time", lambda: clock[0])
+    monkeypatch.setattr("lambdas.worker.provider_guard.provider_guard.time.sleep", lambda seconds: clock.__setitem__(0, clock[0] + seconds))
+    workers = [SharedRateLimiter(table_name="ControlTable", name="vendor", rate=20, lease_size=5) for _ in range(2)]
+    updates = []
+    workers[0].table.meta.client.meta.events.register("before-call.dynamodb.UpdateItem", lambda **kwargs: updates.append(1))
+
+    windows = []
+    for call in range(50):
+        workers[call % 2].acquire()
+        windows.append(int(clock[0]))
+
+    assert max(windows.count(window) for window in set(windows)) == 20
+    assert windows[-1] - windows[0] == 2
+    # Tokens are leased five at a time, plus one refused lease per worker and full window
+    assert len(updates) <= 50 // 5 + 2 * 2 + 2
+    with pytest.raises(ValueError):
+        SharedRateLimiter(table_name="ControlTable", name="vendor", rate=20, max_wait_seconds=0).acquire(25)
+    with pytest.raises(RateLimitTimeoutError):
+        SharedRateLimiter(table_name="ControlTable", name="vendor", rate=20, max_wait_seconds=0).acquire(20)
+
+
+def test_shared_rate_limiter_splits_bulk_calls_larger_than_the_rate(control_table_setup, monkeypatch):
+    """
+    Test that a bulk call needing more tokens than one window allows is served in several windows.
+    """
+    clock = [2000.0]
+    monkeypatch.setattr("lambdas.worker.provider_guard.provider_guard.time.time", lambda: clock[0])
+    monkeypatch.setattr("lambdas.worker.provider_guard.provider_guard.time.sleep", lambda seconds: clock.__setitem__(0, clock[0] + seconds))
+    windows = []
+
+    class RecordingProvider(DataProvider):
+        def enrich_records(self, records):
+            windows.append((int(clock[0]), len(records)))
+            return super().enrich_records(records)
+
+    limiter = SharedRateLimiter(table_name="ControlTable", name="bulk", rate=10)
+    guarded = guarded_provider(RecordingProvider(), limiter=limiter)
+    batch = [{"first_name": f"First{i}", "last_name": "Doe", "company_domain": "example.com"} for i in range(100)]
+
+    enriched_records = guarded.enrich_records(batch)
+
+    assert [record["first_name"] for record in enriched_records] == [record["first_name"] for record in batch]
+    assert [size for _, size in windows] == [10] * 10
+    assert len({window for window, _ in windows}) == 10
+
+
+def test_circuit_breaker_fails_fast_and_recovers(control_table_setup, monkeypatch):
+    """
+    Test that the breaker opens on an error spike, fails the message without calling
+    the provider, and closes again after a successful trial call.
+    """
+    clock = [1000.0]
+    monkeypatch.setattr("lambdas.worker.provider_guard.provider_guard.time.monotonic", lambda: clock[0])
+    calls = []
+
+    class FlakyProvider(DataProvider):
+        healthy = False
+
+        def enrich_record(self, record):
+            calls.append(record["first_name"])
+            if not self.healthy:
+                raise ConnectionError("429 Too Many Requests")
+            return super().enrich_record(record)
+
+    provider = FlakyProvider()
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, reset_seconds=30)
+    guarded = guarded_provider(provider, breaker=breaker)
+    record = {"first_name": "John", "last_name": "Doe", "company_domain": "example.com"}
+    for _ in range(4):
+        with pytest.raises(ConnectionError):
+            guarded.enrich_record(record)
+    assert breaker.state == "open"
+
+    class Factory(ProviderFactory):
+        def get_provider(self, provider_name):
+            return guarded
+
+        def supports_bulk(self, provider_name):
+            return False
+
+    monkeypatch.setattr("lambdas.worker.app.batch_processor", BatchProcessor(DynamoDBClient(table_name="EnrichedData"), Factory()))
+    monkeypatch.setattr("lambdas.worker.app.failed_record_queue", FailedRecordQueue(queue_url="unused"))
+    message = {"messageId": "m1", "body": json.dumps({"request_id": "uuid-12345", "batch_id": 1, "batch": [record] * 3})}
+
+    assert lambda_handler({"Records": [message]}, None) == {"batchItemFailures": [{"itemIdentifier": "m1"}]}
+    assert len(calls) == 4
+
+    clock[0] += 30
+    provider.healthy = True
+    assert breaker.state == "half_open"
+    assert lambda_handler({"Records": [message]}, None) == {"batchItemFailures": []}
+    assert breaker.state == "closed"
+    assert len(calls) == 7
+
+
+def test_lambda_handler_parks_batches_the_provider_keeps_rejecting(control_table_setup, sqs_setup, monkeypatch):
+    """
+    Test that a batch rejected by an unavailable provider is hidden for the retry delay,
+    and counted with all its records failed on its last delivery instead of dead-lettered.
+    """
+    class UnavailableProvider(DataProvider):
+        def enrich_record(self, record):
+            raise CircuitOpenError("Circuit breaker is open")
+
+    class Factory(ProviderFactory):
+        def get_provider(self, provider_name):
+            return UnavailableProvider()
+
+        def supports_bulk(self, provider_name):
+            return False
+
+    class RecordingSQS:
+        def __init__(self):
+            self.calls = []
+
+        def change_message_visibility(self, **kwargs):
+            self.calls.append(kwargs)
+
+    sqs_client = RecordingSQS()
+    failed_queue_url = sqs_setup["sqs_client"].create_queue(
+        QueueName="failed-records.fifo", Attributes={"FifoQueue": "true"}
+    )["QueueUrl"]
+    monkeypatch.setattr("lambdas.worker.app.batch_processor", BatchProcessor(DynamoDBClient(table_name="EnrichedData"), Factory()))
+    monkeypatch.setattr("lambdas.worker.app.failed_record_queue", FailedRecordQueue(queue_url=failed_queue_url))
+    monkeypatch.setattr("lambdas.worker.app.sqs_client", sqs_client)
+    monkeypatch.setattr("lambdas.worker.app.queue_url", sqs_setup["queue_url"])
+    monkeypatch.setattr("lambdas.worker.app.provider_retry_seconds", 45)
+    monkeypatch.setattr("lambdas.worker.app.max_receive_count", 3)
+    batch = [
+        {"id": "1", "first_name": "John", "last_name": "Doe", "company_domain": "example.com"},
+        {"id": "2", "first_name": "Jane", "last_name": "Smith", "company_domain": "example.org"},
+    ]
+
+    def delivery(receive_count):
+        return {
+            "messageId": "m1",
+            "receiptHandle": f"handle-{receive_count}",
+            "attributes": {"ApproximateReceiveCount": str(receive_count)},
+            "body": json.dumps({"request_id": "uuid-12345", "batch_id": 1, "batch": batch}),
+        }
+
+    for receive_count in (1, 2):
+        assert lambda_handler({"Records": [delivery(receive_count)]}, None) == {"batchItemFailures": [{"itemIdentifier": "m1"}]}
+    assert sqs_client.calls == [
+        {"QueueUrl": sqs_setup["queue_url"], "ReceiptHandle": f"handle-{receive_count}", "VisibilityTimeout": 45}
+        for receive_count in (1, 2)
+    ]
+    item = control_table_setup["table"].get_item(Key={"request_id": "uuid-12345"})["Item"]
+    assert item["processed_batches"] == 0
+
+    assert lambda_handler({"Records": [delivery(3)]}, None) == {"batchItemFailures": []}
+    assert len(sqs_client.calls) == 2
+    item = control_table_setup["table"].get_item(Key={"request_id": "uuid-12345"})["Item"]
+    assert item["processed_batches"] == 1
+    assert item["failed_records"] == 2
+    messages = sqs_setup["sqs_client"].receive_message(QueueUrl=failed_queue_url, MaxNumberOfMessages=10)
+    assert [json.loads(m["Body"])["failed_record"] for m in messages["Messages"]] == batch
+
+
+def test_failed_record_queue_deduplicates_resent_records(sqs_setup):
+    """
+    Test that records sent again for a redelivered batch are deduplicated on a FIFO queue.
+    """
+    queue_url = sqs_setup["sqs_client"].create_queue(
+        QueueName="failed-records.fifo", Attributes={"FifoQueue": "true"}
+    )["QueueUrl"]
+    failed_record_queue = FailedRecordQueue(queue_url=queue_url)
+    batch = [{"id": str(position), "first_name": "Broken"} for position in range(3)]
+
+    failed_record_queue.send_records("uuid-12345", 1, batch, [0, 1])
+    failed_record_queue.send_records("uuid-12345", 1, batch, [0, 1, 2])
+    failed_record_queue.send_records("uuid-12345", 2, batch, [0])
+
+    messages = sqs_setup["sqs_client"].receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10)["Messages"]
+    bodies = [json.loads(m["Body"]) for m in messages]
+    assert sorted((body["batch_id"], body["position"]) for body in bodies) == [(1, 0), (1, 1), (1, 2), (2, 0)]
+
+
+def test_circuit_breaker_only_lets_the_trial_call_close_it(monkeypatch):
+    """
+    Test that calls in flight when the breaker opens neither close it nor release the trial.
+    """
+    clock = [1000.0]
+    monkeypatch.setattr("lambdas.worker.provider_guard.provider_guard.time.monotonic", lambda: clock[0])
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, reset_seconds=30)
+    in_flight = [breaker.before_call() for _ in range(8)]
+    assert not any(in_flight)
+    for trial in in_flight[:4]:
+        breaker.record(False, trial=trial)
+    assert breaker.state == "open"
+
+    breaker.record(True, trial=in_flight[4])
+    assert breaker.state == "open"
+
+    clock[0] += 30
+    trial = breaker.before_call()
+    assert trial
+    breaker.cancel(in_flight[5])
+    breaker.record(True, trial=in_flight[6])
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.state == "half_open"
+
+    breaker.record(True, trial=trial)
+    assert breaker.state == "closed"
+    breaker.record(False, trial=in_flight[7])
+    assert breaker.failures == 1
+
+
+def test_guarded_provider_concurrent_calls_keep_breaker_open(monkeypatch):
+    """
+    Test that a slow success started before the error spike leaves the breaker open.
+    """
+    release = threading.Event()
+    started = threading.Event()
+
+    class SlowThenBrokenProvider(DataProvider):
+        def enrich_record(self, record):
+            if record["first_name"] == "slow":
+                started.set()
+                release.wait(5)
+                return super().enrich_record(record)
+            raise ConnectionError("503 Service Unavailable")
+
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, reset_seconds=30)
+    guarded = guarded_provider(SlowThenBrokenProvider(), breaker=breaker)
+    record = {"first_name": "John", "last_name": "Doe", "company_domain": "example.com"}
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        slow = executor.submit(guarded.enrich_record, {**record, "first_name": "slow"})
+        started.wait(5)
+        for _ in range(4):
+            with pytest.raises(ConnectionError):
+                guarded.enrich_record(record)
+        assert breaker.state == "open"
+        release.set()
+        assert slow.result()["first_name"] == "slow"
+
+    assert breaker.state == "open"
+
+
+def test_circuit_breaker_ignores_malformed_records():
+    """
+    Test that records the provider cannot use fail on their own without opening the breaker.
+    """
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=20)
+    guarded = guarded_provider(DataProvider(), breaker=breaker)
+
+    class Factory(ProviderFactory):
+        def get_provider(self, provider_name):
+            return guarded
+
+    class RecordingClient:
+        def save_records(self, records):
+            return {"succeeded": list(range(len(records))), "failed": []}
+
+    batch = [
+        {"first_name": f"First{i}", "last_name": "Doe", **({} if i % 5 == 0 else {"company_domain": "example.com"})}
+        for i in range(100)
+    ]
+    report = BatchProcessor(RecordingClient(), Factory()).process_batch(batch)
+
+    assert len(report["failed"]) == 20
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    # The bulk call weighs as one successful call per record
+    breaker.record(False, calls=60)
+    assert breaker.state == "closed"
+    breaker.record(False, calls=40)
+    assert breaker.state == "open"
+
+
+def test_waterfall_chain_only_sends_incomplete_records_to_next_provider():
+    """
+    A waterfall chain asks the second provider only for the records the first one
+    could not complete.
+    """
+    calls = {"primary": [], "secondary": []}
+
+    class PartialProvider(DataProvider):
+        def enrich_records(self, records):
+            calls["primary"].append([record["first_name"] for record in records])
+            return [
+                {**record, "professional_email": None} if record["first_name"] == "Jane" else self.enrich_record(record)
+                for record in records
+            ]
+
+    class BackupProvider(DataProvider):
+        def enrich_records(self, records):
+            calls["secondary"].append([record["first_name"] for record in records])
+            return super().enrich_records(records)
+
+    factory = ProviderFactory(
+        providers={"primary": PartialProvider(), "secondary": BackupProvider()},
+        chains={"waterfall": {"strategy": "waterfall", "providers": ["primary", "secondary"]}},
+    )
+    assert factory.get_provider("waterfall") is factory.get_provider("waterfall")
+    misspelt = ProviderFactory(chains={"waterfall": {"strategy": "waterfall", "providers": ["default", "secondry"]}})
+    with pytest.raises(ValueError, match="secondry"):
+        misspelt.get_provider("waterfall")
+    class DiscardingClient:
+        def save_records(self, records):
+            return {"succeeded": list(range(len(records))), "failed": []}
+
+    processor = BatchProcessor(DiscardingClient(), factory, provider_name="waterfall")
+    batch = [
+        {"first_name": "John", "last_name": "Doe", "company_domain": "example.com"},
+        {"first_name": "Jane", "last_name": "Roe", "company_domain": "example.com"},
+    ]
+
+    report = processor.process_batch(batch)
+
+    assert report["failed"] == []
+    assert calls == {"primary": [["John", "Jane"]], "secondary": [["Jane"]]}
+    assert factory.histograms["primary"].count == 1
+    assert factory.histograms["secondary"].count == 1
+
+    # Failing providers are skipped, but programming errors are not swallowed
+    class DownProvider(DataProvider):
+        def enrich_records(self, records):
+            raise ConnectionError("503 Service Unavailable")
+
+    class BuggyProvider(DataProvider):
+        def enrich_records(self, records):
+            raise TypeError("unsupported operand")
+
+    record = {"first_name": "John", "last_name": "Doe", "company_domain": "example.com"}
+    assert WaterfallProvider([DownProvider(), DataProvider()]).enrich_record(record)["professional_email"]
+    with pytest.raises(TypeError):
+        WaterfallProvider([BuggyProvider(), DataProvider()]).enrich_record(record)
+
+
+def test_hedged_provider_races_secondary_after_latency_percentile():
+    """
+    The secondary provider is only asked once the primary is slower than the
+    configured percentile of its observed latency, and the faster answer wins.
+    """
+    class SleepyProvider(DataProvider):
+        def __init__(self, name, delay):
+            self.name = name
+            self.delay = delay
+
+        def enrich_record(self, record):
+            time.sleep(self.delay)
+            return {**super().enrich_record(record), "source": self.name}
+
+    histogram = LatencyHistogram()
+    primary = SleepyProvider("primary", 0.0)
+    hedged = HedgedProvider(primary, SleepyProvider("secondary", 0.0), histogram, percentile=0.9, min_samples=10)
+    record = {"first_name": "John", "last_name": "Doe", "company_domain": "example.com"}
+
+    # Too few samples yet: never hedge
+    assert hedged.hedge_delay() is None
+    for _ in range(10):
+        histogram.observe(0.01)
+    assert 0.01 <= hedged.hedge_delay() < 0.02
+
+    assert hedged.enrich_record(record)["source"] == "primary"
+    assert hedged.stats == {"calls": 1, "hedged": 0, "secondary_wins": 0}
+
+    primary.delay = 0.5
+    assert hedged.enrich_record(record)["source"] == "secondary"
+    assert hedged.stats == {"calls": 2, "hedged": 1, "secondary_wins": 1}
+
+    # Chains share one bounded pool, and calls from concurrent threads are all counted
+    assert HedgedProvider(primary, primary, LatencyHistogram()).executor is hedged.executor
+    primary.delay = 0.0
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(hedged.enrich_record, [record] * 200))
+    assert hedged.stats["calls"] == 202
+
+
+def test_aws_clients_are_built_on_first_use_and_shared():
+    """
+    Components make no client when constructed, and share one client per
+    service with the pooled connection settings once used.
+    """
+    reader = S3RangeReader()
+    resolver = ClaimCheckResolver()
+    assert reader.s3_client._target is None
+
+    assert reader.s3_client.meta.service_model.service_name == "s3"
+    assert reader.s3_client._target is get_client("s3")
+    assert resolver.s3_client.meta.config.max_pool_connections == CLIENT_CONFIG.max_pool_connections
+    assert resolver.s3_client._target is reader.s3_client._target
@@ -15,6 +15,8 @@ module "sqs" {
   visibility_timeout   = 30
   message_retention    = 345600
   dlq_retention        = 604800
+  # Leaves room for batches waiting on an open circuit breaker
+  max_receive_count    = 5
 }
 
 module "lambda_split_batches" {
@@ -24,6 +26,10 @@ module "lambda_split_batches" {
   sqs_queue_url    = module.sqs.sqs_queue_url
   lambda_zip_path  = "../lambdas/deployment/split_batches.zip"
   max_batch_size   = 100
+  # The splitter reads its control table from DYNAMO_TABLE_NAME
+  dynamo_table_name = module.control_table.dynamo_table_name
+  # Dedupe indexes and oversized batches are stored next to the aggregated output
+  s3_bucket_name    = module.s3_aggregation_output.s3_aggregation_bucket_name
 }
 
 module "lambda_worker" {
@@ -34,6 +40,19 @@ module "lambda_worker" {
   sqs_queue_arn     = module.sqs.sqs_queue_arn
   lambda_zip_path   = "../lambdas/deployment/worker.zip"
   dynamo_table_name = module.dynamodb.dynamo_table_name
+  control_table_name = module.control_table.dynamo_table_name
+  # Each batch's output is written next to the aggregated file as soon as it is stored
+  s3_bucket_name    = module.s3_aggregation_output.s3_aggregation_bucket_name
+  environment_variables = {
+    ENRICHMENT_CACHE_TABLE = module.enrichment_cache_table.dynamo_table_name
+    # Records that fail enrichment are parked on their own queue
+    FAILED_RECORDS_QUEUE_URL = module.sqs.failed_records_queue_url
+    # Batches still rejected by the provider on their last delivery are parked rather than dead-lettered
+    MAX_RECEIVE_COUNT        = module.sqs.max_receive_count
+    WRITE_RESULT_PARTS       = "true"
+    # About 10 MB segments of 20 KB parts, copied by the aggregation with UploadPartCopy
+    RESULT_SEGMENT_BATCHES   = "512"
+  }
 }
 
 module "lambda_aggregation" {
@@ -44,6 +63,12 @@ module "lambda_aggregation" {
   sqs_queue_url    = module.sqs.sqs_queue_url
   dynamo_table_name = module.dynamodb.dynamo_table_name
   s3_bucket_name    = module.s3_aggregation_output.s3_aggregation_bucket_name
+  # Output format requested for each request
+  control_table_name = module.control_table.dynamo_table_name
+  environment_variables = {
+    # Stitch the result parts written by the workers instead of reading every record back
+    AGGREGATION_MODE = "parts"
+  }
 }
 
 module "lambda_check_completion" {
@@ -51,19 +76,53 @@ module "lambda_check_completion" {
   function_name    = "check_completion_lambda"
   role_arn         = module.iam.lambda_role_arn
   lambda_zip_path  = "../lambdas/deployment/check_completion.zip"
+  control_table_name = module.control_table.dynamo_table_name
+  # GET /status/{id} returns the URLs of the result parts already written
+  s3_bucket_name    = module.s3_aggregation_output.s3_aggregation_bucket_name
 }
 
 
 module "dynamodb" {
   source       = "./modules/dynamodb"
   table_name   = "EnrichedData"
-  hash_key     = "id"
+  # Records of a request are read back in order with range queries
+  hash_key         = "request_id"
+  sort_key_enabled = true
+  sort_key = {
+    name = "record_key"
+    type = "S"
+  }
   billing_mode = "PAY_PER_REQUEST"
   tags = {
     Environment = "dev"
   }
 }
 
+module "control_table" {
+  source       = "./modules/dynamodb"
+  table_name   = "ControlTable"
+  hash_key     = "request_id"
+  billing_mode = "PAY_PER_REQUEST"
+  # Per-batch completion markers expire once redeliveries are no longer possible
+  ttl_attribute_name    = "expires_at"
+  ttl_attribute_enabled = true
+  tags = {
+    Environment = "dev"
+  }
+}
+
+module "enrichment_cache_table" {
+  source                = "./modules/dynamodb"
+  table_name            = "EnrichmentCache"
+  hash_key              = "cache_key"
+  billing_mode          = "PAY_PER_REQUEST"
+  ttl_attribute_name    = "expires_at"
+  ttl_attribute_enabled = true
+  tags = {
+    Environment = "dev"
+  }
+}
+
 module "step_functions" {
   source                      = "./modules/step_functions"
   state_machine_name          = "DataProcessingStateMachine"
@@ -78,6 +137,12 @@ module "s3_aggregation_output" {
   source      = "./modules/s3_bucket"
   bucket_name = "data-enrichment-aggregated-output"
   acl         = "private"
+  # Oversized batches are only read while their request is in flight
+  expiring_prefixes = {
+    "claim-checks/" = 7
+    # Result parts are only read when their request is aggregated
+    "parts/"        = 7
+  }
   tags = {
     Environment = "dev"
   }
@@ -87,4 +152,5 @@ module "iam" {
   source         = "./modules/iam"
   role_name      = "lambda_execution_role"
   sqs_queue_arn  = module.sqs.sqs_queue_arn
+  failed_records_queue_arn = module.sqs.failed_records_queue_arn
 }
\ No newline at end of file
@@ -2,12 +2,29 @@ resource "aws_dynamodb_table" "this" {
   name         = var.table_name
   billing_mode = var.billing_mode
 
-  hash_key = var.hash_key
+  hash_key  = var.hash_key
+  range_key = var.sort_key_enabled ? var.sort_key.name : null
 
   attribute {
     name = var.hash_key
     type = var.hash_key_type
   }
 
+  dynamic "attribute" {
+    for_each = var.sort_key_enabled ? [var.sort_key] : []
+    content {
+      name = attribute.value.name
+      type = attribute.value.type
+    }
+  }
+
+  dynamic "ttl" {
+    for_each = var.ttl_attribute_enabled ? [1] : []
+    content {
+      attribute_name = var.ttl_attribute_name
+      enabled        = true
+    }
+  }
+
   tags = var.tags
 }
\ No newline at end of file
@@ -22,10 +22,20 @@ resource "aws_iam_policy" "lambda_policy" {
     Version = "2012-10-17"
     Statement = [
       {
-        Action   = ["sqs:SendMessage", "sqs:GetQueueAttributes", "sqs:GetQueueUrl"],
+        Action   = ["sqs:SendMessage", "sqs:GetQueueAttributes", "sqs:GetQueueUrl", "sqs:ChangeMessageVisibility"],
         Effect   = "Allow",
         Resource = var.sqs_queue_arn
       },
+      {
+        Action   = ["sqs:SendMessage"],
+        Effect   = "Allow",
+        Resource = var.failed_records_queue_arn
+      },
+      {
+        Action   = ["states:SendTaskSuccess", "states:SendTaskFailure"],
+        Effect   = "Allow",
+        Resource = "*"
+      },
       {
         Action   = ["logs:CreateLogGroup", "logs:CreateLogStream", "logs:PutLogEvents"],
         Effect   = "Allow",
@@ -6,4 +6,9 @@ variable "role_name" {
 variable "sqs_queue_arn" {
   type        = string
   description = "ARN of the SQS queue"
+}
+
+variable "failed_records_queue_arn" {
+  type        = string
+  description = "ARN of the SQS queue receiving failed records"
 }
\ No newline at end of file
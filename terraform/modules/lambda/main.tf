@@ -13,7 +13,9 @@ resource "aws_lambda_function" "this" {
       },
       var.sqs_queue_arn != null ? { SQS_QUEUE_ARN = var.sqs_queue_arn } : {},
       var.dynamo_table_name != null ? { DYNAMO_TABLE_NAME = var.dynamo_table_name } : {},
-      var.s3_bucket_name != null ? { S3_BUCKET_NAME = var.s3_bucket_name } : {}
+      var.s3_bucket_name != null ? { S3_BUCKET_NAME = var.s3_bucket_name } : {},
+      var.control_table_name != null ? { CONTROL_TABLE_NAME = var.control_table_name } : {},
+      var.environment_variables
     )
   }
 
@@ -28,4 +30,6 @@ resource "aws_lambda_event_source_mapping" "sqs_trigger" {
   function_name     = aws_lambda_function.this.arn
   batch_size        = 10   # Adjust batch size as needed
   enabled           = true
+  # The worker returns the ids of the failed messages; the others are deleted
+  function_response_types = ["ReportBatchItemFailures"]
 }
\ No newline at end of file
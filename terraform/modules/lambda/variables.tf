@@ -40,4 +40,16 @@ variable "sqs_queue_arn" {
   description = "The ARN of the SQS queue to trigger the worker Lambda."
   type        = string
   default     = null
+}
+
+variable "control_table_name" {
+  type        = string
+  default     = null
+  description = "Name of the DynamoDB control table tracking batch progress (optional)"
+}
+
+variable "environment_variables" {
+  type        = map(string)
+  default     = {}
+  description = "Additional environment variables for the Lambda"
 }
\ No newline at end of file
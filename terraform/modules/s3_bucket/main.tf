@@ -2,4 +2,25 @@ resource "aws_s3_bucket" "this" {
   bucket = var.bucket_name
 
   tags = var.tags
-}
\ No newline at end of file
+}
+
+resource "aws_s3_bucket_lifecycle_configuration" "this" {
+  count  = length(var.expiring_prefixes) > 0 ? 1 : 0
+  bucket = aws_s3_bucket.this.id
+
+  dynamic "rule" {
+    for_each = var.expiring_prefixes
+    content {
+      id     = "expire-${trimsuffix(rule.key, "/")}"
+      status = "Enabled"
+
+      filter {
+        prefix = rule.key
+      }
+
+      expiration {
+        days = rule.value
+      }
+    }
+  }
+}
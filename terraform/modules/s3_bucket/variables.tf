@@ -14,3 +14,10 @@ variable "tags" {
   default     = {}
   description = "Tags to assign to the bucket"
 }
+
+
+variable "expiring_prefixes" {
+  type        = map(number)
+  default     = {}
+  description = "Key prefixes whose objects expire, with their lifetime in days"
+}
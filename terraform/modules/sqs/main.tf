@@ -2,9 +2,23 @@ resource "aws_sqs_queue" "main_queue" {
   name                       = var.queue_name
   visibility_timeout_seconds = var.visibility_timeout
   message_retention_seconds  = var.message_retention
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.dlq.arn
+    maxReceiveCount     = var.max_receive_count
+  })
 }
 
 resource "aws_sqs_queue" "dlq" {
   name                       = "${var.queue_name}-dlq"
   message_retention_seconds  = var.dlq_retention
+}
+
+# Records that could not be enriched or saved; FIFO so a record sent again for a
+# redelivered batch is deduplicated on its request, batch and position
+resource "aws_sqs_queue" "failed_records" {
+  name                       = "${var.queue_name}-failed-records.fifo"
+  fifo_queue                 = true
+  deduplication_scope        = "messageGroup"
+  fifo_throughput_limit      = "perMessageGroupId"
+  message_retention_seconds  = var.dlq_retention
 }
\ No newline at end of file
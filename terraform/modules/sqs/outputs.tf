@@ -8,4 +8,20 @@ output "sqs_queue_arn" {
 
 output "sqs_dlq_url" {
   value = aws_sqs_queue.dlq.id
+}
+
+output "sqs_dlq_arn" {
+  value = aws_sqs_queue.dlq.arn
+}
+
+output "failed_records_queue_url" {
+  value = aws_sqs_queue.failed_records.id
+}
+
+output "failed_records_queue_arn" {
+  value = aws_sqs_queue.failed_records.arn
+}
+
+output "max_receive_count" {
+  value = var.max_receive_count
 }
\ No newline at end of file
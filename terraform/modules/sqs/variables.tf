@@ -20,3 +20,10 @@ variable "dlq_retention" {
   description = "The message retention period for the DLQ in seconds"
   default     = 604800  # 7 days
 }
+
+
+variable "max_receive_count" {
+  type        = number
+  description = "Deliveries of a message before it is moved to the DLQ"
+  default     = 3
+}
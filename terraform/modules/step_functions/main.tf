@@ -34,26 +34,19 @@ resource "aws_sfn_state_machine" "this" {
         "Next": "Wait for Completion"
       },
       "Wait for Completion": {
-        "Type": "Wait",
-        "Seconds": 10,
-        "Next": "Check Completion"
-      },
-      "Check Completion": {
         "Type": "Task",
-        "Resource": var.check_completion_lambda_arn,
-        "ResultPath": "$.completion_status",
-        "Next": "Aggregation Decision"
-      },
-      "Aggregation Decision": {
-        "Type": "Choice",
-        "Choices": [
-          {
-            "Variable": "$.completion_status",
-            "StringEquals": "completed",
-            "Next": "Run Aggregation"
+        "Comment": "Registers the task token; the worker that processes the last batch resumes the execution",
+        "Resource": "arn:aws:states:::lambda:invoke.waitForTaskToken",
+        "Parameters": {
+          "FunctionName": var.check_completion_lambda_arn,
+          "Payload": {
+            "request_id.$": "$.metadata.request_id",
+            "task_token.$": "$$.Task.Token"
           }
-        ],
-        "Default": "Wait for Completion"
+        },
+        "TimeoutSeconds": var.completion_timeout_seconds,
+        "ResultPath": "$.completion_status",
+        "Next": "Run Aggregation"
       },
       "Run Aggregation": {
         "Type": "Task",
@@ -22,3 +22,9 @@ variable "aggregation_lambda_arn" {
   type        = string
   description = "ARN of the aggregation Lambda"
 }
+
+variable "completion_timeout_seconds" {
+  type        = number
+  default     = 3600
+  description = "Maximum time to wait for every batch of a request to be processed"
+}